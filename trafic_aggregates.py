@@ -0,0 +1,215 @@
+# ============================
+# trafic_aggregates.py
+# ============================
+# Aggregate cube of the cleaned traffic data, kept up to date by trafic_processing_master.py.
+#
+# One row per channel x date x hour (local time, like the cleaned dataset) holding, for flow, speed
+# and occupancy: sum, count, min, max and sum of squares. These statistics merge by simple
+# addition/min/max, so the cube is updated incrementally from the new rows of each run, and
+# the analyses (hourly mean, weekday/weekend curves, top-N streets) are answered from a few
+# hundred thousand cube rows instead of scanning the whole dataset.
+#
+# Channels are identified by their integer channel_key (see the channel dimension table in
+# trafic_schema.py); the street names are only attached to the results.
+#
+# On disk, the cube is a folder of one file per date (cube-YYYYMMDD.parquet): a run only reads,
+# merges and rewrites the dates it adds rows to, however long the history is (see write_cube_days).
+
+import glob
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from trafic_schema import day_order, open_cleaned_dataset
+
+# --- Measures aggregated in the cube, and the statistics kept for each of them ---
+cube_measures = ['flow', 'speed', 'occupancy']
+cube_keys = ['channel_key', 'date', 'hour', 'day_of_week']
+
+# Statistic -> how two partial values of that statistic are merged
+_merge_functions = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max', 'sumsq': 'sum'}
+
+
+def build_cube(table):
+    """Aggregates a cleaned Arrow table (or DataFrame) into cube rows."""
+    if isinstance(table, pd.DataFrame):
+        table = pa.Table.from_pandas(table, preserve_index=False)
+    columns = {
+        'channel_key': table['channel_key'],
+        'date': table['timestamp'].cast(pa.date32()),  # date in the timestamps' time zone
+        'hour': table['hour'],
+        'day_of_week': table['day_of_week'],
+    }
+    aggregations = []
+    for measure in cube_measures:
+        values = table[measure].cast(pa.float64())
+        columns[measure] = values
+        columns[f"{measure}_sq"] = pc.multiply(values, values)
+        aggregations += [(measure, 'sum'), (measure, 'count'), (measure, 'min'), (measure, 'max'),
+                         (f"{measure}_sq", 'sum')]
+    grouped = pa.table(columns).group_by(cube_keys).aggregate(aggregations)
+    renames = {f"{measure}_sq_sum": f"{measure}_sumsq" for measure in cube_measures}
+    return grouped.rename_columns([renames.get(name, name) for name in grouped.column_names])
+
+
+def merge_cubes(cubes):
+    """Merges partial cubes (Arrow tables) covering possibly overlapping keys into one cube."""
+    cubes = [cube for cube in cubes if cube is not None and cube.num_rows > 0]
+    if not cubes:
+        return None
+    table = pa.concat_tables(cubes, promote_options='permissive')
+    if len(cubes) == 1:
+        return table
+    aggregations = [(f"{measure}_{stat}", function)
+                    for measure in cube_measures for stat, function in _merge_functions.items()]
+    merged = table.group_by(cube_keys).aggregate(aggregations)
+    # group_by names the results "<column>_<function>": restore the cube column names
+    renames = {f"{column}_{function}": column for column, function in aggregations}
+    return merged.rename_columns([renames.get(name, name) for name in merged.column_names])
+
+
+def build_cube_from_dataset(dataset_path, batch_rows=500_000):
+    """Builds the cube of a whole cleaned dataset, batch by batch (bounded memory)."""
+    dataset = open_cleaned_dataset(dataset_path)
+    columns = ['channel_key', 'timestamp', 'hour', 'day_of_week'] + cube_measures
+    cube = None
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_rows):
+        cube = merge_cubes([cube, build_cube(pa.Table.from_batches([batch]))])
+    return cube
+
+
+# ============================
+# Storage (one file per date)
+# ============================
+
+def cube_day_keys(cube):
+    """Per-row int32 day key YYYYMMDD of the cube rows (their date)."""
+    return pc.strftime(cube['date'], format='%Y%m%d').cast(pa.int32())
+
+
+def cube_day_path(cube_path, day_key):
+    """File of one date of a cube folder, e.g. <cube>/cube-20250519.parquet."""
+    return os.path.join(cube_path, f"cube-{day_key}.parquet")
+
+
+def read_cube(path, day_keys=None):
+    """
+    Reads the cube stored at path (folder of daily files, or the single file written by older
+    versions), only the dates of day_keys if given. Returns None if there is no cube row.
+    """
+    if not os.path.isdir(path):
+        table = pq.read_table(path)
+        if day_keys is not None:
+            table = table.filter(pc.is_in(cube_day_keys(table), pa.array(list(day_keys), pa.int32())))
+        return table
+    if day_keys is None:
+        files = sorted(glob.glob(os.path.join(glob.escape(path), 'cube-*.parquet')))
+    else:
+        files = [cube_day_path(path, day_key) for day_key in sorted(day_keys)]
+    tables = [pq.read_table(file) for file in files if os.path.exists(file)]
+    return pa.concat_tables(tables, promote_options='permissive') if tables else None
+
+
+def write_cube_days(cube, path, compression='zstd'):
+    """
+    Writes the cube into the folder path, one file per date (temporary file, then renamed).
+    Only the dates present in cube are replaced; the other files of the folder are left as they are.
+    cube can be None (no rows): the folder is only created.
+    """
+    os.makedirs(path, exist_ok=True)
+    if cube is None:
+        return
+    day_keys = cube_day_keys(cube)
+    for day_key in pc.unique(day_keys).to_pylist():
+        temp_path = os.path.join(path, f".cube-{day_key}.parquet.tmp")
+        pq.write_table(cube.filter(pc.equal(day_keys, day_key)), temp_path, compression=compression)
+        os.replace(temp_path, cube_day_path(path, day_key))
+
+
+# ============================
+# Queries (pandas)
+# ============================
+
+def cube_stats(cube, by, measure='flow'):
+    """
+    Statistics of measure grouped by the cube columns `by` (e.g. 'hour', ['is_weekend', 'hour'],
+    'channel_key'): count, sum, sumsq (sum of squares), mean, std, min and max, equal to the
+    same groupby on the full rows.
+    """
+    columns = [f"{measure}_{stat}" for stat in _merge_functions]
+    grouped = cube.groupby(by, observed=True)[columns].agg({f"{measure}_{stat}": function
+                                                            for stat, function in _merge_functions.items()})
+    count = grouped[f"{measure}_count"]
+    mean = grouped[f"{measure}_sum"] / count
+    # Sample variance from the sums, like pandas' std (ddof=1)
+    variance = (grouped[f"{measure}_sumsq"] - count * mean ** 2) / (count - 1)
+    return pd.DataFrame({
+        'count': count,
+        'sum': grouped[f"{measure}_sum"],
+        'sumsq': grouped[f"{measure}_sumsq"],
+        'mean': mean,
+        'std': np.sqrt(variance.clip(lower=0)),
+        'min': grouped[f"{measure}_min"],
+        'max': grouped[f"{measure}_max"],
+    })
+
+
+def cube_mean(cube, by, measure='flow'):
+    """Mean of measure grouped by `by`, answered from the cube (same as df.groupby(by)[measure].mean())."""
+    return cube_stats(cube, by, measure)['mean'].rename(measure)
+
+
+def top_channels(cube, measure='flow', n=10, ascending=False):
+    """
+    The n channels with the highest (ascending=False) or lowest average measure, indexed by
+    street name (grouped by channel_key, so two sensors sharing a name are not merged).
+    """
+    top = cube_mean(cube, ['channel_key', 'channel_name'], measure).sort_values(ascending=ascending).head(n)
+    return top.droplevel('channel_key')
+
+
+def day_of_week_mean(cube, measure='flow'):
+    """Mean of measure per day of week, indexed by the ordered day names (Monday first)."""
+    mean = cube_mean(cube, 'day_of_week', measure).reindex(range(len(day_order)))
+    mean.index = pd.CategoricalIndex(day_order, categories=day_order, ordered=True, name='day_of_week')
+    return mean
+
+
+def channel_weights(cube, measure='flow', statistic='mean', by_hour=False, by_day_of_week=False, hours=None):
+    """
+    One weighted point per channel (per channel and hour / day of week with by_hour /
+    by_day_of_week, e.g. the frames of an animated heatmap) for the heatmaps: the statistic
+    ('mean', 'sum', 'max', ...) of measure over the cube rows, optionally restricted to some
+    hours. Returns a DataFrame [day_of_week, ][hour, ]channel_key, <measure>.
+    """
+    if hours is not None:
+        cube = cube[cube['hour'].isin(hours)]
+    by = (['day_of_week'] if by_day_of_week else []) + (['hour'] if by_hour else []) + ['channel_key']
+    weights = cube_stats(cube, by, measure)[statistic].rename(measure)
+    return weights.reset_index()
+
+
+def channel_names(channels, channel_keys):
+    """
+    Street name of every channel_key (array indexing into the channel dimension DataFrame,
+    row i = channel_key i), as a Categorical.
+    """
+    names = pd.Categorical(channels['channel_name'])
+    codes = names.codes[np.asarray(channel_keys)]
+    return pd.Categorical.from_codes(codes, dtype=names.dtype)
+
+
+def cube_to_dataframe(table, channels=None):
+    """
+    Converts a cube table to pandas, adding is_weekend (derived from day_of_week) and, with the
+    channel dimension (DataFrame, row i = channel_key i), channel_name.
+    """
+    cube = table.to_pandas()
+    cube['is_weekend'] = cube['day_of_week'] >= 5
+    if channels is not None:
+        cube['channel_name'] = channel_names(channels, cube['channel_key'])
+    return cube
+
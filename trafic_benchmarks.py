@@ -0,0 +1,649 @@
+# ============================
+# trafic_benchmarks.py
+# ============================
+# Micro-benchmarks comparing the optimized processing steps with the original implementations.
+# Each benchmark also checks that both paths give the same result.
+#
+# Usage:
+#   python trafic_benchmarks.py geo [--rows N]
+#   python trafic_benchmarks.py schema [--rows N]
+#   python trafic_benchmarks.py density [--rows N]
+#   python trafic_benchmarks.py ipc [--rows N]
+#   python trafic_benchmarks.py channels [--rows N]
+#   python trafic_benchmarks.py timestamps [--rows N]   # on the raw archive if available (TRAFIC_RAW_DIR)
+#   python trafic_benchmarks.py reader [--rows N]       # idem
+#   python trafic_benchmarks.py dedupe [--rows N]
+#   python trafic_benchmarks.py modified [--rows N]   # runs trafic_processing_master.py on a synthetic archive
+#   python trafic_benchmarks.py metrics [--rows N]
+#   python trafic_benchmarks.py sketches [--rows N]
+#   python trafic_benchmarks.py series [--rows N]
+
+import argparse
+import os
+import subprocess
+import sys
+import matplotlib
+matplotlib.use('Agg')  # benchmarks draw off-screen
+import matplotlib.pyplot as plt
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import trafic_processing_master as master
+import trafic_sketches as sketches
+import view_parquet_metrics as metrics
+from trafic_aggregates import read_cube
+from trafic_data_access import get_series, raw_folder_path, series_columns
+from trafic_density import density_grid, iso_proportion_levels, plot_density
+from trafic_schema import (channel_dimension_path, cleaned_batch_schema, day_order, load_cleaned_data, local_timezone,
+                          read_cleaned_ipc)
+
+# --- Helper Function ---
+def timed(func, *args, repeat=3, **kwargs):
+    """Runs func `repeat` times and returns (best time in seconds, last result)."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def print_comparison(label, old_time, new_time):
+    print(f"   {label:<30} ancien: {old_time:8.3f}s | nouveau: {new_time:8.3f}s | x{old_time / new_time:,.1f}")
+
+# ============================
+# Benchmark: geo_point_2d parsing
+# ============================
+def make_geo_series(rows, seed=0):
+    """Synthetic geo_point_2d column, with ~1% of unparsable rows."""
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-1.65, -1.45, rows)
+    lat = rng.uniform(47.15, 47.30, rows)
+    values = pd.Series([f"{{'lon': {a!r}, 'lat': {b!r}}}" for a, b in zip(lon.tolist(), lat.tolist())], dtype=object)
+    values[rng.random(rows) < 0.01] = 'invalid'
+    values[rng.random(rows) < 0.01] = None
+    return values
+
+def parse_geo_literal_eval(geo_series):
+    """Original path: ast.literal_eval per row, then two .apply calls."""
+    coords_parsed = geo_series.apply(master.safe_literal_eval)
+    return pd.DataFrame({
+        'longitude': pd.to_numeric(coords_parsed.apply(master.extract_coord, key='lon')),
+        'latitude': pd.to_numeric(coords_parsed.apply(master.extract_coord, key='lat')),
+    })
+
+def benchmark_geo(rows):
+    print(f"\n📍 Parsing de geo_point_2d sur {rows} lignes...")
+    geo_series = make_geo_series(rows)
+    old_time, old_result = timed(parse_geo_literal_eval, geo_series)
+    new_time, new_result = timed(master.parse_geo_points, geo_series)
+    pd.testing.assert_frame_equal(old_result.astype('float64'), new_result)
+    print_comparison("literal_eval vs regex pyarrow", old_time, new_time)
+    print(f"   -> Résultats identiques ({int(new_result['longitude'].isna().sum())} lignes invalides -> NaN).")
+
+# ============================
+# Benchmark: mf1_hd timestamp parsing
+# ============================
+def load_raw_timestamps(folder_path):
+    """mf1_hd column of each raw snapshot of the archive, as strings (None if there is no archive)."""
+    if not os.path.isdir(folder_path):
+        return None
+    files = master.list_raw_files(folder_path)
+    if not files:
+        return None
+    return [pd.read_csv(file, usecols=['mf1_hd'], dtype={'mf1_hd': object})['mf1_hd'] for file in files]
+
+def make_raw_timestamps(rows, seed=0):
+    """
+    Synthetic mf1_hd columns (archiver format, ~1% of invalid values), in chunks of
+    master.chunk_rows rows spanning 30 minutes each.
+    """
+    rng = np.random.default_rng(seed)
+    chunks = []
+    for start in range(0, rows, master.chunk_rows):
+        size = min(master.chunk_rows, rows - start)
+        snapshot = pd.Timestamp('2025-01-01', tz='UTC') + pd.Timedelta(minutes=30 * len(chunks))
+        timestamps = snapshot + pd.to_timedelta(rng.integers(0, 30, size), unit='min')
+        values = pd.Series(timestamps.strftime('%Y-%m-%dT%H:%M:%S+00:00'), dtype=object)
+        values[rng.random(size) < 0.01] = 'invalid'
+        chunks.append(values)
+    return chunks
+
+def parse_timestamps_inferred(values):
+    """Original path: pd.to_datetime infers the format, then conversion to local time."""
+    return pd.to_datetime(values, errors='coerce').dt.tz_convert(local_timezone)
+
+def benchmark_timestamps(rows):
+    chunks = load_raw_timestamps(raw_folder_path)
+    source = f"{len(chunks) if chunks else 0} snapshots de {raw_folder_path}"
+    if chunks is None:
+        chunks = make_raw_timestamps(rows)
+        source = f"{len(chunks)} blocs synthétiques"
+    print(f"\n🕒 Parsing de mf1_hd sur {sum(len(chunk) for chunk in chunks)} lignes ({source}, bloc par bloc comme le pipeline)...")
+    old_time, old_result = timed(lambda: pd.concat([parse_timestamps_inferred(chunk) for chunk in chunks]))
+    new_time, new_result = timed(lambda: pd.concat([master.parse_timestamps(chunk) for chunk in chunks]))
+    pd.testing.assert_series_equal(old_result, new_result, check_names=False)
+    print_comparison("to_datetime vs strptime pyarrow", old_time, new_time)
+    print(f"   -> Résultats identiques ({int(new_result.isna().sum())} valeurs invalides -> NaT).")
+
+# ============================
+# Benchmark: CSV reader backends (pandas vs pyarrow.csv)
+# ============================
+def write_raw_snapshots(folder, rows, channels=800, seed=0):
+    """Synthetic raw snapshots in the archiver's layout (one file per 30 minutes), with a few invalid values."""
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-1.65, -1.45, channels)
+    lat = rng.uniform(47.15, 47.30, channels)
+    files = []
+    for index in range(max(rows // channels, 1)):
+        snapshot = pd.Timestamp('2025-05-19', tz='UTC') + pd.Timedelta(minutes=30 * index)
+        df = pd.DataFrame({
+            'cha_id': np.arange(channels),
+            'cha_lib': [f"Rue {i} P{i % 7}" for i in range(channels)],
+            'cha_long': rng.integers(50, 1500, channels),
+            'mf1_hd': snapshot.strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+            'mf1_debit': rng.integers(-1, 2000, channels).astype('float64'),
+            'mf1_taux': rng.integers(-1, 100, channels),
+            'mf1_vit': rng.integers(-1, 90, channels),
+            'tc1_temps': rng.integers(-1, 300, channels),
+            'couleur_tp': rng.integers(2, 7, channels),
+            'etat_trafic': rng.choice(['Fluide', 'Dense', 'Saturé', 'Bloqué', 'Indéterminé'], channels),
+            'geo_point_2d': [f"{{'lon': {a!r}, 'lat': {b!r}}}" for a, b in zip(lon.tolist(), lat.tolist())],
+        })
+        if index % 10 == 9:
+            df.loc[0, 'mf1_hd'] = 'invalid'  # exercises the pyarrow reader's fallback
+        path = os.path.join(folder, f"snapshot_{index:05d}.csv")
+        df.to_csv(path, index=False)
+        files.append(path)
+    return files
+
+def read_and_clean(files, reader):
+    """Every cleaned row and extracted coordinate of the files, with the given reader backend."""
+    results = list(master.iter_cleaned_batches(files, reader=reader))
+    errors = [error for _, _, _, _, error in results if error is not None]
+    if errors:
+        raise RuntimeError(f"{reader}: {errors[0]}")
+    table = pa.Table.from_batches([batch for _, _, batch, _, _ in results], schema=cleaned_batch_schema)
+    coords = pd.concat([coords for _, coords, _, _, _ in results if coords is not None and not coords.empty],
+                       ignore_index=True)
+    return table, coords
+
+def benchmark_reader(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        files = master.list_raw_files(raw_folder_path) if os.path.isdir(raw_folder_path) else []
+        source = f"{len(files)} snapshots de {raw_folder_path}"
+        if not files:
+            files = write_raw_snapshots(tmp, rows)
+            source = f"{len(files)} snapshots synthétiques"
+        print(f"\n📥 Lecture + nettoyage des CSV bruts ({source}): pandas vs pyarrow.csv...")
+        old_time, (old_table, old_coords) = timed(read_and_clean, files, 'pandas', repeat=2)
+        new_time, (new_table, new_coords) = timed(read_and_clean, files, 'pyarrow', repeat=2)
+    # Same rows, values and types (dictionary columns compared on their values)
+    assert old_table.schema.equals(new_table.schema)
+    strings = {name: pa.string() for name in ('channel_name', 'traffic_state')}
+    old_df, new_df = (table.cast(pa.schema([pa.field(f.name, strings.get(f.name, f.type)) for f in table.schema])).to_pandas()
+                      for table in (old_table, new_table))
+    pd.testing.assert_frame_equal(old_df, new_df)
+    pd.testing.assert_frame_equal(old_coords, new_coords)
+    print_comparison("pd.read_csv vs pyarrow.csv", old_time, new_time)
+    print(f"   -> Résultats identiques ({new_table.num_rows} lignes nettoyées, {len(new_coords)} coordonnées).")
+
+# ============================
+# Benchmark: compact cleaned schema
+# ============================
+def make_cleaned_table(rows, channels=800, seed=0):
+    """Synthetic cleaned rows in cleaned_batch_schema (one measurement per channel every 30 minutes)."""
+    rng = np.random.default_rng(seed)
+    channel_ids = np.arange(rows, dtype='int32') % channels
+    timestamps = pd.Timestamp('2025-05-19', tz=local_timezone) + pd.to_timedelta((np.arange(rows) // channels) * 30, unit='min')
+    df = pd.DataFrame({
+        'channel_id': channel_ids,
+        'channel_name': pd.Series([f"Rue {i} P{i % 7}" for i in range(channels)], dtype=object).to_numpy()[channel_ids],
+        'channel_length': rng.integers(50, 1500, channels, dtype='int32')[channel_ids],
+        'timestamp': timestamps,
+        'flow': rng.integers(0, 2000, rows).astype('float32'),
+        'occupancy': rng.integers(0, 100, rows).astype('float32'),
+        'speed': rng.integers(0, 90, rows).astype('float32'),
+        'travel_time': rng.integers(0, 300, rows).astype('float32'),
+        'color_code': rng.integers(2, 7, rows).astype('int8'),
+        'traffic_state': rng.choice(['Fluide', 'Dense', 'Saturé', 'Bloqué', 'Indéterminé'], rows),
+        'hour': timestamps.hour.astype('int8'),
+        'day_of_week': timestamps.dayofweek.astype('int8'),
+    })
+    df['is_weekend'] = df['day_of_week'] >= 5
+    return pa.Table.from_pandas(df, schema=cleaned_batch_schema, preserve_index=False)
+
+def to_legacy_table(table):
+    """The previous layout: object strings, int64/float64 measures and day names."""
+    day_names = pc.take(pa.array(day_order), table['day_of_week'])
+    legacy = {}
+    for field in table.schema:
+        column = table[field.name]
+        if field.name == 'day_of_week':
+            column = day_names
+        elif pa.types.is_dictionary(field.type):
+            column = column.cast(pa.string())
+        elif pa.types.is_floating(field.type):
+            column = column.cast(pa.float64())
+        elif pa.types.is_integer(field.type):
+            column = column.cast(pa.int32() if field.name == 'hour' else pa.int64())
+        legacy[field.name] = column
+    return pa.table(legacy)
+
+def benchmark_schema(rows):
+    print(f"\n🗜️ Schéma compact vs ancien schéma sur {rows} lignes...")
+    compact = make_cleaned_table(rows)
+    legacy = to_legacy_table(compact)
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label, table, compression, loader in [
+            ('ancien', legacy, 'snappy', lambda path: pd.read_parquet(path, engine='pyarrow')),
+            ('nouveau', compact, master.parquet_compression, load_cleaned_data),
+        ]:
+            path = os.path.join(tmp, f"{label}.parquet")
+            pq.write_table(table, path, compression=compression)
+            load_time, df = timed(loader, path)
+            results[label] = (os.path.getsize(path), load_time, df.memory_usage(deep=True).sum())
+    for label, (size, load_time, memory) in results.items():
+        print(f"   {label:<8} fichier: {size / 1e6:8.2f} MB | chargement: {load_time:6.3f}s | mémoire pandas: {memory / 1e6:8.1f} MB")
+    (old_size, old_time, old_memory), (new_size, new_time, new_memory) = results['ancien'], results['nouveau']
+    print(f"   -> fichier x{old_size / new_size:.1f} plus petit, chargement x{old_time / new_time:.1f} plus rapide, mémoire x{old_memory / new_memory:.1f} plus faible.")
+
+# ============================
+# Benchmark: deduplication of the repeated measurements
+# ============================
+def make_repeated_snapshots(rows, channels=800, repeat_rate=0.6, seed=0):
+    """
+    Synthetic cleaned snapshots (one per 30 minutes) where each channel repeats its previous
+    measurement (same timestamp and values) with probability repeat_rate, like the archiver's polls.
+    """
+    rng = np.random.default_rng(seed)
+    snapshots = max(rows // channels, 1)
+    table = make_cleaned_table(snapshots * channels, channels, seed)
+    index = np.arange(snapshots * channels).reshape(snapshots, channels)
+    new_measurement = rng.random((snapshots, channels)) >= repeat_rate
+    new_measurement[0] = True
+    # Row of the latest new measurement of each channel, at every snapshot
+    source = np.maximum.accumulate(np.where(new_measurement, index, 0), axis=0).ravel()
+    return table.take(pa.array(source)), channels
+
+def dedupe_streamed(batches, dimension):
+    """New path: snapshot by snapshot, against the per-channel last timestamp (ChannelDimension.drop_seen)."""
+    dimension._last_seen[:] = dimension._unseen  # nothing ingested yet
+    return pa.Table.from_batches([dimension.drop_seen(batch)[0] for batch in batches]).to_pandas()
+
+def dedupe_in_memory(batches):
+    """Reference: drop_duplicates on the whole table, which has to be held in memory."""
+    return pa.Table.from_batches(batches).to_pandas().drop_duplicates(subset=['channel_key', 'timestamp'],
+                                                                      ignore_index=True)
+
+def benchmark_dedupe(rows):
+    table, channels = make_repeated_snapshots(rows)
+    print(f"\n🧹 Dédoublonnage (canal, horodatage) sur {table.num_rows} lignes ({table.num_rows // channels} snapshots)...")
+    dimension = master.ChannelDimension()
+    batches = [dimension.encode(batch) for batch in table.to_batches(max_chunksize=channels)]
+    old_time, old_df = timed(dedupe_in_memory, batches)
+    new_time, new_df = timed(dedupe_streamed, batches, dimension)
+    pd.testing.assert_frame_equal(old_df, new_df)
+    print_comparison("drop_duplicates vs streaming", old_time, new_time)
+    print(f"   -> Résultats identiques ({len(new_df)} mesures uniques, {table.num_rows - len(new_df)} répétitions supprimées);"
+          f" état conservé entre deux snapshots: {channels} horodatages au lieu de toute la table.")
+
+# ============================
+# Check: modified snapshot (incremental run vs full rebuild)
+# ============================
+def write_repeating_snapshots(folder, rows, channels=800, seed=0):
+    """
+    Synthetic raw snapshots (write_raw_snapshots) where every other snapshot repeats the previous
+    measurement time of half the channels with other values, as the archiver does between two
+    updates of mf1_hd. The channel lengths are the same in every snapshot.
+    """
+    files = write_raw_snapshots(folder, rows, channels, seed)
+    lengths = pd.read_csv(files[0])['cha_long']
+    for index, file in enumerate(files):
+        df = pd.read_csv(file)
+        df['cha_long'] = lengths
+        if index % 2:
+            repeated = df['cha_id'] % 2 == 0
+            df.loc[repeated, 'mf1_hd'] = pd.read_csv(files[index - 1])['mf1_hd'][repeated]
+        df.to_csv(file, index=False)
+    return files
+
+def run_master(raw_folder, results_folder, *options):
+    """Runs trafic_processing_master.py on another archive/results folder; returns its duration in seconds."""
+    env = dict(os.environ, TRAFIC_RAW_DIR=raw_folder, TRAFIC_RESULTS_DIR=results_folder, MPLBACKEND='Agg')
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, os.path.abspath(master.__file__), *options], env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+def load_results(results_folder):
+    """Cleaned rows (with channel names) and cube of a results folder, in a stable order."""
+    channels = pd.read_parquet(os.path.join(results_folder, 'channels.parquet'), columns=['channel_key', 'channel_name'])
+    data = load_cleaned_data(os.path.join(results_folder, 'cleaned_traffic_data.parquet')).drop(columns='channel_key')
+    data = data.astype({'channel_name': str}).sort_values(['channel_name', 'timestamp']).reset_index(drop=True)
+    cube = read_cube(os.path.join(results_folder, 'aggregate_cube.parquet')).to_pandas()
+    cube = cube.merge(channels, on='channel_key').drop(columns='channel_key').astype({'channel_name': str})
+    keys = ['channel_name', 'date', 'hour', 'day_of_week']
+    return data, cube[keys + [name for name in cube.columns if name not in keys]].sort_values(keys).reset_index(drop=True)
+
+def benchmark_modified(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        raw, incremental, rebuilt = (os.path.join(tmp, name) for name in ('raw', 'incremental', 'rebuilt'))
+        os.makedirs(raw)
+        files = write_repeating_snapshots(raw, rows)
+        print(f"\n✏️ Snapshot modifié après ingestion ({len(files)} snapshots synthétiques): incrémental vs reconstruction...")
+        run_master(raw, incremental)
+        # Edit one measurement that the snapshot only repeats, and one it supplies first
+        modified = files[len(files) // 2 | 1]
+        df = pd.read_csv(modified)
+        df.loc[[0, 1], 'mf1_debit'] = df.loc[[0, 1], 'mf1_debit'] + 1
+        df.to_csv(modified, index=False)
+        incremental_time = run_master(raw, incremental, '--incremental')
+        rebuild_time = run_master(raw, rebuilt)
+        data, cube = load_results(incremental)
+        expected_data, expected_cube = load_results(rebuilt)
+    pd.testing.assert_frame_equal(data, expected_data, check_categorical=False)
+    pd.testing.assert_frame_equal(cube, expected_cube, check_exact=False)
+    print_comparison("reconstruction vs incrémental", rebuild_time, incremental_time)
+    print(f"   -> Résultats identiques ({len(data)} mesures, {len(cube)} lignes de cube): les données ne dépendent"
+          " que de l'archive, pas de l'ordre des exécutions.")
+
+# ============================
+# Benchmark: view_parquet_metrics (pandas load vs footers / streamed row groups)
+# ============================
+def pandas_metrics(path):
+    """Original path: the whole file loaded with pandas, then nulls, min/max, distinct counts, quartiles."""
+    df = pd.read_parquet(path)
+    numeric = df.select_dtypes(include=np.number)
+    ordered = df.select_dtypes(exclude='category')
+    return (df.isnull().sum(), ordered.min(), ordered.max(), df.nunique(),
+            numeric.quantile([0.25, 0.5, 0.75]).T)
+
+def benchmark_metrics(rows):
+    print(f"\n📏 Métriques Parquet sur {rows} lignes (chargement pandas vs pieds de page / row groups)...")
+    table = make_cleaned_table(rows)
+    missing = pc.equal(pc.bit_wise_and(pa.array(np.arange(rows)), 63), 0)  # a few nulls
+    table = table.set_column(table.schema.get_field_index('travel_time'), 'travel_time',
+                             pc.if_else(missing, pa.scalar(None, pa.float32()), table['travel_time']))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cleaned.parquet')
+        pq.write_table(table, path, row_group_size=master.partition_row_group_rows,
+                       compression=master.parquet_compression)
+        old_time, (nulls, low, high, distinct, quartiles) = timed(pandas_metrics, path, repeat=1)
+        footer_time, (footer_rows, _, footer) = timed(metrics.footer_metrics, [path])
+        exact_time, exact = timed(metrics.exact_metrics, [path], repeat=1)
+    assert footer_rows == rows
+    pd.testing.assert_series_equal(footer['Nulls'].astype('int64'), nulls, check_names=False)
+    for column in low.index:
+        assert footer.loc[column, 'Min'] == low[column] and footer.loc[column, 'Max'] == high[column], column
+    pd.testing.assert_series_equal(exact['Distinct'], distinct, check_names=False)
+    quartiles.columns = ['25%', '50%', '75%']
+    pd.testing.assert_frame_equal(exact.loc[quartiles.index, quartiles.columns], quartiles, check_dtype=False)
+    print_comparison("nulls + min/max (pieds de page)", old_time, footer_time)
+    print_comparison("+ distincts/quartiles exacts", old_time, exact_time)
+    print("   -> Résultats identiques.")
+
+# ============================
+# Benchmark: streaming sketches vs exact pandas statistics
+# ============================
+def exact_channel_statistics(files, measure, quantiles):
+    """Original path: every file loaded with pandas, then groupby mean/std/quantiles and nunique."""
+    df = pd.concat([pd.read_parquet(file) for file in files], ignore_index=True)
+    grouped = df[measure].astype('float64').groupby(df['channel_key'])  # the sketches accumulate in float64
+    summary = grouped.agg(['count', 'mean', 'std']).join(grouped.quantile(list(quantiles)).unstack())
+    return summary, df.nunique(), df.memory_usage(deep=True).sum()
+
+def sketch_nbytes(sketch):
+    """Memory of the arrays of a TableSketch (HyperLogLog registers, moments, t-digest centroids)."""
+    parts = [sketch['distinct'].registers for sketch in sketch.columns.values()]
+    for column in sketch.columns.values():
+        if column['moments'] is not None:
+            parts += [column['moments'].count, column['moments'].mean, column['moments'].m2]
+            parts += [column['digest'].groups, column['digest'].means, column['digest'].weights]
+    for moments, digest in sketch.channels.values():
+        parts += [moments.count, moments.mean, moments.m2, digest.groups, digest.means, digest.weights]
+    return sum(array.nbytes for array in parts)
+
+def rank_error(df, measure, estimates, quantiles):
+    """Largest distance between q and the rank (fraction of the channel's values) of the estimated q-quantile."""
+    values = df.sort_values(['channel_key', measure])
+    keys = values['channel_key'].to_numpy()
+    scale = float(values[measure].max()) + 1.0
+    combined = keys * scale + values[measure].to_numpy()
+    starts = np.searchsorted(keys, estimates.index.to_numpy())
+    counts = estimates['count'].to_numpy()
+    error = 0.0
+    for i, q in enumerate(quantiles):
+        target = estimates.index.to_numpy() * scale + estimates.iloc[:, 4 + i].to_numpy()
+        low = (np.searchsorted(combined, target, side='left') - starts) / counts
+        high = (np.searchsorted(combined, target, side='right') - starts) / counts
+        error = max(error, float(np.max(np.maximum(0, np.maximum(low - q, q - high)))))
+    return error
+
+def benchmark_sketches(rows, partitions=8):
+    print(f"\n📐 Statistiques par canal et par colonne sur {rows} lignes en {partitions} partitions (pandas exact vs sketches fusionnés)...")
+    table = make_cleaned_table(rows).rename_columns(['channel_key'] + make_cleaned_table(1).column_names[1:])
+    # Continuous skewed speeds: the rank error then measures the digest, not the ties of integer values
+    speed = np.random.default_rng(0).gamma(4, 11, rows).astype('float32')
+    table = table.set_column(table.schema.get_field_index('speed'), 'speed', pa.array(speed))
+    quantiles = sketches.default_quantiles
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for index, offset in enumerate(range(0, rows, -(-rows // partitions))):
+            files.append(os.path.join(tmp, f"part-{index}.parquet"))
+            pq.write_table(table.slice(offset, -(-rows // partitions)), files[-1],
+                           row_group_size=master.partition_row_group_rows, compression=master.parquet_compression)
+        old_time, (exact, distinct, table_bytes) = timed(exact_channel_statistics, files, 'speed', quantiles, repeat=1)
+        new_time, sketch = timed(sketches.sketch_files, files, channel_measures=['speed'], repeat=1)
+    estimates = sketch.channel_summary('speed', quantiles)
+    assert (estimates['count'].to_numpy() == exact['count'].to_numpy()).all()
+    np.testing.assert_allclose(estimates['mean'], exact['mean'], rtol=1e-9)
+    np.testing.assert_allclose(estimates['std'], exact['std'], rtol=1e-9)
+    error = rank_error(table.select(['channel_key', 'speed']).to_pandas(), 'speed', estimates, quantiles)
+    # t-digest bound (trafic_sketches): pi/compression, plus 1/n for pandas' interpolation between ranks
+    assert error <= np.pi / sketches.digest_compression + 1 / estimates['count'].min(), error
+    value_error = float(np.max(np.abs(estimates.iloc[:, 4:4 + len(quantiles)].to_numpy()
+                                      - exact[list(quantiles)].to_numpy())))
+    approximate = sketch.column_summary()['Distinct (approx.)']
+    distinct_error = float(np.max(np.abs(approximate[distinct.index] / distinct - 1)))
+    assert distinct_error <= 4 * 1.04 / np.sqrt(2 ** sketches.hll_precision), distinct_error
+    print_comparison("groupby/quantile vs sketches", old_time, new_time)
+    print(f"   mémoire: table pandas {table_bytes / 1e6:.0f} MB | sketches {sketch_nbytes(sketch) / 1e6:.1f} MB"
+          " (ne croît pas avec le nombre de lignes)")
+    print(f"   -> Moyennes/écarts-types identiques; erreur de rang max des percentiles {', '.join(f'p{q * 100:g}' for q in quantiles)}:"
+          f" {error:.2%} ({value_error:.2f} km/h); erreur max des comptes distincts: {distinct_error:.2%}.")
+
+# ============================
+# Benchmark: Parquet vs memory-mapped Arrow IPC
+# ============================
+def benchmark_ipc(rows):
+    print(f"\n🗺️ Parquet vs Arrow IPC mappé en mémoire sur {rows} lignes...")
+    table = make_cleaned_table(rows)
+    columns = ['hour', 'day_of_week', 'is_weekend', 'flow']
+    with tempfile.TemporaryDirectory() as tmp:
+        parquet_path = os.path.join(tmp, 'cleaned.parquet')
+        ipc_path = os.path.join(tmp, 'cleaned.arrow')
+        pq.write_table(table, parquet_path, compression=master.parquet_compression)
+        with pa.OSFile(ipc_path, 'wb') as sink, pa.ipc.new_file(sink, cleaned_batch_schema) as writer:
+            writer.write_table(table)
+        print(f"   fichiers: Parquet {os.path.getsize(parquet_path) / 1e6:.1f} MB | IPC {os.path.getsize(ipc_path) / 1e6:.1f} MB (non compressé)")
+        # Opening: decode every column vs map the file
+        old_time, _ = timed(pq.read_table, parquet_path)
+        new_time, _ = timed(read_cleaned_ipc, ipc_path)
+        print_comparison("ouverture Arrow (table)", old_time, new_time)
+        for label, kwargs in [("DataFrame complet", {}), ("DataFrame, 4 colonnes", {'columns': columns})]:
+            old_time, old_df = timed(load_cleaned_data, parquet_path, **kwargs)
+            new_time, new_df = timed(load_cleaned_data, ipc_path, **kwargs)
+            pd.testing.assert_frame_equal(old_df, new_df)
+            print_comparison(label, old_time, new_time)
+    print("   -> Résultats identiques.")
+
+# ============================
+# Benchmark: time series of one channel (full load / dataset filter vs channel index)
+# ============================
+def write_partitioned_dataset(table, path):
+    """Writes cleaned rows like the processing script: sorted day partitions, channel index and dimension."""
+    dimension = master.ChannelDimension()
+    writer = master.CleanedDataWriter(path, 'benchmark')
+    for batch in table.to_batches(max_chunksize=master.row_group_rows):
+        writer.write_batch(dimension.encode(batch))
+    writer.close()
+    master.update_channel_index(path, writer.touched_partitions)
+    dimension.save(channel_dimension_path(path))
+
+def series_full_load(path, name, start, end):
+    """Original path: the whole dataset loaded, then filtered on channel_name and the time range."""
+    df = load_cleaned_data(path, ['channel_name'] + series_columns)
+    mask = ((df['channel_name'] == name) & (df['timestamp'] >= pd.Timestamp(start, tz=local_timezone))
+            & (df['timestamp'] < pd.Timestamp(end, tz=local_timezone)))
+    return df.loc[mask, series_columns].sort_values('timestamp', ignore_index=True)
+
+def series_filtered(path, name, start, end):
+    """Dataset filter: partition pruning on the days, row-group statistics on channel_key."""
+    return load_cleaned_data(path, series_columns, start, end, [name]).sort_values('timestamp', ignore_index=True)
+
+def benchmark_series(rows, channels=800):
+    print(f"\n📈 Série temporelle d'un canal sur un mois (chargement complet / filtre vs index des canaux)...")
+    name = "Rue 123 P4"
+    start, end = '2025-05-29', '2025-06-28'
+    for size in (rows, rows * 4):
+        table = make_cleaned_table(size, channels)
+        days = size // channels // 48
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cleaned_traffic_data.parquet')
+            write_partitioned_dataset(table, path)
+            old_time, old_df = timed(series_full_load, path, name, start, end, repeat=1)
+            filter_time, filter_df = timed(series_filtered, path, name, start, end)
+            new_time, new_df = timed(get_series, name, start, end, path=path)
+        pd.testing.assert_frame_equal(old_df, new_df)
+        pd.testing.assert_frame_equal(filter_df, new_df)
+        print(f"   {size} lignes ({days} jours, {channels} canaux), {len(new_df)} mesures renvoyées:")
+        print_comparison("chargement complet vs index", old_time, new_time)
+        print_comparison("filtre du dataset vs index", filter_time, new_time)
+    print("   -> Résultats identiques; le temps de lecture par l'index ne dépend que de la période demandée.")
+
+# ============================
+# Benchmark: channel_name strings vs channel_key integers
+# ============================
+def mean_per_name(df, coordinates):
+    """Original path: groupby on the street names, then merge of the coordinates on the names."""
+    mean = df.groupby('channel_name')['flow'].mean().reset_index()
+    return pd.merge(mean, coordinates, on='channel_name', how='left')
+
+def mean_per_key(df, channels):
+    """New path: groupby on the integer key, then coordinates by array indexing (row = key)."""
+    mean = df.groupby('channel_key')['flow'].mean().reset_index()
+    keys = mean['channel_key'].to_numpy()
+    return mean.assign(channel_name=channels['channel_name'].to_numpy()[keys],
+                       longitude=channels['longitude'].to_numpy()[keys],
+                       latitude=channels['latitude'].to_numpy()[keys])
+
+def benchmark_channels(rows, channels=800, seed=0):
+    print(f"\n🔑 Moyenne par canal + coordonnées sur {rows} lignes (noms vs clés entières)...")
+    rng = np.random.default_rng(seed)
+    dimension = pd.DataFrame({'channel_name': [f"Rue {i} P{i % 7}" for i in range(channels)],
+                              'longitude': rng.uniform(-1.65, -1.45, channels),
+                              'latitude': rng.uniform(47.15, 47.30, channels)})
+    keys = rng.integers(0, channels, rows).astype('int32')
+    flow = rng.integers(0, 2000, rows).astype('float32')
+    by_name = pd.DataFrame({'channel_name': dimension['channel_name'].to_numpy()[keys], 'flow': flow})
+    by_key = pd.DataFrame({'channel_key': keys, 'flow': flow})
+    old_time, old_result = timed(mean_per_name, by_name, dimension)
+    new_time, new_result = timed(mean_per_key, by_key, dimension)
+    print_comparison("groupby + jointure", old_time, new_time)
+    new_result = new_result.sort_values('channel_name', ignore_index=True)
+    pd.testing.assert_frame_equal(old_result, new_result[old_result.columns])
+    print(f"   -> Résultats identiques ({len(new_result)} canaux).")
+
+# ============================
+# Benchmark: density heatmap (kdeplot vs binning + FFT)
+# ============================
+def make_heatmap_rows(rows, channels=800, seed=0):
+    """Synthetic merged heatmap rows: fixed sensor positions around Nantes, random flows."""
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-1.65, -1.45, channels)
+    lat = rng.uniform(47.15, 47.30, channels)
+    channel = rng.integers(0, channels, rows)
+    return pd.DataFrame({'channel_name': channel, 'longitude': lon[channel], 'latitude': lat[channel],
+                         'flow': rng.integers(0, 2000, rows).astype('float64')})
+
+def plot_kdeplot(df):
+    """Original path: seaborn kdeplot over every row."""
+    import seaborn as sns
+    fig, ax = plt.subplots()
+    sns.kdeplot(x=df['longitude'], y=df['latitude'], weights=df['flow'], cmap="Reds",
+                fill=True, thresh=0, levels=50, bw_adjust=0.2, ax=ax)
+    plt.close(fig)
+
+def density_from_rows(df):
+    """New path: one point per channel (sum, sum of squares and count of the flows), then FFT density."""
+    points = df.assign(flow_sq=df['flow'] ** 2).groupby('channel_name').agg(
+        longitude=('longitude', 'first'), latitude=('latitude', 'first'),
+        flow=('flow', 'sum'), flow_sq=('flow_sq', 'sum'), count=('flow', 'size'))
+    return density_grid(points['longitude'], points['latitude'], points['flow'], points['flow_sq'],
+                        points['count'], bw_adjust=0.2)
+
+def plot_density_grid(df):
+    fig, ax = plt.subplots()
+    plot_density(ax, *density_from_rows(df), levels=50, thresh=0, cmap="Reds")
+    plt.close(fig)
+
+def benchmark_density(rows):
+    print(f"\n🔥 Heatmap de densité sur {rows} lignes...")
+    df = make_heatmap_rows(rows)
+    old_time, _ = timed(plot_kdeplot, df, repeat=1)
+    new_time, _ = timed(plot_density_grid, df)
+    print_comparison("kdeplot vs binning + FFT", old_time, new_time)
+    # Same estimate as the kdeplot: compare with seaborn's KDE evaluated on the rows
+    from seaborn._statistics import KDE
+    reference, (x_support, y_support) = KDE(bw_adjust=0.2)(df['longitude'], df['latitude'], weights=df['flow'])
+    x_grid, y_grid, density = density_from_rows(df)
+    assert np.allclose(x_grid, x_support) and np.allclose(y_grid, y_support)
+    error = np.abs(density - reference).max() / reference.max()
+    level_error = np.abs(iso_proportion_levels(density) - iso_proportion_levels(reference)).max() / reference.max()
+    print(f"   -> Même grille; écart max de densité: {error:.2%}, des niveaux de contour: {level_error:.2%} (du maximum).")
+
+# ============================
+# Main
+# ============================
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks des étapes de traitement du trafic.")
+    parser.add_argument('benchmark', choices=['geo', 'timestamps', 'reader', 'dedupe', 'modified', 'metrics', 'sketches', 'series', 'schema', 'ipc', 'channels', 'density', 'all'], help="Benchmark à lancer.")
+    parser.add_argument('--rows', type=int, default=500_000, help="Nombre de lignes synthétiques.")
+    args = parser.parse_args()
+
+    if args.benchmark in ('geo', 'all'):
+        benchmark_geo(args.rows)
+    if args.benchmark in ('timestamps', 'all'):
+        benchmark_timestamps(args.rows * 4)
+    if args.benchmark in ('reader', 'all'):
+        benchmark_reader(args.rows // 5)
+    if args.benchmark in ('dedupe', 'all'):
+        benchmark_dedupe(args.rows * 2)
+    if args.benchmark in ('modified', 'all'):
+        benchmark_modified(args.rows // 50)
+    if args.benchmark in ('metrics', 'all'):
+        benchmark_metrics(args.rows * 10)
+    if args.benchmark in ('sketches', 'all'):
+        benchmark_sketches(args.rows * 4)
+    if args.benchmark in ('series', 'all'):
+        benchmark_series(args.rows * 2)
+    if args.benchmark in ('schema', 'all'):
+        benchmark_schema(args.rows * 10)
+    if args.benchmark in ('ipc', 'all'):
+        benchmark_ipc(args.rows * 10)
+    if args.benchmark in ('channels', 'all'):
+        benchmark_channels(args.rows * 10)
+    if args.benchmark in ('density', 'all'):
+        # kdeplot costs (rows x grid points): keep its share of the run reasonable
+        benchmark_density(args.rows // 25)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# ============================
+# trafic_data_access.py
+# ============================
+# Shared data-access layer for the processing and analysis scripts:
+#   - one place for the input/output paths (overridable with environment variables),
+#   - column projection and time/channel filters when loading the cleaned dataset,
+#   - the channel dimension table (name, length and coordinates of every channel_key) and the
+#     attachment of these attributes to per-channel results, used by the heatmaps,
+#   - the aggregate cube (trafic_aggregates.py) answering the temporal/spatial statistics,
+#   - the time series of one channel, read through the channel index of the dataset (get_series),
+#   - an in-process cache, so several analyses run in one session read the data once.
+#
+# Environment variables:
+#   TRAFIC_RAW_DIR      folder of the raw CSV snapshots written by the archiver
+#   TRAFIC_RESULTS_DIR  folder of the generated Parquet files and plots (default: ./results)
+
+import os
+import sys
+import pandas as pd
+
+from trafic_aggregates import build_cube_from_dataset, channel_names, cube_to_dataframe, read_cube
+from trafic_schema import (channel_dimension_path, cleaned_table_to_dataframe, has_cleaned_schema, load_cleaned_data,
+                          read_channel_dimension, read_channel_series, resolve_channel_keys)
+
+# ============================
+# Configuration
+# ============================
+raw_folder_path = os.environ.get('TRAFIC_RAW_DIR', r"C:\Users\thelo\Documents\LS2N\nantes_traffic_archiver\archive")
+results_dir = os.environ.get('TRAFIC_RESULTS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results'))
+
+coordinate_mapping_path = os.path.join(results_dir, 'master_coordinate_mapping.parquet')
+cleaned_data_path = os.path.join(results_dir, 'cleaned_traffic_data.parquet')
+# Channel dimension: one row per channel_key (channel_id, name, length, longitude, latitude)
+channels_path = channel_dimension_path(cleaned_data_path)
+manifest_path = os.path.join(results_dir, 'processed_files_manifest.parquet')
+# Aggregate cube: folder of one file per date (see trafic_aggregates.py)
+aggregate_cube_path = os.path.join(results_dir, 'aggregate_cube.parquet')
+# Optional uncompressed Arrow IPC copy of the cleaned data (trafic_processing_master.py --arrow-ipc)
+cleaned_ipc_path = os.path.join(results_dir, 'cleaned_traffic_data.arrow')
+# State of an interrupted processing run, resumed by the next one (trafic_processing_master.py)
+checkpoint_dir = os.path.join(results_dir, 'processing_checkpoint')
+
+# --- Column sets used by the analyses (only these are decoded) ---
+temporal_columns = ['hour', 'day_of_week', 'is_weekend', 'flow']
+spatial_columns = ['channel_key', 'flow', 'speed']
+heatmap_columns = ['channel_key', 'flow']
+series_columns = ['timestamp', 'flow', 'occupancy', 'speed', 'travel_time']
+
+# Cache: (path, filters) -> DataFrame holding every column loaded so far for these filters
+_cleaned_cache = {}
+_channels_cache = {}
+_cube_cache = {}
+
+# ============================
+# Helper Functions
+# ============================
+
+def require_file(path, description):
+    """Exits with the usual message if an input file produced by the processing script is missing."""
+    if not os.path.exists(path):
+        print(f"❌ Error: {description} not found at {path}")
+        print("   Please run the 'trafic_processing_master.py' script first.")
+        sys.exit(1)
+
+
+def clear_cache():
+    """Forgets every cached DataFrame (e.g. after the processing script updated the dataset)."""
+    _cleaned_cache.clear()
+    _channels_cache.clear()
+    _cube_cache.clear()
+
+
+def cleaned_source():
+    """
+    The Arrow IPC copy of the cleaned data if the processing script wrote one (memory-mapped:
+    instant load, one page-cache copy shared by every process), else the Parquet dataset.
+    """
+    return cleaned_ipc_path if os.path.exists(cleaned_ipc_path) else cleaned_data_path
+
+
+def load_cleaned(columns=None, start=None, end=None, channels=None, path=None, cache=True):
+    """
+    Loads the cleaned dataset (see trafic_schema.load_cleaned_data for the filters), from
+    cleaned_source() unless a path is given.
+    With cache=True, the rows read for a given (path, start, end, channels) are kept in memory:
+    asking again, even for other columns, only reads the columns that were not loaded yet.
+    The returned DataFrame is a shallow copy: adding/replacing columns does not touch the cache,
+    but values must not be modified in place.
+    """
+    path = path or cleaned_source()
+    if not cache:
+        return load_cleaned_data(path, columns, start, end, channels)
+
+    key = (os.path.abspath(path), start, end, tuple(channels) if channels is not None else None)
+    cached = _cleaned_cache.get(key)
+    wanted = list(columns) if columns is not None else None
+    if cached is None:
+        cached = load_cleaned_data(path, wanted, start, end, channels)
+    else:
+        missing = [col for col in wanted if col not in cached.columns] if wanted is not None else None
+        if missing is None or missing:
+            extra = load_cleaned_data(path, missing, start, end, channels)
+            # Same dataset and filters, so the rows come back in the same order
+            extra.index = cached.index
+            cached = pd.concat([cached, extra[[col for col in extra.columns if col not in cached.columns]]], axis=1)
+    _cleaned_cache[key] = cached
+    return (cached[wanted] if wanted is not None else cached).copy(deep=False)
+
+
+def get_series(channel, start=None, end=None, columns=series_columns, path=None):
+    """
+    Measurements of one channel (channel_id or channel_name) with start <= timestamp < end
+    (naive = local time), sorted by timestamp. Only the rows of that channel are read, located
+    with the channel index of the dataset (trafic_schema.read_channel_series): a month of one
+    street takes milliseconds whatever the size of the archive. Datasets written without the
+    index are filtered instead (slower). Not cached.
+    """
+    path = path or cleaned_data_path
+    dimension = read_channel_dimension(channel_dimension_path(path))
+    table = None
+    if dimension is not None:
+        table = read_channel_series(path, resolve_channel_keys(dimension, [channel]), start, end, columns)
+    if table is None:
+        df = load_cleaned_data(path, list(columns), start, end, [channel])
+        return df.sort_values('timestamp', kind='stable', ignore_index=True)
+    return cleaned_table_to_dataframe(table)
+
+
+def load_channels(path=None):
+    """
+    Loads the channel dimension table (channel_key, channel_id, channel_name, channel_length,
+    longitude, latitude, last_timestamp; row i = channel_key i), cached. Channels without a known position
+    have NaN coordinates.
+    """
+    path = os.path.abspath(path or channels_path)
+    if path not in _channels_cache:
+        _channels_cache[path] = pd.read_parquet(path, engine='pyarrow')
+    return _channels_cache[path].copy(deep=False)
+
+
+def join_coordinates(df, channels=None, weight_column='flow'):
+    """
+    Adds channel_name, longitude and latitude to per-channel rows (array indexing on
+    channel_key into the channel dimension) and keeps only the rows that have both coordinates
+    and a numeric weight. Returns (merged_df, rows_dropped).
+    """
+    channels = load_channels() if channels is None else channels
+    keys = df['channel_key'].to_numpy()
+    merged = df.assign(channel_name=channel_names(channels, keys),
+                       longitude=channels['longitude'].to_numpy()[keys],
+                       latitude=channels['latitude'].to_numpy()[keys])
+    merged[weight_column] = pd.to_numeric(merged[weight_column], errors='coerce')
+    initial_rows = len(merged)
+    merged = merged.dropna(subset=['longitude', 'latitude', weight_column])
+    return merged, initial_rows - len(merged)
+
+
+def load_cube(path=None):
+    """
+    Loads the aggregate cube written by the processing script (see trafic_aggregates.py), cached,
+    with the street names of the channel dimension (channel_name column).
+    If it does not exist yet, it is built from the cleaned dataset, which is slower but gives
+    the same results. Data written with an older schema has to be rebuilt.
+    """
+    path = os.path.abspath(path or aggregate_cube_path)
+    if path not in _cube_cache:
+        if not (has_cleaned_schema(cleaned_data_path) and os.path.exists(channels_path)):
+            print(f"❌ Error: {cleaned_data_path} was written by an older version of the processing script.")
+            print("   Please run the 'trafic_processing_master.py' script again to rebuild it.")
+            sys.exit(1)
+        table = read_cube(path) if os.path.exists(path) else None
+        if table is None:
+            print(f"⚠️ Aggregate cube not found at {path}: computing it from the cleaned dataset (slower).")
+            print("   Run 'trafic_processing_master.py' to create it once.")
+            table = build_cube_from_dataset(cleaned_data_path)
+        _cube_cache[path] = cube_to_dataframe(table, load_channels())
+    return _cube_cache[path].copy(deep=False)
@@ -0,0 +1,99 @@
+# ============================
+# trafic_figures.py
+# ============================
+# The report figures, shared by the analysis scripts (which show them) and trafic_report.py
+# (which saves them headless). Each function takes the already computed aggregates and returns
+# a matplotlib Figure, so the figures can be drawn in worker processes.
+
+import matplotlib.pyplot as plt
+
+from trafic_density import plot_density
+
+# --- File names of the figures in results/ ---
+hourly_flow_png = 'Average Traffic Flow per Hour.png'
+weekday_weekend_png = 'Average Traffic Flow per Hour Weekdays vs Weekends.png'
+day_of_week_png = 'Average Traffic Flow by Day of Week.png'
+top_congested_png = 'Top 10 most congested streets.png'
+top_fastest_png = 'Top 10 fastest streets.png'
+top_slowest_png = 'Top 10 Slowest Streets (Potential Congestion Ares by Speed).png'
+density_heatmap_png = 'traffic flow heatmap nantes.png'
+
+
+def figure_hourly_flow(hourly_flow):
+    """Average flow per hour of the day (line)."""
+    fig = plt.figure(figsize=(12, 6))
+    plt.plot(hourly_flow.index, hourly_flow.values, marker='o', linestyle='-', color='dodgerblue')
+    plt.title('Average Traffic Flow per Hour of the Day')
+    plt.xlabel('Hour of the Day (0-23)')
+    plt.ylabel('Average Flow (vehicles/hour?)') # Add units if known
+    plt.grid(True, linestyle='--', alpha=0.7)
+    plt.xticks(range(0, 24))
+    plt.tight_layout()
+    return fig
+
+
+def figure_weekday_weekend(weekday_flow, weekend_flow):
+    """Average flow per hour, weekdays vs weekends (two lines)."""
+    fig = plt.figure(figsize=(12, 6))
+    plt.plot(weekday_flow.index, weekday_flow.values, label='Weekdays (Mon-Fri)', marker='o', color='darkorange')
+    plt.plot(weekend_flow.index, weekend_flow.values, label='Weekends (Sat-Sun)', marker='s', linestyle='--', color='purple') # Different marker/style
+    plt.title('Average Traffic Flow per Hour: Weekdays vs Weekends')
+    plt.xlabel('Hour of the Day (0-23)')
+    plt.ylabel('Average Flow (vehicles/hour?)')
+    plt.grid(True, linestyle='--', alpha=0.7)
+    plt.xticks(range(0, 24))
+    plt.legend()
+    plt.tight_layout()
+    return fig
+
+
+def figure_day_of_week(day_flow):
+    """Average flow per day of week (bars, in the order of the index)."""
+    fig = plt.figure(figsize=(10, 6))
+    day_flow.plot(kind='bar', color='teal')
+    plt.title('Average Traffic Flow by Day of Week')
+    plt.xlabel('Day of the Week')
+    plt.ylabel('Average Flow (vehicles/hour?)')
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.xticks(rotation=45, ha='right')
+    plt.tight_layout()
+    return fig
+
+
+def figure_top_streets(top, title, ylabel, color):
+    """Top-N streets (bars), e.g. from trafic_aggregates.top_channels."""
+    fig = plt.figure(figsize=(12, 7)) # Slightly larger figure
+    top.plot(kind='bar', color=color)
+    plt.title(title)
+    plt.xlabel('Street Name')
+    plt.ylabel(ylabel)
+    plt.xticks(rotation=45, ha='right')
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.tight_layout() # Adjust layout
+    return fig
+
+
+def figure_top_congested(top):
+    return figure_top_streets(top, 'Top 10 Most Congested Streets (by Average Flow)',
+                              'Average Traffic Flow (vehicles/hour?)', 'skyblue')
+
+
+def figure_top_fastest(top):
+    return figure_top_streets(top, 'Top 10 Fastest Streets (by Average Speed)', 'Average Speed (km/h)', 'mediumseagreen')
+
+
+def figure_top_slowest(top):
+    return figure_top_streets(top, 'Top 10 Slowest Streets (Potential Congestion Areas by Speed)',
+                              'Average Speed (km/h)', 'lightcoral')
+
+
+def figure_density_heatmap(x_grid, y_grid, density, levels=50):
+    """Flow density heatmap (filled contours), from trafic_density.density_grid."""
+    fig, ax = plt.subplots(figsize=(12, 10)) # Adjusted size
+    plot_density(ax, x_grid, y_grid, density, levels=levels, thresh=0, cmap="Reds")
+    plt.title('Traffic Flow Density Heatmap (Nantes - Weighted by Flow)')
+    plt.xlabel('Longitude')
+    plt.ylabel('Latitude')
+    plt.grid(True, linestyle='--', alpha=0.6)
+    plt.tight_layout()
+    return fig
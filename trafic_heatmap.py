@@ -1,25 +1,18 @@
 # ============================
 # trafic_heatmap_updated.py
 # ============================
-# Generates a traffic density heatmap using Seaborn,
+# Generates a traffic density heatmap (same look as Seaborn's weighted kdeplot),
 # using pre-cleaned data and pre-calculated coordinates.
+# The density is computed by trafic_density.py from one aggregated point per channel
+# (binning + FFT convolution), so the runtime does not depend on the number of rows.
 
-import pandas as pd
 import matplotlib.pyplot as plt
-import seaborn as sns
 import sys
-import os
 import time
 
-print("🚀 Starting Traffic Heatmap Generation (Seaborn)...")
+print("🚀 Starting Traffic Heatmap Generation (density grid)...")
 start_time = time.time()
 
-# --- Configuration ---
-# Define paths to the required Parquet files
-# !! Ensure these paths are correct !!
-coordinate_mapping_path = r"C:\Users\ASUS\Documents\Stage LS2N\nantes_traffic_archiver\dist\channel_coordinates.parquet"
-cleaned_data_path = r"C:\Users\ASUS\Documents\Stage LS2N\nantes_traffic_archiver\dist\cleaned_traffic_data.parquet"
-
 # --- Check if pyarrow is installed ---
 try:
     import pyarrow
@@ -28,78 +21,68 @@ except ImportError:
     print("   Please install it using: pip install pyarrow")
     sys.exit(1)
 
-# 1. Load Coordinate Mapping
-print(f"⏳ Loading coordinate mapping from: {coordinate_mapping_path}")
-if not os.path.exists(coordinate_mapping_path):
-    print(f"❌ Error: Coordinate mapping file not found at {coordinate_mapping_path}")
-    print("   Please run the 'trafic_processing_master.py' script first.")
-    sys.exit(1)
+from trafic_data_access import (cleaned_data_path, channels_path,
+                                load_cube, load_channels, join_coordinates, require_file)
+from trafic_aggregates import cube_stats
+from trafic_density import density_grid
+from trafic_figures import figure_density_heatmap
+
+# --- Density Parameters (same meaning as in sns.kdeplot) ---
+density_levels = 50    # Number of contour levels
+density_bw_adjust = 0.2 # Adjust bandwidth (lower = more localized peaks)
+density_gridsize = 200 # Number of grid points on each axis
+
+# 1. Load the Channel Dimension (name and coordinates of every channel_key)
+# Paths are configured in trafic_data_access.py (or with the TRAFIC_RESULTS_DIR environment variable)
+print(f"⏳ Loading channel dimension from: {channels_path}")
+require_file(channels_path, "Channel dimension file")
 try:
-    geo_mapping = pd.read_parquet(coordinate_mapping_path, engine='pyarrow')
-    print(f"✅ Loaded {len(geo_mapping)} streets with coordinates from master file.")
+    channels = load_channels()
+    print(f"✅ Loaded {len(channels)} channels, {int(channels['longitude'].notna().sum())} with coordinates.")
 except Exception as e:
-    print(f"❌ Error reading coordinate mapping file: {e}")
+    print(f"❌ Error reading channel dimension file: {e}")
     sys.exit(1)
 
-# 2. Load Cleaned Traffic Data
-print(f"⏳ Loading cleaned traffic data from: {cleaned_data_path}")
-if not os.path.exists(cleaned_data_path):
-    print(f"❌ Error: Cleaned data file not found at {cleaned_data_path}")
-    print("   Please run the 'trafic_processing_master.py' script first.")
-    sys.exit(1)
+# 2. Aggregate the traffic data per channel (from the aggregate cube)
+# Each channel becomes one point weighted by the sum of its flows; the count and the sum of
+# squares keep the bandwidth identical to a KDE over the individual rows.
+print(f"⏳ Aggregating traffic data from: {cleaned_data_path}")
+require_file(cleaned_data_path, "Cleaned data file")
 try:
-    df = pd.read_parquet(cleaned_data_path, engine='pyarrow')
-    print(f"✅ Loaded {len(df)} rows from cleaned dataset.")
+    df = cube_stats(load_cube(), 'channel_key', 'flow')[['count', 'sum', 'sumsq']].reset_index()
+    print(f"✅ Aggregated {int(df['count'].sum())} measurements into {len(df)} channels.")
 except Exception as e:
     print(f"❌ Error reading cleaned data file: {e}")
     sys.exit(1)
 
-# 3. Merge Traffic Data with Coordinates
+# 3. Merge Channel Weights with Coordinates
+# Channels without coordinates (no position in the channel dimension) or without a flow are dropped.
+# Note: Negative flows should already be handled by the master script.
 print("🔄 Merging traffic data with coordinates...")
-df = pd.merge(df, geo_mapping, on='channel_name', how='left')
+df, rows_dropped = join_coordinates(df, channels, weight_column='sum')
 print(f"   -> Merged data shape: {df.shape}")
-
-# 4. Final Data Preparation for Heatmap
-# Drop rows where merge failed (no coordinates) or flow is missing
-# Note: Negative flows should already be handled by the master script.
-initial_rows = len(df)
-df = df.dropna(subset=['longitude', 'latitude', 'flow'])
-rows_dropped = initial_rows - len(df)
 if rows_dropped > 0:
-     print(f"   -> Dropped {rows_dropped} rows due to missing coordinates or flow after merge.")
-
-# Ensure column types are correct for plotting
-df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
-df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
-df['flow'] = pd.to_numeric(df['flow'], errors='coerce')
-df = df.dropna(subset=['longitude', 'latitude', 'flow']) # Drop if coercion failed
+     print(f"   -> Dropped {rows_dropped} channels due to missing coordinates or flow after merge.")
 
+# 4. Final Data Check
 if df.empty:
     print("❌ Error: No valid data remaining after merging and cleaning for the heatmap.")
     sys.exit(1)
 
-print(f"✅ Data ready for heatmap: {len(df)} rows.")
+print(f"✅ Data ready for heatmap: {len(df)} points ({int(df['count'].sum())} measurements).")
 
-# 5. Plot the Heatmap using Seaborn KDE
+# 5. Plot the Heatmap (weighted Gaussian density, filled contours)
 print("🎨 Generating heatmap plot...")
-plt.figure(figsize=(12, 10)) # Adjusted size
-
 try:
-    sns.kdeplot(
-        x=df['longitude'],
-        y=df['latitude'],
-        weights=df['flow'], # Use traffic flow as weights for density
-        cmap="Reds",        # Red color map indicates intensity
-        fill=True,          # Fill the contours
-        thresh=0,           # Include all data points
-        levels=50,          # Number of contour levels (adjust for performance/detail)
-        bw_adjust=0.2       # Adjust bandwidth (lower = more localized peaks)
+    x_grid, y_grid, density = density_grid(
+        df['longitude'], df['latitude'],
+        weights=df['sum'],        # Use traffic flow as weights for density
+        weights_sumsq=df['sumsq'],
+        counts=df['count'],
+        bw_adjust=density_bw_adjust,
+        gridsize=density_gridsize,
     )
-    plt.title('Traffic Flow Density Heatmap (Nantes - Weighted by Flow)')
-    plt.xlabel('Longitude')
-    plt.ylabel('Latitude')
-    plt.grid(True, linestyle='--', alpha=0.6)
-    plt.tight_layout()
+    figure_density_heatmap(x_grid, y_grid, density, levels=density_levels)
     plt.show()
     print("✅ Heatmap plot generated successfully.")
 
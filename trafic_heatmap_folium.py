@@ -3,10 +3,20 @@
 # ==================================
 # Generates an interactive traffic heatmap using Folium,
 # using pre-cleaned data and pre-calculated coordinates.
-
-import pandas as pd
+# Sensors have fixed positions, so the traffic data is first reduced to one weighted
+# point per channel (from the aggregate cube), which keeps the HTML file small.
+#
+# Modes (--mode, or heatmap_mode below):
+#   points  the channel points are embedded in the HTML and drawn by Leaflet.heat
+#   tiles   the flow density is pre-rendered into an XYZ PNG tile pyramid on disk
+#           (trafic_tiles.py, --workers N renders them in N processes); the HTML only
+#           references the tiles, loaded as the map is browsed
+#   animated  one frame per hour of the day (or per hour of the week), each one point per
+#           channel, played by HeatMapWithTime to show how congestion moves through the day
+
+import argparse
 import folium
-from folium.plugins import HeatMap
+from folium.plugins import HeatMap, HeatMapWithTime
 import sys
 import os
 import time
@@ -14,14 +24,25 @@ import time
 print("🚀 Starting Interactive Traffic Heatmap Generation (Folium)...")
 start_time = time.time()
 
-# --- Configuration ---
-# Define paths to the required Parquet files
-# !! Ensure these paths are correct !!
-coordinate_mapping_path = r"C:\Users\ASUS\Documents\Stage LS2N\nantes_traffic_archiver\dist\channel_coordinates.parquet"
-cleaned_data_path = r"C:\Users\ASUS\Documents\Stage LS2N\nantes_traffic_archiver\dist\cleaned_traffic_data.parquet"
+# --- Check if required libraries are installed ---
+try:
+    import pyarrow
+    from trafic_data_access import (cleaned_data_path, channels_path, results_dir,
+                                    load_cube, load_channels, join_coordinates, require_file)
+    from trafic_aggregates import channel_weights, cube_stats
+    from trafic_density import density_grid
+    from trafic_tiles import render_tile_pyramid
+    from trafic_schema import day_order
+    import folium
+except ImportError as e:
+    print(f"❌ Error: Required library not found: {e}")
+    print("   Please install required libraries: pip install pandas pyarrow folium")
+    sys.exit(1)
 
+# --- Configuration ---
+# Input paths (Parquet files) are configured in trafic_data_access.py (or with TRAFIC_RESULTS_DIR)
 # Output path for the interactive HTML map
-output_html_path = r"C:\Users\ASUS\Documents\Stage LS2N\nantes_traffic_archiver\dist\traffic_heatmap_nantes_interactive.html"
+output_html_path = os.path.join(results_dir, "traffic_heatmap_nantes_interactive.html")
 
 # Nantes center coordinates for map initialization
 nantes_center = [47.2184, -1.5536]
@@ -32,66 +53,81 @@ heatmap_blur = 5
 heatmap_max_zoom = 18 # Max zoom level for heatmap points
 heatmap_gradient = None # Use default gradient, or specify e.g., {0.2: 'blue', 0.4: 'lime', 0.6: 'orange', 1: 'red'}
 
-# --- Check if required libraries are installed ---
-try:
-    import pyarrow
-    import folium
-except ImportError as e:
-    print(f"❌ Error: Required library not found: {e}")
-    print("   Please install required libraries: pip install pandas pyarrow folium")
-    sys.exit(1)
-
-# 1. Load Coordinate Mapping
-print(f"⏳ Loading coordinate mapping from: {coordinate_mapping_path}")
-if not os.path.exists(coordinate_mapping_path):
-    print(f"❌ Error: Coordinate mapping file not found at {coordinate_mapping_path}")
-    print("   Please run the 'trafic_processing_master.py' script first.")
-    sys.exit(1)
+# Aggregation of the flow into one point per channel
+heatmap_statistic = 'mean' # 'mean' (average flow of the street) or 'sum' (total flow, like stacking every measurement)
+heatmap_hours = None # Only use these hours (local time), e.g. [7, 8, 9] for the morning peak; None = all hours
+
+# Rendering mode: 'points' (HeatMap layer in the HTML) or 'tiles' (pre-rendered density tiles)
+heatmap_mode = 'points'
+tiles_folder = os.path.join(results_dir, "heatmap_tiles") # <z>/<x>/<y>.png, recreated on each run
+tile_zoom_levels = range(11, 17) # Zoom levels pre-rendered; the map upscales the last one beyond
+tile_opacity = 0.7
+tile_bw_adjust = 0.2 # Density bandwidth, as in trafic_heatmap.py
+tile_gridsize = 1000 # Resolution of the density grid sampled by the tiles
+
+# Animated mode: frames per hour of the day (24, all days together) or per hour of the week (168)
+animation_frames = 'hour' # 'hour' or 'week'
+
+parser = argparse.ArgumentParser(description="Interactive traffic heatmap (Folium).")
+parser.add_argument('--mode', choices=['points', 'tiles', 'animated'], default=heatmap_mode,
+                    help="'points': weighted points in the HTML; 'tiles': pre-rendered XYZ density tiles; "
+                         "'animated': one frame per hour (HeatMapWithTime).")
+parser.add_argument('--workers', type=int, default=1,
+                    help="Tiles mode: number of processes rendering the tiles in parallel (default: 1).")
+parser.add_argument('--frames', choices=['hour', 'week'], default=animation_frames,
+                    help="Animated mode: 24 frames (hour of day) or 168 frames (day of week x hour).")
+args = parser.parse_args()
+heatmap_mode, animation_frames = args.mode, args.frames
+
+# 1. Load the Channel Dimension (name and coordinates of every channel_key)
+print(f"⏳ Loading channel dimension from: {channels_path}")
+require_file(channels_path, "Channel dimension file")
 try:
-    geo_mapping = pd.read_parquet(coordinate_mapping_path, engine='pyarrow')
-    print(f"✅ Loaded {len(geo_mapping)} streets with coordinates from master file.")
+    channels = load_channels()
+    print(f"✅ Loaded {len(channels)} channels, {int(channels['longitude'].notna().sum())} with coordinates.")
 except Exception as e:
-    print(f"❌ Error reading coordinate mapping file: {e}")
+    print(f"❌ Error reading channel dimension file: {e}")
     sys.exit(1)
 
-# 2. Load Cleaned Traffic Data
-print(f"⏳ Loading cleaned traffic data from: {cleaned_data_path}")
-if not os.path.exists(cleaned_data_path):
-    print(f"❌ Error: Cleaned data file not found at {cleaned_data_path}")
-    print("   Please run the 'trafic_processing_master.py' script first.")
-    sys.exit(1)
+# 2. Aggregate the traffic data to one weighted point per channel (from the aggregate cube)
+print(f"⏳ Aggregating traffic data from: {cleaned_data_path}")
+require_file(cleaned_data_path, "Cleaned data file")
 try:
-    df = pd.read_parquet(cleaned_data_path, engine='pyarrow')
-    print(f"✅ Loaded {len(df)} rows from cleaned dataset.")
+    cube = load_cube()
+    if heatmap_mode == 'tiles':
+        # Density weighted by the total flow, like trafic_heatmap.py
+        if heatmap_hours is not None:
+            cube = cube[cube['hour'].isin(heatmap_hours)]
+        df = cube_stats(cube, 'channel_key', 'flow')[['count', 'sum', 'sumsq']].reset_index()
+        df = df.rename(columns={'sum': 'flow'})
+        print(f"✅ Aggregated {int(df['count'].sum())} measurements into {len(df)} channels.")
+    elif heatmap_mode == 'animated':
+        # One point per channel and frame (hour, or day of week x hour)
+        df = channel_weights(cube, 'flow', statistic=heatmap_statistic, by_hour=True,
+                             by_day_of_week=(animation_frames == 'week'), hours=heatmap_hours)
+        print(f"✅ Aggregated flow ({heatmap_statistic}) into {len(df)} channel x {animation_frames} frame points.")
+    else:
+        df = channel_weights(cube, 'flow', statistic=heatmap_statistic, hours=heatmap_hours)
+        print(f"✅ Aggregated flow ({heatmap_statistic}) for {len(df)} channels.")
 except Exception as e:
     print(f"❌ Error reading cleaned data file: {e}")
     sys.exit(1)
 
-# 3. Merge Traffic Data with Coordinates
+# 3. Merge Channel Weights with Coordinates
+# Channels without coordinates (no position in the channel dimension) or without a numeric flow are dropped.
+# Note: Negative flows should already be handled by the master script.
 print("🔄 Merging traffic data with coordinates...")
-df = pd.merge(df, geo_mapping, on='channel_name', how='left')
+df, rows_dropped = join_coordinates(df, channels)
 print(f"   -> Merged data shape: {df.shape}")
-
-# 4. Final Data Preparation for Heatmap
-# Drop rows where merge failed (no coordinates) or flow is missing
-# Note: Negative flows should already be handled by the master script.
-initial_rows = len(df)
-df = df.dropna(subset=['longitude', 'latitude', 'flow'])
-rows_dropped = initial_rows - len(df)
 if rows_dropped > 0:
-     print(f"   -> Dropped {rows_dropped} rows due to missing coordinates or flow after merge.")
-
-# Ensure column types are correct for HeatMap input
-df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
-df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
-df['flow'] = pd.to_numeric(df['flow'], errors='coerce')
-df = df.dropna(subset=['latitude', 'longitude', 'flow']) # Drop if coercion failed
+     print(f"   -> Dropped {rows_dropped} channels due to missing coordinates or flow after merge.")
 
+# 4. Final Data Check
 if df.empty:
     print("❌ Error: No valid data remaining after merging and cleaning for the heatmap.")
     sys.exit(1)
 
-print(f"✅ Data ready for heatmap: {len(df)} rows.")
+print(f"✅ Data ready for heatmap: {len(df)} points.")
 
 
 # 5. Create Folium Map
@@ -99,27 +135,94 @@ print("🗺️ Creating Folium base map...")
 # Use a slightly lighter base map that works well with heatmaps
 m = folium.Map(location=nantes_center, zoom_start=13, tiles="CartoDB positron")
 
-# 6. Prepare data for Folium HeatMap
-# Format: List of lists, where each inner list is [latitude, longitude, weight]
-print("🔥 Preparing data points for heatmap layer...")
-# Use .values for potentially faster access than iterrows
-heat_data = df[['latitude', 'longitude', 'flow']].values.tolist()
-print(f"   -> Prepared {len(heat_data)} points.")
-
-# 7. Add HeatMap layer to the map
-print("➕ Adding HeatMap layer...")
-try:
-    HeatMap(
-        heat_data,
-        radius=heatmap_radius,
-        blur=heatmap_blur,
+if heatmap_mode == 'tiles':
+    # 6. Render the density tile pyramid
+    print(f"🔥 Rendering density tiles (zoom {tile_zoom_levels[0]}-{tile_zoom_levels[-1]}) to: {tiles_folder}")
+    try:
+        x_grid, y_grid, density = density_grid(
+            df['longitude'], df['latitude'], weights=df['flow'], weights_sumsq=df['sumsq'], counts=df['count'],
+            bw_adjust=tile_bw_adjust, gridsize=tile_gridsize, oversample=1,
+        )
+        tiles_written = render_tile_pyramid(x_grid, y_grid, density, tiles_folder, tile_zoom_levels,
+                                            opacity=tile_opacity, workers=args.workers)
+        print(f"   -> Wrote {sum(tiles_written.values())} tiles ({tiles_written}).")
+    except Exception as e:
+        print(f"❌ Error rendering density tiles: {e}")
+        sys.exit(1)
+
+    # 7. Add the tile layer to the map (tile URLs relative to the HTML file)
+    print("➕ Adding density tile layer...")
+    tiles_url = os.path.relpath(tiles_folder, os.path.dirname(os.path.abspath(output_html_path))).replace(os.sep, '/')
+    folium.TileLayer(
+        tiles=tiles_url + "/{z}/{x}/{y}.png",
+        attr="Nantes traffic density",
+        name="Traffic flow density",
+        overlay=True,
+        min_zoom=tile_zoom_levels[0],
+        max_native_zoom=tile_zoom_levels[-1],
         max_zoom=heatmap_max_zoom,
-        gradient=heatmap_gradient
+        bounds=[[float(y_grid[0]), float(x_grid[0])], [float(y_grid[-1]), float(x_grid[-1])]],
     ).add_to(m)
-    print("✅ HeatMap layer added.")
-except Exception as e:
-    print(f"❌ Error adding HeatMap layer: {e}")
-    sys.exit(1)
+    print("✅ Tile layer added.")
+elif heatmap_mode == 'animated':
+    # 6. Prepare one frame of [latitude, longitude, weight] points per hour
+    # Weights are scaled by the maximum over all frames, so the frames are comparable.
+    print(f"🔥 Preparing animation frames ({animation_frames})...")
+    max_flow = df['flow'].max()
+    df['weight'] = df['flow'] / max_flow if max_flow > 0 else 0.0
+    df = df.round({'latitude': 6, 'longitude': 6, 'weight': 4})
+    hours = heatmap_hours if heatmap_hours is not None else range(24)
+    days = range(len(day_order)) if animation_frames == 'week' else [None]
+    frame_points = {key: group[['latitude', 'longitude', 'weight']].values.tolist()
+                    for key, group in df.groupby(['day_of_week', 'hour'] if days[0] is not None else ['hour'])}
+    heat_frames, frame_labels = [], []
+    for day in days:
+        for hour in hours:
+            key = (day, hour) if day is not None else (hour,)
+            heat_frames.append(frame_points.get(key, []))
+            frame_labels.append(f"{day_order[day] + ' ' if day is not None else ''}{hour:02d}:00")
+    print(f"   -> Prepared {len(heat_frames)} frames, {sum(len(f) for f in heat_frames)} points in total.")
+
+    # 7. Add the animated HeatMapWithTime layer
+    print("➕ Adding HeatMapWithTime layer...")
+    try:
+        HeatMapWithTime(
+            heat_frames,
+            index=frame_labels,
+            radius=heatmap_radius + heatmap_blur, # same footprint as the static layer's radius + blur
+            gradient=heatmap_gradient,
+            auto_play=True,
+            position='bottomright',
+        ).add_to(m)
+        print("✅ HeatMapWithTime layer added.")
+    except Exception as e:
+        print(f"❌ Error adding HeatMapWithTime layer: {e}")
+        sys.exit(1)
+else:
+    # 6. Prepare data for Folium HeatMap
+    # Format: List of lists, where each inner list is [latitude, longitude, weight]
+    # Weights are scaled to [0, 1] (the heatmap's default maximum intensity), and the values rounded
+    # to keep the embedded JSON short (6 decimals is ~10 cm).
+    print("🔥 Preparing data points for heatmap layer...")
+    max_flow = df['flow'].max()
+    df['weight'] = df['flow'] / max_flow if max_flow > 0 else 0.0
+    heat_data = df[['latitude', 'longitude', 'weight']].round({'latitude': 6, 'longitude': 6, 'weight': 4}).values.tolist()
+    print(f"   -> Prepared {len(heat_data)} points.")
+
+    # 7. Add HeatMap layer to the map
+    print("➕ Adding HeatMap layer...")
+    try:
+        HeatMap(
+            heat_data,
+            radius=heatmap_radius,
+            blur=heatmap_blur,
+            max_zoom=heatmap_max_zoom,
+            gradient=heatmap_gradient
+        ).add_to(m)
+        print("✅ HeatMap layer added.")
+    except Exception as e:
+        print(f"❌ Error adding HeatMap layer: {e}")
+        sys.exit(1)
 
 # 8. Save the interactive map to an HTML file
 print(f"💾 Saving interactive map to: {output_html_path}")
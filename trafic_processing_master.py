@@ -1,29 +1,64 @@
 # ============================
 # trafic_processing_master.py
 # ============================
+# Usage:
+#   python trafic_processing_master.py                 # full rebuild of the dataset
+#   python trafic_processing_master.py --incremental   # only ingest new/changed snapshots
+#   python trafic_processing_master.py --arrow-ipc     # also write the memory-mappable Arrow IPC copy
+#   python trafic_processing_master.py --reader pyarrow  # parse the CSV snapshots with pyarrow.csv
+#   python trafic_processing_master.py --restart       # abandon an interrupted run instead of resuming it
+#   python trafic_processing_master.py --watch         # keep running, ingest each new snapshot as it lands
 
 # 1. Import libraries
 import os
+import sys
+import csv
+import glob
+import json
+import shutil
+import argparse
+import hashlib
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import numpy as np  # For NaN
 import ast         # For safe evaluation of strings
 import time
+from datetime import datetime
+from functools import partial
+from multiprocessing import Pool
 
-print("🚀 Starting Traffic Data Processing...")
-start_time = time.time()
+from trafic_aggregates import (build_cube, build_cube_from_dataset, cube_day_keys, merge_cubes, read_cube,
+                               write_cube_days)
+from trafic_schema import (channel_index_month_path, channel_index_path, channel_index_schema, channel_schema,
+                          cleaned_batch_schema, cleaned_schema, has_cleaned_schema, is_partitioned_dataset,
+                          local_timezone, partition_day_keys, partition_dir, partition_sort_keys,
+                          read_channel_dimension)
 
 # ============================
 # 2. Configuration
 # ============================
-# --- Define Paths (Modify these as needed) ---
-# Folder containing the raw CSV snapshots
-raw_folder_path = r"C:\Users\thelo\Documents\LS2N\nantes_traffic_archiver\archive"
-
-# Output path for the master coordinate mapping file
-coordinate_mapping_path = r"C:\Users\thelo\Documents\LS2N\nantes-traffic-analysis\results\master_coordinate_mapping.parquet"
-
-# Output path for the final cleaned traffic data
-cleaned_data_path = r"C:\Users\thelo\Documents\LS2N\nantes-traffic-analysis\results\cleaned_traffic_data.parquet"
+# --- Paths: defined in trafic_data_access.py (override with TRAFIC_RAW_DIR / TRAFIC_RESULTS_DIR) ---
+# raw_folder_path: folder containing the raw CSV snapshots
+# coordinate_mapping_path: output path for the master coordinate mapping file (channel_name,
+#   longitude, latitude), derived from the channel dimension for external tools
+# cleaned_data_path: output path for the final cleaned traffic data. This is a hive-partitioned
+#   Parquet *dataset* (year=/month=/day= folders, one sorted part file per day): each run only
+#   rewrites the days it adds rows to. Read it with trafic_data_access.load_cleaned(), or one channel's
+#   time series with get_series() through the channel index stored in the folder (_channel_index/).
+# channels_path: channel dimension table (one row per cha_id, dense integer channel_key) next to
+#   the dataset; the measurement rows only store channel_key (see trafic_schema.py)
+# manifest_path: manifest of raw snapshots already ingested (path, size, mtime, content hash; one part per run)
+# aggregate_cube_path: aggregate cube (channel x date x hour statistics, one file per date), updated with the
+#   new rows of each run
+# cleaned_ipc_path: optional uncompressed Arrow IPC copy of the cleaned data (--arrow-ipc, one file per day),
+#   memory-mapped by the loaders
+# checkpoint_dir: state of an interrupted run (see ProcessingCheckpoint), resumed by the next run
+from trafic_data_access import (raw_folder_path, coordinate_mapping_path, cleaned_data_path, channels_path,
+                                manifest_path, aggregate_cube_path, cleaned_ipc_path, checkpoint_dir)
 
 # --- Columns to keep for main processing ---
 # Explicitly list columns to keep, excluding geo ones
@@ -36,13 +71,82 @@ columns_to_keep = [
 # These columns might contain -1 indicating missing/invalid data
 numeric_cols_check_invalid = ['mf1_debit', 'mf1_taux', 'mf1_vit', 'tc1_temps']
 
+# --- Raw column -> cleaned column names ---
+column_renames = {
+    'cha_id': 'channel_id',
+    'cha_lib': 'channel_name',
+    'cha_long': 'channel_length',
+    'mf1_hd': 'timestamp',
+    'mf1_debit': 'flow',
+    'mf1_taux': 'occupancy',
+    'mf1_vit': 'speed',
+    'tc1_temps': 'travel_time',
+    'couleur_tp': 'color_code',
+    'etat_trafic': 'traffic_state'
+}
+
+# --- Format of mf1_hd written by the archiver (ISO 8601 with UTC offset, e.g. 2025-05-19T13:00:00+00:00) ---
+raw_timestamp_format = '%Y-%m-%dT%H:%M:%S%z'
+
+# --- Column types of the raw snapshots for the pyarrow CSV reader (--reader pyarrow) ---
+# The repeated strings are read dictionary-encoded (Categoricals in pandas, no Python objects) and
+# mf1_hd is parsed by the reader itself with raw_timestamp_format.
+raw_column_types = {
+    'cha_id': pa.int64(),
+    'cha_lib': pa.dictionary(pa.int32(), pa.string()),
+    'cha_long': pa.int64(),
+    'mf1_hd': pa.timestamp('ns', tz='UTC'),
+    'mf1_debit': pa.float64(),
+    'mf1_taux': pa.float64(),
+    'mf1_vit': pa.float64(),
+    'tc1_temps': pa.float64(),
+    'couleur_tp': pa.int64(),
+    'etat_trafic': pa.dictionary(pa.int32(), pa.string()),
+    'geo_point_2d': pa.string(),
+}
+raw_traffic_schema = pa.schema([(col, raw_column_types[col]) for col in columns_to_keep])
+
 # --- Columns critical for dropping NaNs ---
 critical_cols_for_na = ['speed', 'flow', 'occupancy', 'timestamp'] # Use cleaned names
 
+# --- geo_point_2d format: "{'lon': -1.55, 'lat': 47.21}" (keys in either order, ' or " quotes) ---
+_geo_number = r"-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?"
+geo_lon_lat_pattern = r"^\s*\{\s*['\"]lon['\"]\s*:\s*(?P<lon>" + _geo_number + r")\s*,\s*['\"]lat['\"]\s*:\s*(?P<lat>" + _geo_number + r")\s*\}\s*$"
+geo_lat_lon_pattern = r"^\s*\{\s*['\"]lat['\"]\s*:\s*(?P<lat>" + _geo_number + r")\s*,\s*['\"]lon['\"]\s*:\s*(?P<lon>" + _geo_number + r")\s*\}\s*$"
+
+# --- Rows per row group in the compacted (sorted) day partitions; smaller groups = finer pruning ---
+partition_row_group_rows = 10_000
+
+# --- Compression of the cleaned part files (zstd: ~15% smaller than the default snappy, as fast to read) ---
+parquet_compression = 'zstd'
+
+# --- Raw CSV rows read (and cleaned) at a time; bounds the memory of the pandas stage ---
+chunk_rows = 100_000
+
+# --- Rows buffered before writing a Parquet row group (bounds the writer's memory) ---
+row_group_rows = 250_000
+
+# --- Snapshots ingested between two checkpoints (an interrupted run resumes from the last one) ---
+checkpoint_files = 100
+
+# --- Watch mode (--watch): seconds between two scans of the archive folder, and how long a new
+# snapshot must have been left unchanged before it is read (the archiver may still be writing it) ---
+watch_poll_seconds = 5
+watch_settle_seconds = 10
+
+# --- Columns stored in the processed-files manifest ---
+manifest_columns = ['path', 'size', 'mtime', 'content_hash']
+
+# --- The manifest is a folder of parts (one per run, holding only the snapshots the run recorded);
+# past this many parts, a run merges them into a single one ---
+manifest_max_parts = 50
+
 # ============================
 # 3. Helper Functions
 # ============================
 
+# safe_literal_eval/extract_coord are the original per-row geo_point_2d parser.
+# The pipeline uses parse_geo_points(); these stay as the reference for trafic_benchmarks.py.
 def safe_literal_eval(x):
     """Safely evaluates a string literal (like a dict or list)."""
     if pd.isna(x):
@@ -59,208 +163,1214 @@ def extract_coord(coord_dict, key='lon'):
         return coord_dict.get(key)
     return None
 
-# ============================
-# 4. Part 1: Generate Master Coordinate File
-# ============================
-print("\n Métape 1: Génération du fichier de coordonnées maîtres...")
-coord_start_time = time.time()
+def parse_geo_points(geo_series):
+    """
+    Vectorized parsing of geo_point_2d strings into float64 longitude/latitude (pyarrow regex kernel).
+    Returns a DataFrame (same index) with 'longitude' and 'latitude'; rows that are not
+    a {'lon': x, 'lat': y} dict become NaN, like with safe_literal_eval + extract_coord.
+    geo_series can also be a pyarrow string array (then the index is a RangeIndex).
+    """
+    if isinstance(geo_series, pa.ChunkedArray):
+        geo_series = geo_series.combine_chunks()
+    if isinstance(geo_series, pa.Array):
+        geo_array, index = geo_series, None
+    else:
+        geo_array, index = pa.array(geo_series, type=pa.string(), from_pandas=True), geo_series.index
+    null_string = pa.scalar(None, pa.string())
+    coords = {}
+    for key in ('lon', 'lat'):
+        values = null_string
+        for pattern in (geo_lat_lon_pattern, geo_lon_lat_pattern):
+            matches = pc.extract_regex(geo_array, pattern)
+            # Non-matching rows are null structs whose fields hold '', so mask them explicitly
+            values = pc.if_else(matches.is_valid(), matches.field(key), values)
+        coords[key] = values.cast(pa.float64()).to_numpy(zero_copy_only=False)
+    return pd.DataFrame({'longitude': coords['lon'], 'latitude': coords['lat']}, index=index)
+
+def parse_timestamps(values):
+    """
+    Parses mf1_hd strings with the archiver's known format (raw_timestamp_format) in pyarrow's
+    strptime kernel, instead of letting pandas infer the format value by value.
+    A snapshot holds a handful of distinct timestamps, so only the distinct strings are parsed.
+    Values that do not match become NaT, like pd.to_datetime(errors='coerce').
+    Returns a Series of timestamps in local time (local_timezone), with the same index.
+    Timestamps already parsed by the CSV reader are only converted to local time.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.tz_convert(local_timezone)
+    strings = pa.array(values.astype(object, copy=False), type=pa.string(), from_pandas=True)
+    encoded = pc.dictionary_encode(strings)
+    parsed = pc.strptime(encoded.dictionary, format=raw_timestamp_format, unit='s', error_is_null=True)
+    parsed = parsed.cast(pa.timestamp('ns', tz=local_timezone)).take(encoded.indices)
+    return parsed.to_pandas().set_axis(values.index)
+
+def list_raw_files(folder_path):
+    """Lists the raw CSV snapshots of the archive folder, sorted by name (i.e. by date)."""
+    return sorted(
+        os.path.join(folder_path, f) for f in os.listdir(folder_path)
+        if f.endswith('.csv') and os.path.isfile(os.path.join(folder_path, f))
+    )
+
+def compute_file_hash(file_path, block_size=1024 * 1024):
+    """Returns the SHA-256 of a file's content, read block by block."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def manifest_parts(path):
+    """Part files of a manifest folder, in run order (they are named after the run id)."""
+    return sorted(glob.glob(os.path.join(glob.escape(path), 'part-*.parquet')))
+
+def load_manifest(path):
+    """
+    Loads the processed-files manifest (folder of parts, or the single file written by older
+    versions), or an empty one if it does not exist yet. The latest entry of each snapshot wins.
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=manifest_columns)
+    if not os.path.isdir(path):
+        return pd.read_parquet(path)
+    parts = [pd.read_parquet(part) for part in manifest_parts(path)]
+    parts = [part for part in parts if not part.empty]
+    if not parts:
+        return pd.DataFrame(columns=manifest_columns)
+    manifest = pd.concat(parts, ignore_index=True)
+    return manifest.drop_duplicates('path', keep='last').reset_index(drop=True)
+
+def save_manifest(manifest, path):
+    """Saves manifest entries to one Parquet file (temporary file, then renamed)."""
+    temp_path = path + '.tmp'
+    manifest[manifest_columns].sort_values('path').to_parquet(temp_path, index=False)
+    os.replace(temp_path, path)
 
-raw_files = [os.path.join(raw_folder_path, f) for f in os.listdir(raw_folder_path) if f.endswith('.csv') and os.path.isfile(os.path.join(raw_folder_path, f))]
+def save_manifest_entries(entries, path, run_id, replace=False):
+    """
+    Records the manifest entries of a run as a new part of the manifest folder
+    (part-<run_id>.parquet), so a run only writes the snapshots it ingested or checked again.
+    With replace=True (full rebuild), entries is the whole manifest and the other parts are removed.
+    Past manifest_max_parts parts, the manifest is merged into this run's part the same way.
+    A single-file manifest of an older version is first converted to a folder.
+    """
+    temp_path = path + '.tmp'
+    if not os.path.isdir(path) or os.path.exists(temp_path):
+        legacy_part = os.path.join(temp_path, 'part-0.parquet')
+        if not os.path.exists(legacy_part):
+            os.makedirs(temp_path, exist_ok=True)
+            save_manifest(load_manifest(path), legacy_part)
+        replace_cleaned_dataset(temp_path, path)
+    parts = manifest_parts(path)
+    part_path = os.path.join(path, f"part-{run_id}.parquet")
+    if not replace and len(parts) >= manifest_max_parts:
+        current = load_manifest(path)
+        entries = pd.concat([current, entries], ignore_index=True) if not current.empty else entries
+        entries = entries.drop_duplicates('path', keep='last')
+        replace = True
+    save_manifest(entries, part_path)
+    if replace:
+        # part_path has the latest run id: until the others are gone, its entries already win
+        for part in parts:
+            if part != part_path:
+                os.remove(part)
 
-if not raw_files:
-    print(f"❌ Erreur: Aucun fichier CSV trouvé dans {raw_folder_path}")
-    exit()
+def select_files_to_process(raw_files, manifest):
+    """
+    Compares the raw files with the manifest.
+    Returns (files_to_process, manifest_entries):
+      - unchanged files (same size and mtime) are skipped without being read,
+      - files whose size/mtime changed are hashed, and only re-ingested if their content changed
+        (start_run then rebuilds the dataset),
+      - new files are always ingested.
+    manifest_entries holds the new entries only (new files, and files whose size/mtime changed),
+    to be added to the manifest (save_manifest_entries).
+    """
+    known = dict(zip(manifest['path'], manifest[['size', 'mtime', 'content_hash']].itertuples(index=False)))
+    files_to_process = []
+    entries = []
+    for file in raw_files:
+        stat = os.stat(file)
+        entry = {'path': file, 'size': stat.st_size, 'mtime': stat.st_mtime, 'content_hash': None}
+        if file in known:
+            previous = known[file]
+            if previous.size == entry['size'] and previous.mtime == entry['mtime']:
+                continue
+            entry['content_hash'] = compute_file_hash(file)
+            if entry['content_hash'] == previous.content_hash:
+                # Only touched (e.g. copied again), same content: nothing to ingest
+                entries.append(entry)
+                continue
+            print(f"⚠️ Le contenu de {os.path.basename(file)} a changé depuis la dernière ingestion.")
+        else:
+            entry['content_hash'] = compute_file_hash(file)
+        files_to_process.append(file)
+        entries.append(entry)
+    return files_to_process, pd.DataFrame(entries, columns=manifest_columns)
 
-print(f"🔍 Trouvé {len(raw_files)} fichiers CSV bruts pour l'extraction des coordonnées.")
+def reset_cleaned_dataset(path):
+    """Removes a previous cleaned dataset (legacy single file or part-file folder)."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
 
-all_coords_list = []
-processed_files_coord = 0
-errors_coord = 0
+def replace_cleaned_dataset(new_path, path):
+    """
+    Puts the dataset built in new_path (full rebuild) in place of the one at path: the previous
+    dataset is renamed aside, the new one renamed to path, then the previous one removed, so path
+    never holds a partially written dataset. Can be run again after an interruption.
+    """
+    old_path = path + '.old'
+    if os.path.exists(new_path):
+        if os.path.exists(path):
+            reset_cleaned_dataset(old_path)
+            os.replace(path, old_path)
+        os.replace(new_path, path)
+    reset_cleaned_dataset(old_path)
 
-for file in raw_files:
+# ============================
+# 4. Part 1: Read and Clean the Raw Snapshots (single pass)
+# ============================
+def iter_snapshot_chunks(file, chunk_size=None):
+    """
+    Reads one raw snapshot once, chunk_size rows at a time, with only the columns needed by both outputs.
+    Yields (coords_df, traffic_df) per chunk: coords_df is None if the file has no geo_point_2d column.
+    """
+    wanted = set(columns_to_keep) | {'geo_point_2d'}
+    reader = pd.read_csv(file, header=0, usecols=lambda col: col in wanted, low_memory=False,
+                         chunksize=chunk_size or chunk_rows)
+    with reader:
+        for temp_df in reader:
+            missing = [col for col in columns_to_keep if col not in temp_df.columns]
+            if missing:
+                raise ValueError(f"Usecols do not match columns, columns expected but not found: {missing}")
+            coords_df = temp_df[['cha_id', 'geo_point_2d']] if 'geo_point_2d' in temp_df.columns else None
+            yield coords_df, temp_df[columns_to_keep]
+
+def read_csv_header(file):
+    """Column names of a raw snapshot (first line of the file)."""
+    with open(file, newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), [])
+
+def read_snapshot_arrow(file, columns):
+    """
+    Reads the given columns of one raw snapshot with pyarrow.csv (multithreaded parsing, typed
+    columns: see raw_column_types). If a value does not fit its type (e.g. text in a numeric
+    column), the file is read again with inferred types, like pandas does, and the pandas cleaning
+    stage turns the invalid values into NaN/NaT.
+    """
+    read_options = pa_csv.ReadOptions(use_threads=True)
     try:
-        # Read only necessary columns for coordinates
-        temp_df = pd.read_csv(file, header=0, usecols=['cha_lib', 'geo_point_2d'], low_memory=False)
-        temp_df = temp_df.dropna(subset=['cha_lib', 'geo_point_2d'])
-
-        if not temp_df.empty:
-            # Safely parse the geo_point_2d string
-            coords_parsed = temp_df['geo_point_2d'].apply(safe_literal_eval)
-
-            # Extract lon and lat
-            temp_df['longitude'] = coords_parsed.apply(extract_coord, key='lon')
-            temp_df['latitude'] = coords_parsed.apply(extract_coord, key='lat')
-
-            # Keep only relevant columns and drop rows where extraction failed
-            coords_extracted = temp_df[['cha_lib', 'longitude', 'latitude']].dropna()
-            all_coords_list.append(coords_extracted)
-        processed_files_coord += 1
-    except FileNotFoundError:
-        print(f"⚠️ Fichier non trouvé (peut-être supprimé pendant le processus): {file}")
-        errors_coord += 1
-    except Exception as e:
-        print(f"⚠️ Erreur lors du traitement du fichier {os.path.basename(file)} pour les coordonnées: {e}")
-        errors_coord += 1
-    # Optional: Add progress indicator
-    if (processed_files_coord + errors_coord) % 50 == 0:
-         print(f"   ... traité {processed_files_coord + errors_coord}/{len(raw_files)} fichiers pour les coordonnées")
+        convert_options = pa_csv.ConvertOptions(include_columns=columns,
+                                                column_types={col: raw_column_types[col] for col in columns},
+                                                timestamp_parsers=[raw_timestamp_format])
+        return pa_csv.read_csv(file, read_options=read_options, convert_options=convert_options)
+    except pa.ArrowInvalid:
+        convert_options = pa_csv.ConvertOptions(include_columns=columns)
+        return pa_csv.read_csv(file, read_options=read_options, convert_options=convert_options)
+
+def iter_snapshot_chunks_arrow(file, chunk_size=None):
+    """
+    Same as iter_snapshot_chunks, with the pyarrow CSV reader: the snapshot is parsed into an Arrow
+    table (a snapshot is small), then handed out chunk_size rows at a time. coords_df and traffic_df
+    are Arrow tables, which extract_new_coordinates and clean_traffic_batch process with pyarrow
+    compute functions, without going through pandas.
+    """
+    header = read_csv_header(file)
+    missing = [col for col in columns_to_keep if col not in header]
+    if missing:
+        raise ValueError(f"Usecols do not match columns, columns expected but not found: {missing}")
+    has_geo = 'geo_point_2d' in header
+    table = read_snapshot_arrow(file, columns_to_keep + (['geo_point_2d'] if has_geo else []))
+    chunk_size = chunk_size or chunk_rows
+    for offset in range(0, max(table.num_rows, 1), chunk_size):  # an empty snapshot still yields one chunk
+        chunk = table.slice(offset, chunk_size)
+        coords_df = chunk.select(['cha_id', 'geo_point_2d']) if has_geo else None
+        yield coords_df, chunk.select(columns_to_keep)
 
+# --- Raw CSV reader backends (--reader) ---
+raw_readers = {
+    'pandas': iter_snapshot_chunks,
+    'pyarrow': iter_snapshot_chunks_arrow,
+}
 
-if not all_coords_list:
-    print("❌ Erreur: Aucune donnée de coordonnées n'a pu être extraite des fichiers.")
-    exit()
+def iter_cleaned_batches(raw_files, chunk_size=None, reader='pandas'):
+    """
+    Streaming pipeline: raw CSV chunks -> cleaned Arrow record batches.
+    Yields (file, coords_df, batch, rows_read, error) per chunk:
+      - coords_df: parsed coordinates of the channels of the chunk (or None),
+      - batch: the cleaned rows as a pyarrow RecordBatch in cleaned_batch_schema,
+      - error: an error message (then coords_df/batch are None), or None.
+    reader selects the CSV reader backend (see raw_readers).
+    Only one chunk is held in memory at a time.
+    """
+    for file in raw_files:
+        try:
+            for coords_df, traffic_df in raw_readers[reader](file, chunk_size):
+                coords_extracted = extract_new_coordinates(coords_df, ()) if coords_df is not None else None
+                yield file, coords_extracted, clean_traffic_batch(traffic_df), len(traffic_df), None
+        except FileNotFoundError:
+            yield file, None, None, 0, "Fichier non trouvé (peut-être supprimé pendant le processus)"
+        except ValueError as ve:  # includes pyarrow's ArrowInvalid
+            yield file, None, None, 0, f"Erreur de valeur (probablement problème de colonne): {ve}"
+        except Exception as e:
+            yield file, None, None, 0, f"Erreur lors du traitement du fichier: {e}"
 
-# Combine all extracted coordinates
-print("   Concatenating coordinate data...")
-coord_df = pd.concat(all_coords_list, ignore_index=True)
+def process_snapshot(file, chunk_size=None, reader='pandas'):
+    """Worker task: runs the streaming pipeline on one snapshot and returns its per-chunk results."""
+    return list(iter_cleaned_batches([file], chunk_size, reader))
 
-# Rename channel library column consistently
-coord_df.rename(columns={'cha_lib': 'channel_name'}, inplace=True)
+def iter_processed_snapshots(raw_files, workers=1, chunk_size=None, reader='pandas'):
+    """
+    Yields the iter_cleaned_batches() results of raw_files in file order.
+    With workers > 1, snapshots are read and cleaned in a process pool; each task sends back
+    compact Arrow batches. Otherwise the pipeline is streamed chunk by chunk in this process.
+    """
+    if workers <= 1:
+        yield from iter_cleaned_batches(raw_files, chunk_size, reader)
+        return
+    with Pool(processes=workers) as pool:
+        # imap keeps the file order and only holds a few results in flight at a time
+        task = partial(process_snapshot, chunk_size=chunk_size, reader=reader)
+        for results in pool.imap(task, raw_files, chunksize=4):
+            yield from results
 
-# Keep only the *first* valid coordinate pair found for each unique channel_name
-print("   Dropping duplicate coordinate entries...")
-master_coords = coord_df.drop_duplicates(subset=['channel_name'], keep='first')
+def new_ingest_stats():
+    """Counters of ingest_raw_files (and a sample of the cleaned rows), accumulated over the batches of snapshots."""
+    return {'processed_files': 0, 'errors': 0, 'rows_read': 0, 'rows_kept': 0, 'rows_repeated': 0,
+            'rows_older': 0, 'sample': None}
 
-# Final check for NaNs in coordinates
-master_coords = master_coords.dropna(subset=['longitude', 'latitude'])
+def ingest_raw_files(raw_files, writer, dimension, workers=1, chunk_size=None, reader='pandas', stats=None):
+    """
+    Reads and cleans every raw file once (in parallel if workers > 1) and streams the cleaned
+    batches to writer, so the full dataset is never held in memory. The channels are registered
+    in the channel dimension, which encodes each batch on channel_key, drops the measurements
+    already ingested (ChannelDimension.drop_seen) and records the position of the channels that
+    do not have one yet.
+    Returns stats: processed files, errors, rows read, rows kept and measurements dropped as
+    repeated or older than the channel's last one (added to stats if given, e.g. those of the
+    previous batches of snapshots).
+    """
+    files_read = set()
+    files_failed = set()
+    stats = stats if stats is not None else new_ingest_stats()
 
-# Save the master coordinate file using Parquet
-try:
-    master_coords.to_parquet(coordinate_mapping_path, index=False)
-    coord_elapsed = time.time() - coord_start_time
-    print(f"✅ Fichier maître de coordonnées enregistré dans {coordinate_mapping_path}")
-    print(f"   -> {len(master_coords)} entrées uniques de coordonnées de canaux trouvées.")
-    print(f"   -> Temps écoulé pour les coordonnées: {coord_elapsed:.2f} secondes.")
-except Exception as e:
-    print(f"❌ Erreur lors de l'enregistrement du fichier de coordonnées maître: {e}")
-    print(f"   Veuillez vérifier que vous disposez des autorisations d'écriture et de la bibliothèque 'pyarrow' (pip install pyarrow).")
-    exit()
+    for file, coords_extracted, batch, rows_read, error in iter_processed_snapshots(raw_files, workers, chunk_size,
+                                                                                    reader):
+        if error is not None:
+            print(f"⚠️ {error} ({os.path.basename(file)})")
+            files_failed.add(file)
+        else:
+            encoded, repeated, older = dimension.drop_seen(dimension.encode(batch))
+            writer.write_batch(encoded)
+            stats['rows_read'] += rows_read
+            stats['rows_kept'] += encoded.num_rows
+            stats['rows_repeated'] += repeated
+            stats['rows_older'] += older
+            if stats['sample'] is None and batch.num_rows > 0:
+                stats['sample'] = batch.slice(0, 5).to_pandas()
+            files_read.add(file)
 
+        if coords_extracted is not None and not coords_extracted.empty:
+            dimension.set_coordinates(coords_extracted)
+
+    stats['processed_files'] += len(files_read - files_failed)
+    stats['errors'] += len(files_failed)
+    return stats
 
 # ============================
-# 5. Part 2: Process Main Traffic Data
+# 5. Part 2: Channel Dimension and Coordinates
 # ============================
-print("\n Métape 2: Traitement des données principales sur le trafic...")
-data_start_time = time.time()
+def extract_new_coordinates(coords_df, located_channels):
+    """
+    Parses geo_point_2d for the first row of each channel (cha_id) not yet in located_channels.
+    coords_df is a DataFrame, or an Arrow table from the pyarrow reader.
+    """
+    if isinstance(coords_df, pa.Table):
+        return extract_new_coordinates_arrow(coords_df, located_channels)
+    temp_df = coords_df.dropna(subset=['cha_id', 'geo_point_2d'])
+    temp_df = temp_df[~temp_df['cha_id'].isin(located_channels)].drop_duplicates(subset=['cha_id'])
+    if temp_df.empty:
+        return pd.DataFrame(columns=['cha_id', 'longitude', 'latitude'])
 
-df_list = []
-processed_files_data = 0
-errors_data = 0
+    # Parse the geo_point_2d strings (vectorized) and extract lon and lat
+    temp_df = pd.concat([temp_df[['cha_id']], parse_geo_points(temp_df['geo_point_2d'])], axis=1)
 
-# We reuse the raw_files list from Part 1
-for file in raw_files:
-    try:
-        # Read only the columns we want to keep
-        temp_df = pd.read_csv(file, header=0, usecols=columns_to_keep, low_memory=False)
-        df_list.append(temp_df)
-        processed_files_data += 1
-    except FileNotFoundError:
-        print(f"⚠️ Fichier non trouvé (peut-être supprimé pendant le processus): {file}")
-        errors_data += 1
-    except ValueError as ve:
-        print(f"⚠️ Erreur de valeur (probablement problème de colonne) dans {os.path.basename(file)}: {ve}")
-        errors_data += 1
-    except Exception as e:
-        print(f"⚠️ Erreur lors du traitement du fichier {os.path.basename(file)} pour les données: {e}")
-        errors_data += 1
-    # Optional: Add progress indicator
-    if (processed_files_data + errors_data) % 50 == 0:
-        print(f"   ... traité {processed_files_data + errors_data}/{len(raw_files)} fichiers pour les données")
+    # Keep only relevant columns and drop rows where extraction failed
+    return temp_df[['cha_id', 'longitude', 'latitude']].dropna()
+
+def extract_new_coordinates_arrow(coords_table, located_channels):
+    """extract_new_coordinates on an Arrow table (cha_id, geo_point_2d), with pyarrow compute functions."""
+    channel_ids = coords_table['cha_id']
+    keep = pc.and_(pc.and_(pc.is_valid(channel_ids), pc.is_valid(coords_table['geo_point_2d'])),
+                   pc.invert(pc.is_in(channel_ids, pa.array(list(located_channels), channel_ids.type))))
+    table = coords_table.filter(keep)
+    # First row of each channel: index_in returns the position of the first occurrence
+    first_rows = pc.index_in(pc.unique(table['cha_id']), value_set=table['cha_id'])
+    table = table.take(first_rows)
+    coords = parse_geo_points(table['geo_point_2d'])
+    coords.insert(0, 'cha_id', table['cha_id'].to_numpy())
+    return coords.dropna()
+
+class ChannelDimension:
+    """
+    Channel dimension table (trafic_schema.channel_schema): one row per sensor (cha_id), whose
+    row number is its dense integer channel_key. Keys are only ever appended, so the rows written
+    by earlier runs stay valid. A channel keeps the name and length of its latest measurement,
+    the first valid position found for it and the timestamp of the latest measurement ingested
+    (last_timestamp, see drop_seen).
+    """
+    _unseen = np.iinfo('int64').min  # last_seen of a channel without any measurement ingested yet
+
+    def __init__(self, table=None):
+        table = table if table is not None else channel_schema.empty_table()
+        self.channels = table.drop_columns(['channel_key', 'last_timestamp']).to_pandas()
+        self._ids = pd.Index(self.channels['channel_id'])
+        # Latest measurement timestamp per channel_key, as int64 nanoseconds
+        self._last_seen = table['last_timestamp'].cast(pa.int64()).fill_null(self._unseen).to_numpy()
+
+    def __len__(self):
+        return len(self.channels)
+
+    def encode(self, batch):
+        """
+        Registers the channels of a cleaned batch (cleaned_batch_schema) and returns the batch in
+        cleaned_schema, i.e. with channel_key instead of channel_id/channel_name/channel_length.
+        """
+        channel_ids = batch.column('channel_id').to_numpy(zero_copy_only=False)
+        keys = self._ids.get_indexer(channel_ids)
+        if (keys < 0).any():
+            new_ids = pd.unique(channel_ids[keys < 0])
+            new_rows = pd.DataFrame({'channel_id': new_ids.astype('int32')})
+            self.channels = pd.concat([self.channels, new_rows], ignore_index=True)
+            self._ids = pd.Index(self.channels['channel_id'])
+            self._last_seen = np.concatenate([self._last_seen, np.full(len(new_ids), self._unseen)])
+            keys = self._ids.get_indexer(channel_ids)
+        # Latest name and length of each channel of the batch
+        latest = pd.Series(np.arange(len(keys))).groupby(keys).last()
+        names = batch.column('channel_name').take(pa.array(latest.to_numpy())).cast(pa.string())
+        self.channels.loc[latest.index, 'channel_name'] = names.to_numpy(zero_copy_only=False)
+        self.channels.loc[latest.index, 'channel_length'] = (
+            batch.column('channel_length').take(pa.array(latest.to_numpy())).to_numpy(zero_copy_only=False))
+        columns = [pa.array(keys, pa.int32())] + [batch.column(name) for name in cleaned_schema.names[1:]]
+        return pa.record_batch(columns, schema=cleaned_schema)
+
+    def drop_seen(self, batch):
+        """
+        Drops the measurements of an encoded batch (cleaned_schema) that were already ingested.
+        The archiver polls more often than mf1_hd changes, so consecutive snapshots repeat the
+        same (channel, timestamp) row. A row is kept only if its timestamp is later than the last
+        one ingested for its channel_key (in this run or an earlier one) and is not repeated within
+        the batch; the snapshots are ingested in chronological order, so this per-channel
+        timestamp is all the state needed. Returns (kept batch, repeated rows, older rows).
+        """
+        keys = batch.column('channel_key').to_numpy()
+        timestamps = batch.column('timestamp').cast(pa.int64()).to_numpy()
+        previous = self._last_seen[keys]
+        older = timestamps < previous
+        keep = timestamps > previous
+        # Repeats within the batch: rows equal to the previous one once sorted (stable: the first is kept)
+        order = np.lexsort((timestamps, keys))
+        keep[order[1:]] &= (keys[order[1:]] != keys[order[:-1]]) | (timestamps[order[1:]] != timestamps[order[:-1]])
+        np.maximum.at(self._last_seen, keys[keep], timestamps[keep])
+        kept = int(keep.sum())
+        if kept < batch.num_rows:
+            batch = batch.filter(pa.array(keep))
+        return batch, len(keep) - kept - int(older.sum()), int(older.sum())
+
+    def has_last_seen(self):
+        """False for a dimension written before last_timestamp was tracked (every channel has a measurement)."""
+        return not (self._last_seen == self._unseen).any()
 
+    def set_coordinates(self, coords_df):
+        """Sets the position (cha_id, longitude, latitude) of the channels that have none yet."""
+        keys = self._ids.get_indexer(coords_df['cha_id'])
+        known = keys >= 0
+        keys, coords_df = keys[known], coords_df[known]
+        missing = self.channels['longitude'].isna().to_numpy()[keys]
+        keys, coords_df = keys[missing], coords_df[missing]
+        first = ~pd.Index(keys).duplicated()
+        self.channels.loc[keys[first], 'longitude'] = coords_df['longitude'].to_numpy()[first]
+        self.channels.loc[keys[first], 'latitude'] = coords_df['latitude'].to_numpy()[first]
 
-if not df_list:
-    print("❌ Erreur: Aucune donnée de trafic n'a pu être lue.")
-    exit()
+    def to_table(self):
+        table = pa.Table.from_pandas(self.channels.assign(channel_key=np.arange(len(self.channels), dtype='int32')),
+                                     preserve_index=False)
+        last_seen = pa.array(self._last_seen, mask=self._last_seen == self._unseen)
+        table = table.append_column('last_timestamp', last_seen.cast(channel_schema.field('last_timestamp').type))
+        return table.select(channel_schema.names).cast(channel_schema)
 
-# Concatenate everything into one big dataframe
-print(f"   Concaténation de {len(df_list)} DataFrames...")
-df = pd.concat(df_list, ignore_index=True)
-print(f"   -> Données brutes concaténées: {len(df)} lignes.")
+    def coordinate_mapping(self):
+        """Master coordinate mapping (channel_name, longitude, latitude) of the located channels."""
+        located = self.channels.dropna(subset=['longitude', 'latitude'])
+        return located[['channel_name', 'longitude', 'latitude']].reset_index(drop=True)
+
+    def save(self, path):
+        """Writes the dimension table (temporary file, then renamed)."""
+        temp_path = path + '.tmp'
+        pq.write_table(self.to_table(), temp_path, compression=parquet_compression)
+        os.replace(temp_path, path)
 
 # ============================
 # 6. Part 3: Clean the Main Traffic Data
 # ============================
-print("\n Métape 3: Nettoyage des données principales sur le trafic...")
-cleaning_start_time = time.time()
+def clean_traffic_data(df, verbose=True):
+    """
+    Renames, converts and filters the raw traffic rows (columns_to_keep), then adds the time features.
+    Works on any chunk of rows: every row is cleaned independently of the others.
+    The result is built column by column and filtered once, without intermediate full copies.
+    verbose=False silences the step-by-step messages (used when cleaning chunk by chunk).
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
 
-# --- Rename columns cleanly ---
-df.rename(columns={
-    'cha_id': 'channel_id',
-    'cha_lib': 'channel_name',
-    'cha_long': 'channel_length',
-    'mf1_hd': 'timestamp',
-    'mf1_debit': 'flow',
-    'mf1_taux': 'occupancy',
-    'mf1_vit': 'speed',
-    'tc1_temps': 'travel_time',
-    'couleur_tp': 'color_code',
-    'etat_trafic': 'traffic_state'
-}, inplace=True)
-print("   Renommé les colonnes.")
-
-# --- Convert timestamp to datetime ---
-print("   Conversion de la colonne timestamp en datetime...")
-df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce') # Coerce errors to NaT
-
-# --- Handle Invalid Placeholders (-1) ---
-print("   Gestion des espaces réservés non valides (-1) dans les colonnes numériques...")
-for col in ['flow', 'occupancy', 'speed', 'travel_time']:
-    if col in df.columns:
-         # Ensure column is numeric-like before replacing. Coerce errors.
-        df[col] = pd.to_numeric(df[col], errors='coerce')
+    # --- Rename columns cleanly ---
+    columns = {new: df[old] for old, new in column_renames.items()}
+    log("   Renommé les colonnes.")
+
+    # --- Convert timestamp to datetime (known format, local time: see parse_timestamps) ---
+    log("   Conversion de la colonne timestamp en datetime...")
+    columns['timestamp'] = parse_timestamps(columns['timestamp']) # Unparsable values become NaT
+
+    # --- Handle Invalid Placeholders (-1) ---
+    log("   Gestion des espaces réservés non valides (-1) dans les colonnes numériques...")
+    for col in ['flow', 'occupancy', 'speed', 'travel_time']:
+        # Ensure column is numeric-like before replacing. Coerce errors.
+        values = pd.to_numeric(columns[col], errors='coerce')
         # Replace -1 with NaN AFTER coercion, just in case -1 was a string
-        df[col] = df[col].replace(-1, np.nan)
-        print(f"      -> Remplacé -1 par NaN dans la colonne '{col}'.")
-
-# --- Handle potentially negative flow values ---
-# Decide if negative flow is invalid. Here we assume it is and keep only >= 0.
-if 'flow' in df.columns:
-    original_rows = len(df)
-    df = df[df['flow'] >= 0]
-    removed_rows = original_rows - len(df)
+        columns[col] = values.mask(values == -1)
+        log(f"      -> Remplacé -1 par NaN dans la colonne '{col}'.")
+
+    # --- Handle potentially negative flow values ---
+    # Decide if negative flow is invalid. Here we assume it is and keep only >= 0.
+    valid_flow = columns['flow'] >= 0
+    removed_rows = int((~valid_flow).sum())
     if removed_rows > 0:
-        print(f"   Supprimé {removed_rows} lignes avec un flux négatif (< 0).")
+        log(f"   Supprimé {removed_rows} lignes avec un flux négatif (< 0).")
+
+    # --- Drop rows with missing CRITICAL values ---
+    log(f"   Suppression des lignes avec des valeurs NaN dans les colonnes critiques: {critical_cols_for_na}...")
+    complete = valid_flow.copy()
+    for col in critical_cols_for_na:
+        complete &= columns[col].notna()
+    rows_dropped = int(valid_flow.sum() - complete.sum())
+    log(f"   -> Supprimé {rows_dropped} lignes en raison de valeurs critiques manquantes.")
+
+    # Single filtering pass over every column
+    keep = complete.to_numpy()
+    columns = {col: values[keep] for col, values in columns.items()}
 
-# --- Add time-related features ---
-print("   Ajout de fonctionnalités temporelles (heure, jour de la semaine, week-end)...")
-df['hour'] = df['timestamp'].dt.hour
-df['day_of_week'] = df['timestamp'].dt.day_name()
-df['is_weekend'] = df['day_of_week'].isin(['Saturday', 'Sunday'])
+    # --- Add time-related features (local time) ---
+    log("   Ajout de fonctionnalités temporelles (heure, jour de la semaine, week-end)...")
+    columns['hour'] = columns['timestamp'].dt.hour.astype('int8')
+    # Day of week is stored as an ordinal (0 = Monday), see trafic_schema.day_order
+    columns['day_of_week'] = columns['timestamp'].dt.dayofweek.astype('int8')
+    columns['is_weekend'] = columns['day_of_week'] >= 5
+    return pd.DataFrame(columns, copy=False)
 
-# --- Drop rows with missing CRITICAL values ---
-print(f"   Suppression des lignes avec des valeurs NaN dans les colonnes critiques: {critical_cols_for_na}...")
-initial_rows = len(df)
-df = df.dropna(subset=critical_cols_for_na)
-rows_dropped = initial_rows - len(df)
-print(f"   -> Supprimé {rows_dropped} lignes en raison de valeurs critiques manquantes.")
+def clean_traffic_table(table):
+    """
+    clean_traffic_data on an Arrow table typed by the pyarrow reader (raw_column_types), with
+    pyarrow compute functions: same rules, same rows, returned as a table in cleaned_batch_schema.
+    """
+    columns = {new: table[old] for old, new in column_renames.items()}
+    columns['timestamp'] = columns['timestamp'].cast(pa.timestamp('ns', tz=local_timezone))
+    # -1 is the placeholder for invalid measures
+    for col in ['flow', 'occupancy', 'speed', 'travel_time']:
+        columns[col] = pc.if_else(pc.equal(columns[col], -1), pa.scalar(None, pa.float64()), columns[col])
+    # Negative or missing flow, or a missing critical value: the row is dropped (null = not kept)
+    keep = pc.greater_equal(columns['flow'], 0)
+    for col in critical_cols_for_na:
+        keep = pc.and_(keep, pc.is_valid(columns[col]))
+    table = pa.table(columns).filter(keep)
+    timestamps = table['timestamp']  # local time: the components below are local too
+    day_of_week = pc.day_of_week(timestamps)
+    table = (table.append_column('hour', pc.hour(timestamps))
+                  .append_column('day_of_week', day_of_week)
+                  .append_column('is_weekend', pc.greater_equal(day_of_week, 5)))
+    return table.cast(cleaned_batch_schema)
 
-cleaning_elapsed = time.time() - cleaning_start_time
-print(f"✅ Nettoyage terminé. Temps écoulé: {cleaning_elapsed:.2f} secondes.")
+def clean_traffic_batch(chunk):
+    """
+    Cleans one chunk of raw rows (a DataFrame, or a pyarrow RecordBatch/Table with the
+    columns_to_keep) and returns the cleaned rows as a RecordBatch in cleaned_batch_schema
+    (ChannelDimension.encode then replaces the channel columns by channel_key).
+    Tables typed by the pyarrow reader are cleaned in Arrow (clean_traffic_table).
+    """
+    if isinstance(chunk, pa.Table) and chunk.schema.equals(raw_traffic_schema):
+        table = clean_traffic_table(chunk)
+        return pa.record_batch([column.combine_chunks() for column in table.columns], schema=cleaned_batch_schema)
+    if isinstance(chunk, (pa.RecordBatch, pa.Table)):
+        chunk = chunk.to_pandas()
+    cleaned_df = clean_traffic_data(chunk, verbose=False)
+    return pa.RecordBatch.from_pandas(cleaned_df, schema=cleaned_batch_schema, preserve_index=False)
 
 # ================================
 # 7. Part 4: Save Cleaned Data
 # ================================
-print("\n Métape 4: Sauvegarde des données nettoyées...")
+def dataset_partitions(dataset_path):
+    """(year, month, day) of every day partition of a dataset folder, in chronological order."""
+    return sorted(tuple(int(part.split('=')[1]) for part in os.path.relpath(folder, dataset_path).split(os.sep))
+                  for folder in glob.glob(os.path.join(glob.escape(dataset_path), 'year=*', 'month=*', 'day=*')))
 
-try:
-    df.to_parquet(cleaned_data_path, index=False)
-    print(f"✅ Ensemble de données nettoyées enregistré dans {cleaned_data_path}")
-except Exception as e:
-    print(f"❌ Erreur lors de la sauvegarde du fichier de données nettoyées: {e}")
-    print(f"   Veuillez vérifier que vous disposez des autorisations d'écriture et de la bibliothèque 'pyarrow' (pip install pyarrow).")
-    exit()
+def partition_files(folder):
+    """Part files of one day partition (without the staging and temporary files)."""
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if name.endswith('.parquet') and not name.startswith(('.', '_'))]
+
+def compact_partition(folder, run_id):
+    """
+    Merges the part files of one day partition into a single file sorted by channel_key then
+    timestamp, written with partition_row_group_rows-row groups (and their min/max statistics).
+    The new file is written under a temporary name and renamed before the old files are removed;
+    if the run was interrupted after the rename, only the removal is left to do.
+    """
+    files = sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.parquet'))
+    final_path = os.path.join(folder, f"part-{run_id}.parquet")
+    if final_path in files:
+        num_rows = pq.read_metadata(final_path).num_rows
+    else:
+        table = pa.concat_tables([pq.read_table(file, schema=cleaned_schema) for file in files])
+        table = table.unify_dictionaries().sort_by(partition_sort_keys)
+        temp_path = os.path.join(folder, f".part-{run_id}.parquet.tmp")
+        pq.write_table(table, temp_path, row_group_size=partition_row_group_rows,
+                       compression=parquet_compression, write_statistics=True)
+        os.replace(temp_path, final_path)
+        num_rows = table.num_rows
+    for file in files:
+        if file != final_path:
+            os.remove(file)
+    return num_rows
+
+def index_part_file(dataset_path, file, day_key):
+    """Channel index rows (trafic_schema.channel_index_schema) of one part file sorted by channel_key."""
+    keys = pq.ParquetFile(file).read(columns=['channel_key'])['channel_key'].to_numpy()
+    starts = np.flatnonzero(np.diff(keys, prepend=-1)) if len(keys) else np.array([], dtype='int64')
+    return pa.table({
+        'channel_key': keys[starts],
+        'day': np.full(len(starts), day_key, dtype='int32'),
+        'file': [os.path.relpath(file, dataset_path).replace(os.sep, '/')] * len(starts),
+        'row_start': starts.astype('int64'),
+        'row_count': np.diff(starts, append=len(keys)).astype('int32'),
+    }, schema=channel_index_schema)
+
+def write_channel_index_months(dataset_path, index_path, partitions):
+    """
+    Indexes the given day partitions into the month files of the channel index folder index_path:
+    the other days of these months are kept, each month file is written to a temporary file, then renamed.
+    """
+    os.makedirs(index_path, exist_ok=True)
+    months = {}
+    for year, month, day in partitions:
+        months.setdefault(year * 100 + month, []).append((year, month, day))
+    for month_key, days in sorted(months.items()):
+        month_path = channel_index_month_path(index_path, month_key)
+        day_keys = [year * 10000 + month * 100 + day for year, month, day in days]
+        pieces = [channel_index_schema.empty_table()]
+        if os.path.exists(month_path):
+            index = pq.read_table(month_path, schema=channel_index_schema)
+            pieces.append(index.filter(pc.invert(pc.is_in(index['day'], pa.array(day_keys, pa.int32())))))
+        for partition, day_key in zip(days, day_keys):
+            for file in partition_files(partition_dir(dataset_path, *partition)):
+                pieces.append(index_part_file(dataset_path, file, day_key))
+        # Sorted by channel: the row-group statistics let a lookup read only the groups of its channel
+        index = pa.concat_tables(pieces).sort_by([('channel_key', 'ascending'), ('day', 'ascending')])
+        temp_path = os.path.join(index_path, f".month-{month_key}.parquet.tmp")
+        pq.write_table(index, temp_path, row_group_size=partition_row_group_rows, compression=parquet_compression)
+        os.replace(temp_path, month_path)
+
+def update_channel_index(dataset_path, partitions):
+    """
+    Re-indexes the given day partitions in the channel index of the dataset: only the month files
+    of these days are rewritten. Without an index yet, every partition is indexed into a new
+    folder, which is then swapped in.
+    """
+    index_path = channel_index_path(dataset_path)
+    if os.path.isdir(index_path):
+        write_channel_index_months(dataset_path, index_path, partitions)
+        return
+    temp_path = index_path + '.tmp'
+    reset_cleaned_dataset(temp_path)
+    write_channel_index_months(dataset_path, temp_path, dataset_partitions(dataset_path))
+    replace_cleaned_dataset(temp_path, index_path)
+    # Single-file index written by an older version
+    reset_cleaned_dataset(os.path.join(dataset_path, '_channel_index.parquet'))
+
+class CleanedDataWriter:
+    """
+    Streams cleaned batches into the day partitions of the dataset (year=/month=/day=).
+    Batches are buffered up to row_group_rows rows; each flush appends one staging file per day
+    present in the buffer and adds the buffer to the run's aggregate cube (self.cube).
+    close() then compacts every partition touched by the run (see compact_partition),
+    so memory stays bounded by one buffer or one day partition.
+    The staging files start with '_', which pyarrow.dataset skips: readers of the dataset do not
+    see the rows of a run before its compaction.
+    """
+
+    def __init__(self, dataset_path, run_id, schema=cleaned_schema):
+        self.dataset_path = dataset_path
+        self.run_id = run_id
+        self.schema = schema
+        self.touched_partitions = set()
+        self.cube = None
+        self._staging_files = []
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def write_batch(self, batch):
+        self._buffer.append(batch)
+        self._buffered_rows += batch.num_rows
+        if self._buffered_rows >= row_group_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        table = pa.Table.from_batches(self._buffer, schema=self.schema)
+        day_keys = partition_day_keys(table)
+        for day_key in pc.unique(day_keys).to_pylist():
+            partition = (day_key // 10000, day_key // 100 % 100, day_key % 100)
+            folder = partition_dir(self.dataset_path, *partition)
+            os.makedirs(folder, exist_ok=True)
+            staging_path = os.path.join(folder, f"_staging-{self.run_id}-{len(self._staging_files)}.parquet")
+            pq.write_table(table.filter(pc.equal(day_keys, day_key)), staging_path, compression=parquet_compression)
+            self._staging_files.append(staging_path)
+            self.touched_partitions.add(partition)
+        # Aggregate cube of the rows written by this run (merged into the global cube by main)
+        self.cube = merge_cubes([self.cube, build_cube(table)])
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def close(self):
+        self.flush()
+        for partition in sorted(self.touched_partitions):
+            compact_partition(partition_dir(self.dataset_path, *partition), self.run_id)
+
+    def staging_paths(self):
+        """Staging files of this run found on disk (including those written after the last checkpoint)."""
+        return glob.glob(os.path.join(glob.escape(self.dataset_path), 'year=*', 'month=*', 'day=*',
+                                      f"_staging-{self.run_id}-*.parquet"))
+
+    def resume(self, staging_files, touched_partitions, cube):
+        """
+        Restores the state of an interrupted run at its last checkpoint (ProcessingCheckpoint):
+        the staging files written since then are deleted, their snapshots will be read again.
+        """
+        self._staging_files = list(staging_files)
+        self.touched_partitions = set(touched_partitions)
+        self.cube = cube
+        kept = set(self._staging_files)
+        for staging_path in self.staging_paths():
+            if staging_path not in kept:
+                os.remove(staging_path)
+
+    def discard(self):
+        """Deletes the staging files of this run (nothing usable was written)."""
+        for staging_path in self.staging_paths():
+            os.remove(staging_path)
+
+def write_ipc_day(files, ipc_file):
+    """
+    Writes the part files of one day partition as an uncompressed Arrow IPC file (temporary file,
+    then renamed). The dictionary columns are re-encoded on one dictionary per column, since it
+    cannot change between the batches of an IPC file. Returns the number of rows.
+    """
+    dataset = ds.dataset(files, format='parquet', schema=cleaned_schema)
+    dictionary_columns = [field.name for field in cleaned_schema if pa.types.is_dictionary(field.type)]
+    dictionaries = {}
+    for name in dictionary_columns:
+        values = [chunk.dictionary for chunk in dataset.to_table(columns=[name])[name].chunks]
+        dictionaries[name] = pc.unique(pa.concat_arrays(values)) if values else pa.array([], pa.string())
+
+    temp_path = os.path.join(os.path.dirname(ipc_file), '.' + os.path.basename(ipc_file) + '.tmp')
+    rows = 0
+    with pa.OSFile(temp_path, 'wb') as sink, pa.ipc.new_file(sink, cleaned_schema) as ipc_writer:
+        for batch in dataset.to_batches(columns=cleaned_schema.names):
+            columns = []
+            for field in cleaned_schema:
+                column = batch.column(field.name)
+                if field.name in dictionaries:
+                    # Old index -> index in the file's dictionary
+                    mapping = pc.index_in(column.dictionary, value_set=dictionaries[field.name])
+                    indices = pc.take(mapping, column.indices).cast(field.type.index_type)
+                    column = pa.DictionaryArray.from_arrays(indices, dictionaries[field.name])
+                columns.append(column)
+            ipc_writer.write_batch(pa.record_batch(columns, schema=cleaned_schema))
+            rows += batch.num_rows
+    os.replace(temp_path, ipc_file)
+    return rows
+
+def write_cleaned_ipc(dataset_path, ipc_path, partitions=None):
+    """
+    Writes the uncompressed Arrow IPC copy of the cleaned dataset into the folder ipc_path, one
+    file per day partition (day-YYYYMMDD.arrow: chronological order, memory-mapped together by
+    trafic_schema.read_cleaned_ipc). Only the given partitions are rewritten, every one by
+    default. Returns the number of rows written.
+    """
+    os.makedirs(ipc_path, exist_ok=True)
+    rows = 0
+    for year, month, day in (partitions if partitions is not None else dataset_partitions(dataset_path)):
+        files = partition_files(partition_dir(dataset_path, year, month, day))
+        if files:
+            rows += write_ipc_day(files, os.path.join(ipc_path, f"day-{year * 10000 + month * 100 + day}.arrow"))
+    return rows
+
+def update_cleaned_ipc(enabled, partitions=None):
+    """
+    Updates the Arrow IPC copy if enabled: only the files of the given day partitions (those of an
+    incremental run), or a whole new copy (full rebuild, or no copy in the current layout yet),
+    built aside and then swapped in. Otherwise removes it (it would be out of date).
+    """
+    if not enabled:
+        if os.path.exists(cleaned_ipc_path):
+            reset_cleaned_dataset(cleaned_ipc_path)
+            print(f"⚠️ Copie Arrow IPC obsolète supprimée ({cleaned_ipc_path}); relancez avec --arrow-ipc pour la recréer.")
+        return
+    print("\n Métape 4: Écriture de la copie Arrow IPC (mappée en mémoire par les analyses)...")
+    try:
+        ipc_start_time = time.time()
+        if partitions is not None and os.path.isdir(cleaned_ipc_path):
+            rows = write_cleaned_ipc(cleaned_data_path, cleaned_ipc_path, sorted(partitions))
+            written = f"{len(partitions)} jours réécrits"
+        else:
+            temp_path = cleaned_ipc_path + '.tmp'
+            reset_cleaned_dataset(temp_path)
+            rows = write_cleaned_ipc(cleaned_data_path, temp_path)
+            replace_cleaned_dataset(temp_path, cleaned_ipc_path)
+            written = "copie complète"
+        size = sum(os.path.getsize(file) for file in glob.glob(os.path.join(glob.escape(cleaned_ipc_path), '*.arrow')))
+        print(f"✅ Copie Arrow IPC enregistrée dans {cleaned_ipc_path} ({written}, {rows} lignes, {size / 1e6:.1f} MB au total, {time.time() - ipc_start_time:.2f} secondes).")
+    except Exception as e:
+        print(f"❌ Erreur lors de l'écriture de la copie Arrow IPC: {e}")
+        sys.exit(1)
+
+# ================================
+# 8. Checkpoints (resumable runs)
+# ================================
+class ProcessingCheckpoint:
+    """
+    State of a run saved in checkpoint_dir, so that a run killed partway through (crash,
+    MemoryError, Ctrl+C) is resumed by the next one instead of starting again from the first
+    snapshot:
+      - raw_files.json / manifest.parquet: the snapshots selected for the run, and the manifest
+        entries to record once the run is complete,
+      - checkpoint.json: run id and mode, how many snapshots are ingested, the staging files and
+        partitions written so far, the counters and the stage reached ('ingest', 'compact' then
+        'publish'),
+      - channels-<n>.parquet / cube-<n>.parquet: channel dimension and aggregate cube of the run
+        at checkpoint n.
+    checkpoint.json is written last (temporary file, then renamed) and names the files of its
+    checkpoint: a run interrupted while saving a checkpoint resumes from the previous one.
+    """
+
+    def __init__(self, folder, state, raw_files):
+        self.folder = folder
+        self.state = state
+        self.raw_files = raw_files
+
+    @classmethod
+    def start(cls, folder, run_id, incremental, dataset_path, raw_files, manifest_entries):
+        """Starts the checkpoints of a new run (replaces any previous ones); see save() for the first one."""
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+        with open(os.path.join(folder, 'raw_files.json'), 'w', encoding='utf-8') as f:
+            json.dump(list(raw_files), f)
+        save_manifest(manifest_entries, os.path.join(folder, 'manifest.parquet'))
+        return cls(folder, {'run_id': run_id, 'incremental': incremental, 'dataset_path': dataset_path,
+                            'files_done': 0, 'stage': 'ingest', 'sequence': 0, 'has_cube': False,
+                            'cube_merged': False, 'staging_files': [], 'touched_partitions': [], 'stats': {}},
+                   list(raw_files))
+
+    @classmethod
+    def load(cls, folder):
+        """Last checkpoint of an interrupted run, or None."""
+        path = os.path.join(folder, 'checkpoint.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        with open(os.path.join(folder, 'raw_files.json'), encoding='utf-8') as f:
+            return cls(folder, state, json.load(f))
+
+    def _path(self, name, sequence=None):
+        return os.path.join(self.folder, f"{name}-{self.state['sequence'] if sequence is None else sequence}.parquet")
+
+    def save(self, writer, dimension, stats, files_done=None, stage=None, cube=None):
+        """
+        Records a checkpoint: everything ingested so far must be on disk (writer flushed).
+        cube, if given, replaces the run's cube by the final cube of the dataset (cube_merged).
+        """
+        previous = self.state['sequence']
+        sequence = previous + 1
+        pq.write_table(dimension.to_table(), self._path('channels', sequence), compression=parquet_compression)
+        cube_merged = self.state['cube_merged'] or cube is not None
+        cube = cube if cube is not None else writer.cube
+        if cube is not None:
+            pq.write_table(cube, self._path('cube', sequence), compression=parquet_compression)
+        state = dict(self.state, sequence=sequence, has_cube=cube is not None, cube_merged=cube_merged,
+                     staging_files=list(writer._staging_files),
+                     touched_partitions=sorted(list(partition) for partition in writer.touched_partitions),
+                     stats={key: value for key, value in stats.items() if key != 'sample'})
+        if files_done is not None:
+            state['files_done'] = files_done
+        if stage is not None:
+            state['stage'] = stage
+        temp_path = os.path.join(self.folder, 'checkpoint.json.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=1)
+        os.replace(temp_path, os.path.join(self.folder, 'checkpoint.json'))
+        self.state = state
+        for name in ('channels', 'cube'):
+            if os.path.exists(self._path(name, previous)):
+                os.remove(self._path(name, previous))
+
+    def restore(self, writer):
+        """
+        Channel dimension and counters at the last checkpoint; the writer is restored with
+        CleanedDataWriter.resume, and holds the cube of the run (or the final cube if cube_merged).
+        """
+        cube = pq.read_table(self._path('cube')) if self.state['has_cube'] else None
+        writer.resume(self.state['staging_files'], [tuple(partition) for partition in self.state['touched_partitions']],
+                      cube)
+        dimension = ChannelDimension(pq.read_table(self._path('channels'), schema=channel_schema))
+        return dimension, dict(new_ingest_stats(), **self.state['stats'])
+
+    def manifest(self):
+        return pd.read_parquet(os.path.join(self.folder, 'manifest.parquet'))
+
+    def remove(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+# ================================
+# 9. Watch Mode
+# ================================
+def scan_raw_files(folder_path):
+    """(size, mtime) of every raw CSV snapshot of the archive folder, by path (one directory listing, no read)."""
+    snapshots = {}
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.name.endswith('.csv') and entry.is_file():
+                stat = entry.stat()
+                snapshots[os.path.join(folder_path, entry.name)] = (stat.st_size, stat.st_mtime)
+    return snapshots
+
+def ingested_snapshots():
+    """(size, mtime) of the snapshots recorded in the manifest, by path."""
+    manifest = load_manifest(manifest_path)
+    return dict(zip(manifest['path'], zip(manifest['size'], manifest['mtime'])))
+
+def watch(args):
+    """
+    Long-running mode: scans the archive folder every args.poll_interval seconds and runs an
+    incremental pass (process) as soon as a new or modified snapshot is complete, i.e. has the
+    same size and mtime on two consecutive scans and was last modified watch_settle_seconds ago.
+    The first pass catches up with the snapshots added while the watcher was stopped (or resumes
+    an interrupted run). Between snapshots only the folder listing is read, and each pass
+    releases its memory before the next one. A snapshot whose pass failed is not read again
+    until it changes; the interrupted pass is resumed from its checkpoint by the next one.
+    """
+    args.incremental = True
+    print(f"👀 Surveillance de {raw_folder_path} (scan toutes les {args.poll_interval} s, Ctrl+C pour arrêter)...")
+    ingested = ingested_snapshots()
+    previous_scan = None
+    try:
+        while True:
+            scan = scan_raw_files(raw_folder_path) if os.path.isdir(raw_folder_path) else {}
+            settled = time.time() - watch_settle_seconds
+            changed = {path for path, entry in scan.items() if ingested.get(path) != entry}
+            ready = {path for path in changed
+                     if scan[path][1] <= settled and (previous_scan is None or previous_scan.get(path) == scan[path])}
+            if ready or previous_scan is None:
+                if ready and previous_scan is not None:
+                    print(f"\n🔔 {len(ready)} nouveau(x) snapshot(s): {', '.join(os.path.basename(path) for path in sorted(ready))}")
+                failed = False
+                try:
+                    # Only the snapshots of this scan, without those still being written
+                    process(args, snapshot_files=[path for path in scan if path not in changed or path in ready])
+                except SystemExit as e:
+                    failed = bool(e.code)
+                except Exception as e:
+                    print(f"❌ Erreur pendant la passe: {e}")
+                    failed = True
+                args.restart = False
+                ingested = ingested_snapshots()
+                if failed:
+                    print("⚠️ Passe interrompue; elle sera reprise au prochain snapshot.")
+                    ingested.update({path: scan[path] for path in ready})
+                pa.default_memory_pool().release_unused()
+            previous_scan = scan
+            time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        print("\n🛑 Surveillance arrêtée.")
 
 # ================================
-# 8. Final Summary
+# 10. Main
 # ================================
-total_elapsed = time.time() - start_time
-print("\n================ Résumé Final ================")
-print(f"✅ Chargé et traité {len(raw_files)} fichiers CSV bruts.")
-print(f"✅ Fichier maître de coordonnées créé avec {len(master_coords)} canaux uniques.")
-print(f"✅ Ensemble de données final nettoyé contient {len(df)} lignes.")
-print("\nÉchantillon de données nettoyées:")
-print(df.head())
-print("\nInformations sur l'ensemble de données nettoyées:")
-df.info()
-print(f"\n⏱️ Temps total de traitement: {total_elapsed:.2f} secondes.")
-print("🎉 Traitement terminé avec succès!")
\ No newline at end of file
+def parse_args():
+    parser = argparse.ArgumentParser(description="Consolide et nettoie les snapshots CSV bruts du trafic de Nantes.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="N'ingère que les snapshots nouveaux ou modifiés (d'après le manifeste) et les ajoute au jeu de données existant.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help=f"Nombre de processus pour lire et nettoyer les snapshots en parallèle (défaut: 1, cette machine: {os.cpu_count()}).")
+    parser.add_argument('--chunk-size', type=int, default=chunk_rows,
+                        help=f"Nombre de lignes CSV lues et nettoyées à la fois (défaut: {chunk_rows}); borne la mémoire utilisée.")
+    parser.add_argument('--arrow-ipc', action='store_true',
+                        help="Écrit aussi une copie Arrow IPC non compressée du jeu de données, chargée par mappage mémoire (chargement quasi instantané, mémoire partagée entre processus).")
+    parser.add_argument('--reader', choices=sorted(raw_readers), default='pandas',
+                        help="Lecteur des snapshots CSV: 'pandas' (défaut) ou 'pyarrow' (pyarrow.csv: colonnes typées, parsing multithread, pas d'objets Python).")
+    parser.add_argument('--checkpoint-files', type=int, default=checkpoint_files,
+                        help=f"Nombre de snapshots ingérés entre deux points de reprise (défaut: {checkpoint_files}); une exécution interrompue reprend au dernier.")
+    parser.add_argument('--restart', action='store_true',
+                        help="Abandonne l'exécution interrompue au lieu de la reprendre à son dernier point de reprise.")
+    parser.add_argument('--watch', action='store_true',
+                        help="Reste actif et ingère chaque nouveau snapshot du dossier d'archive dès qu'il est complet (mode incrémental).")
+    parser.add_argument('--poll-interval', type=float, default=watch_poll_seconds,
+                        help=f"Avec --watch: secondes entre deux scans du dossier d'archive (défaut: {watch_poll_seconds}).")
+    return parser.parse_args()
+
+def start_run(args, run_id, force_full=False, snapshot_files=None):
+    """
+    Decides what the run has to ingest (full rebuild or only the new/changed snapshots among
+    snapshot_files, by default every snapshot of the archive folder) and records its first
+    checkpoint. Returns (checkpoint, writer, dimension, stats), or None if there is nothing to ingest.
+    """
+    incremental = args.incremental and not force_full
+    if incremental and not (os.path.exists(manifest_path) and os.path.isdir(cleaned_data_path)):
+        print("⚠️ Pas de manifeste ou de jeu de données existant: reconstruction complète.")
+        incremental = False
+    if incremental and not (is_partitioned_dataset(cleaned_data_path) and has_cleaned_schema(cleaned_data_path)):
+        print("⚠️ Le jeu de données existant a été écrit avec un ancien schéma ou format: reconstruction complète.")
+        incremental = False
+    if incremental and not os.path.exists(channels_path):
+        print("⚠️ Table de dimension des canaux absente: reconstruction complète.")
+        incremental = False
+    dimension = ChannelDimension(read_channel_dimension(channels_path) if incremental else None)
+    if incremental and not dimension.has_last_seen():
+        # The existing rows were written without deduplication: rebuilt once to drop their repeats
+        print("⚠️ La dimension des canaux ne contient pas le dernier horodatage de chaque canal (ancienne version): reconstruction complète.")
+        incremental = False
+        dimension = ChannelDimension()
+
+    all_raw_files = list_raw_files(raw_folder_path) if snapshot_files is None else sorted(snapshot_files)
+    if not all_raw_files:
+        print(f"❌ Erreur: Aucun fichier CSV trouvé dans {raw_folder_path}")
+        sys.exit(1)
+
+    manifest = load_manifest(manifest_path) if incremental else pd.DataFrame(columns=manifest_columns)
+    raw_files, manifest_entries = select_files_to_process(all_raw_files, manifest)
+    if incremental and not set(raw_files).isdisjoint(manifest['path']):
+        # A modified snapshot repeats measurements stored from other snapshots: only a rebuild keeps, as
+        # always, the first snapshot's value of each (channel, timestamp), whatever the order of the runs
+        print("⚠️ Des snapshots déjà ingérés ont changé: reconstruction complète.")
+        incremental = False
+        dimension = ChannelDimension()
+        raw_files, manifest_entries = select_files_to_process(all_raw_files, pd.DataFrame(columns=manifest_columns))
+    print(f"🔍 Trouvé {len(all_raw_files)} fichiers CSV bruts, dont {len(raw_files)} à ingérer.")
+
+    if not raw_files:
+        if not manifest_entries.empty:
+            save_manifest_entries(manifest_entries, manifest_path, run_id)
+        print("✅ Aucun nouveau snapshot à ingérer, le jeu de données est à jour.")
+        if args.arrow_ipc and not os.path.exists(cleaned_ipc_path):
+            update_cleaned_ipc(True)
+        return None
+
+    # A full rebuild is written next to the current dataset, which is only replaced once complete
+    dataset_path = cleaned_data_path if incremental else cleaned_data_path + '.tmp'
+    try:
+        if not incremental:
+            reset_cleaned_dataset(dataset_path)
+        os.makedirs(dataset_path, exist_ok=True)
+        writer = CleanedDataWriter(dataset_path, run_id)
+        checkpoint = ProcessingCheckpoint.start(checkpoint_dir, run_id, incremental, dataset_path, raw_files,
+                                                manifest_entries)
+        stats = new_ingest_stats()
+        checkpoint.save(writer, dimension, stats)
+    except Exception as e:
+        print(f"❌ Erreur lors de la création du fichier de données nettoyées: {e}")
+        print(f"   Veuillez vérifier que vous disposez des autorisations d'écriture et de la bibliothèque 'pyarrow' (pip install pyarrow).")
+        sys.exit(1)
+    return checkpoint, writer, dimension, stats
+
+def resume_run(checkpoint):
+    """Writer, channel dimension and counters of an interrupted run, at its last checkpoint."""
+    writer = CleanedDataWriter(checkpoint.state['dataset_path'], checkpoint.state['run_id'])
+    dimension, stats = checkpoint.restore(writer)
+    return writer, dimension, stats
+
+def abandon_run(checkpoint):
+    """
+    Discards an interrupted run (--restart): its staging files or its rebuilt dataset are deleted.
+    Returns True if the dataset in place may already hold part of its rows, i.e. if the run had
+    started compacting an incremental dataset or replacing the dataset (then it has to be rebuilt).
+    """
+    state = checkpoint.state
+    if state['incremental']:
+        CleanedDataWriter(state['dataset_path'], state['run_id']).discard()
+    else:
+        reset_cleaned_dataset(state['dataset_path'])
+    checkpoint.remove()
+    return (state['incremental'] and state['stage'] != 'ingest') or state['stage'] == 'publish'
+
+def process(args, snapshot_files=None):
+    """
+    One processing run (full rebuild, incremental, or the resumption of an interrupted run).
+    snapshot_files restricts the run to these snapshots (see watch); by default the archive folder is listed.
+    """
+    start_time = time.time()
+
+    # --- Resume an interrupted run, or decide what has to be ingested ---
+    checkpoint = ProcessingCheckpoint.load(checkpoint_dir)
+    force_full = False
+    if checkpoint is not None and args.restart:
+        force_full = abandon_run(checkpoint)
+        print(f"🗑️ Exécution interrompue {checkpoint.state['run_id']} abandonnée.")
+        if force_full:
+            print("⚠️ Elle avait déjà commencé à modifier le jeu de données: reconstruction complète.")
+        checkpoint = None
+    if checkpoint is not None:
+        state = checkpoint.state
+        print(f"♻️ Reprise de l'exécution interrompue {state['run_id']} ({'incrémental' if state['incremental'] else 'reconstruction complète'}): "
+              f"{state['files_done']}/{len(checkpoint.raw_files)} snapshots déjà ingérés, étape '{state['stage']}'"
+              " (--restart pour l'abandonner).")
+        writer, dimension, stats = resume_run(checkpoint)
+    else:
+        # Microseconds: the passes of --watch can start within the same second, and compact_partition
+        # takes an existing part-<run_id> file for the output of an interrupted compaction
+        started = start_run(args, datetime.now().strftime('%Y%m%dT%H%M%S%f'), force_full, snapshot_files)
+        if started is None:
+            return
+        checkpoint, writer, dimension, stats = started
+    incremental = checkpoint.state['incremental']
+    raw_files = checkpoint.raw_files
+
+    # --- Part 1: Read, clean and write the snapshots (single pass, streamed, checkpointed) ---
+    if checkpoint.state['stage'] == 'ingest':
+        print(f"\n Métape 1: Lecture et nettoyage des snapshots bruts ({args.workers} processus, lecteur {args.reader})...")
+        read_start_time = time.time()
+        for first in range(checkpoint.state['files_done'], len(raw_files), args.checkpoint_files):
+            batch_files = raw_files[first:first + args.checkpoint_files]
+            ingest_raw_files(batch_files, writer, dimension, args.workers, args.chunk_size, args.reader, stats)
+            # Everything ingested so far is on disk: a run interrupted from now on resumes after these snapshots
+            writer.flush()
+            checkpoint.save(writer, dimension, stats, files_done=first + len(batch_files))
+            print(f"   ... traité {first + len(batch_files)}/{len(raw_files)} fichiers (point de reprise enregistré)")
+        if stats['processed_files'] == 0:
+            writer.discard()
+            checkpoint.remove()
+            print("❌ Erreur: Aucune donnée de trafic n'a pu être lue.")
+            sys.exit(1)
+        checkpoint.save(writer, dimension, stats, stage='compact')
+        print(f"   -> {stats['rows_read']} lignes brutes lues, {stats['rows_kept']} conservées après nettoyage et dédoublonnage"
+              f" ({stats['rows_repeated']} mesures répétées d'un snapshot à l'autre ignorées).")
+        if stats['rows_older']:
+            print(f"⚠️ {stats['rows_older']} mesures antérieures à la dernière mesure ingérée de leur canal ont été ignorées"
+                  " (snapshot plus ancien ajouté après coup?); relancez sans --incremental pour les intégrer.")
+        print(f"   -> Temps écoulé pour la lecture et le nettoyage: {time.time() - read_start_time:.2f} secondes.")
+
+    # --- Compaction of the day partitions; a full rebuild then replaces the previous dataset ---
+    if checkpoint.state['stage'] == 'compact':
+        try:
+            writer.close()
+            update_channel_index(writer.dataset_path, writer.touched_partitions)
+            if not incremental:
+                replace_cleaned_dataset(writer.dataset_path, cleaned_data_path)
+            checkpoint.save(writer, dimension, stats, stage='publish')
+        except Exception as e:
+            print(f"❌ Erreur lors de l'écriture des partitions du jeu de données: {e}")
+            print("   Relancez le script pour reprendre à partir du dernier point de reprise.")
+            sys.exit(1)
+        print(f"✅ Ensemble de données nettoyées enregistré dans {cleaned_data_path} ({len(writer.touched_partitions)} partitions journalières mises à jour)")
+
+    # --- Part 2: Channel dimension and coordinates ---
+    print("\n Métape 2: Enregistrement de la dimension des canaux et du fichier de coordonnées maîtres...")
+    # The rows just written reference the channel keys: the dimension is saved first
+    try:
+        dimension.save(channels_path)
+        print(f"✅ Dimension des canaux enregistrée dans {channels_path} ({len(dimension)} canaux).")
+    except Exception as e:
+        print(f"❌ Erreur lors de l'enregistrement de la dimension des canaux: {e}")
+        sys.exit(1)
+    master_coords = dimension.coordinate_mapping()
+    if master_coords.empty:
+        print("❌ Erreur: Aucune donnée de coordonnées n'a pu être extraite des fichiers.")
+        sys.exit(1)
+
+    # Save the master coordinate file using Parquet
+    try:
+        temp_path = coordinate_mapping_path + '.tmp'
+        master_coords.to_parquet(temp_path, index=False)
+        os.replace(temp_path, coordinate_mapping_path)
+        print(f"✅ Fichier maître de coordonnées enregistré dans {coordinate_mapping_path}")
+        print(f"   -> {len(master_coords)} entrées uniques de coordonnées de canaux trouvées.")
+    except Exception as e:
+        print(f"❌ Erreur lors de l'enregistrement du fichier de coordonnées maître: {e}")
+        print(f"   Veuillez vérifier que vous disposez des autorisations d'écriture et de la bibliothèque 'pyarrow' (pip install pyarrow).")
+        sys.exit(1)
+
+    # --- Part 3: Aggregate cube (one file per date: an incremental run only rewrites the dates of its rows) ---
+    print("\n Métape 3: Mise à jour du cube d'agrégats (canal x date x heure)...")
+    try:
+        # Written as a whole by a full rebuild, or if the cube is missing or a single file (older version)
+        full_cube = not incremental or not os.path.isdir(aggregate_cube_path)
+        if checkpoint.state['cube_merged']:
+            cube = writer.cube  # final cube (of the run's dates), restored from the checkpoint
+        else:
+            if not incremental or writer.cube is None:
+                cube = writer.cube
+            elif not full_cube:
+                day_keys = pc.unique(cube_day_keys(writer.cube)).to_pylist()
+                cube = merge_cubes([read_cube(aggregate_cube_path, day_keys), writer.cube])
+            elif os.path.exists(aggregate_cube_path):
+                cube = merge_cubes([read_cube(aggregate_cube_path), writer.cube])
+            else:
+                print("   Cube absent: calcul à partir de l'ensemble du jeu de données...")
+                cube = build_cube_from_dataset(cleaned_data_path)
+            # Recorded before it replaces the cube files, so that a resumed run does not merge the run's cube twice
+            checkpoint.save(writer, dimension, stats, cube=cube)
+        if full_cube:
+            temp_path = aggregate_cube_path + '.tmp'
+            reset_cleaned_dataset(temp_path)
+            write_cube_days(cube, temp_path, parquet_compression)
+            replace_cleaned_dataset(temp_path, aggregate_cube_path)
+        else:
+            write_cube_days(cube, aggregate_cube_path, parquet_compression)
+        cube_dates = pc.count_distinct(cube['date']).as_py() if cube is not None else 0
+        print(f"✅ Cube d'agrégats enregistré dans {aggregate_cube_path} ({cube.num_rows if cube is not None else 0} lignes"
+              f" {'sur' if full_cube else 'réécrites sur'} {cube_dates} dates).")
+    except Exception as e:
+        print(f"❌ Erreur lors de la mise à jour du cube d'agrégats: {e}")
+        sys.exit(1)
+
+    # --- Part 4: Arrow IPC copy (optional; an incremental run only rewrites the days it added rows to) ---
+    update_cleaned_ipc(args.arrow_ipc, writer.touched_partitions if incremental else None)
+
+    # The manifest is only written once the data is safely on disk; the run is then complete
+    save_manifest_entries(checkpoint.manifest(), manifest_path, checkpoint.state['run_id'], replace=not incremental)
+    checkpoint.remove()
+
+    # --- Final Summary ---
+    total_elapsed = time.time() - start_time
+    print("\n================ Résumé Final ================")
+    print(f"✅ Chargé et traité {stats['processed_files']}/{len(raw_files)} fichiers CSV bruts ({'incrémental' if incremental else 'reconstruction complète'}).")
+    print(f"✅ Fichier maître de coordonnées créé avec {len(master_coords)} canaux uniques.")
+    print(f"✅ {stats['rows_kept']} lignes nettoyées ajoutées au jeu de données.")
+    if not args.watch:
+        if stats['sample'] is not None:
+            print("\nÉchantillon de données nettoyées:")
+            print(stats['sample'])
+        print("\nSchéma de l'ensemble de données nettoyées:")
+        print(cleaned_schema)
+    print(f"\n⏱️ Temps total de traitement: {total_elapsed:.2f} secondes.")
+    print("🎉 Traitement terminé avec succès!")
+
+def main():
+    args = parse_args()
+    print("🚀 Starting Traffic Data Processing...")
+    if args.watch:
+        watch(args)
+    else:
+        process(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# ============================
+# trafic_report.py
+# ============================
+# Headless batch report: loads the data once, computes every aggregate used by the temporal,
+# spatial and heatmap figures, and writes all the PNGs plus the Folium HTML map to results/
+# without opening any window (Agg backend), e.g. from a cron job.
+# The figures are independent, so they are drawn in parallel worker processes.
+#
+# Usage:
+#   python trafic_report.py [--workers N] [--folium-mode points|tiles|animated|none] [--dpi 100]
+
+import os
+import sys
+import time
+import argparse
+import runpy
+from multiprocessing import Pool
+
+import matplotlib
+matplotlib.use('Agg')  # headless: no window, figures are only saved
+import matplotlib.pyplot as plt
+
+import trafic_figures as figures
+from trafic_aggregates import cube_mean, cube_stats, day_of_week_mean, top_channels
+from trafic_data_access import (channels_path, cleaned_data_path, results_dir, join_coordinates, load_channels,
+                                load_cube, require_file)
+from trafic_density import density_grid
+
+# --- Density heatmap parameters (as in trafic_heatmap.py) ---
+density_levels = 50
+density_bw_adjust = 0.2
+density_gridsize = 200
+
+folium_script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trafic_heatmap_folium.py')
+
+
+# ============================
+# Helper Functions
+# ============================
+def build_figure_tasks(cube, channels):
+    """Computes the aggregates of every report figure: list of (file name, figure function, args)."""
+    tasks = [
+        (figures.hourly_flow_png, figures.figure_hourly_flow, (cube_mean(cube, 'hour', 'flow'),)),
+        (figures.weekday_weekend_png, figures.figure_weekday_weekend,
+         (cube_mean(cube[~cube['is_weekend']], 'hour', 'flow'), cube_mean(cube[cube['is_weekend']], 'hour', 'flow'))),
+        (figures.day_of_week_png, figures.figure_day_of_week, (day_of_week_mean(cube, 'flow'),)),
+        (figures.top_congested_png, figures.figure_top_congested, (top_channels(cube, 'flow', 10, ascending=False),)),
+        (figures.top_fastest_png, figures.figure_top_fastest, (top_channels(cube, 'speed', 10, ascending=False),)),
+        (figures.top_slowest_png, figures.figure_top_slowest, (top_channels(cube, 'speed', 10, ascending=True),)),
+    ]
+    # Density heatmap: one point per channel, as in trafic_heatmap.py
+    points = cube_stats(cube, 'channel_key', 'flow')[['count', 'sum', 'sumsq']].reset_index()
+    points, _ = join_coordinates(points, channels, weight_column='sum')
+    if not points.empty:
+        grid = density_grid(points['longitude'], points['latitude'], weights=points['sum'],
+                            weights_sumsq=points['sumsq'], counts=points['count'],
+                            bw_adjust=density_bw_adjust, gridsize=density_gridsize)
+        tasks.append((figures.density_heatmap_png, figures.figure_density_heatmap, grid + (density_levels,)))
+    else:
+        print("⚠️ Skipping density heatmap: no channel with coordinates.")
+    return tasks
+
+
+def render_figure(task, output_dir, dpi):
+    """Draws one figure and saves it as PNG. Returns (file name, seconds)."""
+    t0 = time.perf_counter()
+    name, figure_function, args = task
+    fig = figure_function(*args)
+    fig.savefig(os.path.join(output_dir, name), dpi=dpi)
+    plt.close(fig)
+    return name, time.perf_counter() - t0
+
+
+def render_folium_map(mode):
+    """Runs trafic_heatmap_folium.py in this process (it reuses the cube already loaded here)."""
+    saved_argv = sys.argv
+    sys.argv = [folium_script_path, '--mode', mode]
+    try:
+        # Not run as '__main__': the pool pickles render_figure by reference to this module meanwhile
+        runpy.run_path(folium_script_path, run_name='trafic_heatmap_folium')
+        return True
+    except SystemExit as e:
+        return not e.code
+    finally:
+        sys.argv = saved_argv
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate every report figure (PNG) and the interactive map, headless.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help=f"Number of processes drawing the figures in parallel (default: {os.cpu_count()}).")
+    parser.add_argument('--folium-mode', choices=['points', 'tiles', 'animated', 'none'], default='points',
+                        help="Mode of the interactive map (see trafic_heatmap_folium.py), or 'none' to skip it.")
+    parser.add_argument('--dpi', type=int, default=100, help="Resolution of the PNG files (default: 100).")
+    return parser.parse_args()
+
+
+# ============================
+# Main
+# ============================
+def main():
+    args = parse_args()
+    print("🚀 Starting Headless Report Generation...")
+    start_time = time.time()
+
+    # 1. Load the data once
+    require_file(cleaned_data_path, "Cleaned data file")
+    require_file(channels_path, "Channel dimension file")
+    cube = load_cube()
+    channels = load_channels()
+    print(f"✅ Loaded {len(cube)} cube rows and {len(channels)} channels.")
+
+    # 2. Compute every aggregate
+    tasks = build_figure_tasks(cube, channels)
+    print(f"📊 Computed the aggregates of {len(tasks)} figures in {time.time() - start_time:.2f} seconds.")
+
+    # 3. Draw the figures (in parallel) and the interactive map (in this process, meanwhile)
+    os.makedirs(results_dir, exist_ok=True)
+    workers = min(args.workers, len(tasks))
+    pool = Pool(processes=workers) if workers > 1 else None
+    try:
+        figure_args = [(task, results_dir, args.dpi) for task in tasks]
+        pending = pool.starmap_async(render_figure, figure_args) if pool else None
+        map_ok = True
+        if args.folium_mode != 'none':
+            print(f"\n🗺️ Rendering the interactive map ({args.folium_mode})...")
+            map_ok = render_folium_map(args.folium_mode)
+        results = pending.get() if pool else [render_figure(*task_args) for task_args in figure_args]
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    print(f"\n💾 Saved {len(results)} figures to: {results_dir}")
+    for name, seconds in results:
+        print(f"   - {name} ({seconds:.2f}s)")
+    if not map_ok:
+        print("❌ The interactive map could not be generated (see the messages above).")
+
+    end_time = time.time()
+    print(f"\n⏱️ Total time: {end_time - start_time:.2f} seconds.")
+    if not map_ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+# ============================
+# trafic_schema.py
+# ============================
+# Schema of cleaned_traffic_data.parquet, shared by the processing script (writer)
+# and the analysis scripts (loader).
+#
+# On disk, the dataset is hive-partitioned by day (year=YYYY/month=M/day=D/, local dates) and each
+# partition is sorted by channel_key then timestamp, so the row-group statistics let pyarrow skip
+# the files and row groups outside a time range or channel list (see load_cleaned_data).
+#
+# The channels are described once in a dimension table (channels.parquet, next to the dataset):
+# one row per sensor (cha_id) with a dense integer channel_key = its row number, its name, length
+# and coordinates. The measurement rows only store channel_key, so grouping by channel is an
+# integer operation and the channel attributes are fetched by array indexing (dimension row
+# channel_key) instead of joins on the street names.
+#
+# A channel index (_channel_index/, inside the dataset folder) records, for every channel and day
+# partition, where the channel's rows are in the sorted part file: the time series of one channel is
+# read without scanning the dataset (see read_channel_series).
+#
+# Timestamps are stored in local time (Europe/Paris): hour, day_of_week, the partition days and the
+# cube dates follow the clock of the city, including across the DST changes.
+#
+# traffic_state is dictionary-encoded, day_of_week is stored as an ordinal (0 = Monday ...
+# 6 = Sunday) and the measures as float32, which keeps both the file and the loaded DataFrame small.
+#
+# The processing script can also write an uncompressed Arrow IPC copy (cleaned_traffic_data.arrow,
+# one file per day): it is memory-mapped instead of decoded, so loading is almost instant and the
+# processes reading it share one copy of the data in the OS page cache (see read_cleaned_ipc).
+
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# --- Time zone of the timestamps and of the time features (hour, day_of_week, days) ---
+local_timezone = 'Europe/Paris'
+
+# --- Day names, in ordinal order (pandas' dt.dayofweek: Monday=0) ---
+day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# --- Schema of the cleaned rows produced by the cleaning step (before the channel dimension) ---
+cleaned_batch_schema = pa.schema([
+    ('channel_id', pa.int32()),
+    ('channel_name', pa.dictionary(pa.int32(), pa.string())),
+    ('channel_length', pa.int32()),
+    ('timestamp', pa.timestamp('ns', tz=local_timezone)),
+    ('flow', pa.float32()),
+    ('occupancy', pa.float32()),
+    ('speed', pa.float32()),
+    ('travel_time', pa.float32()),
+    ('color_code', pa.int8()),
+    ('traffic_state', pa.dictionary(pa.int8(), pa.string())),
+    ('hour', pa.int8()),
+    ('day_of_week', pa.int8()),
+    ('is_weekend', pa.bool_()),
+])
+
+# --- Schema of the channel dimension table (row i describes channel_key i) ---
+channel_schema = pa.schema([
+    ('channel_key', pa.int32()),
+    ('channel_id', pa.int32()),
+    ('channel_name', pa.string()),  # latest name seen for the sensor
+    ('channel_length', pa.int32()),
+    ('longitude', pa.float64()),
+    ('latitude', pa.float64()),
+    ('last_timestamp', pa.timestamp('ns', tz=local_timezone)),  # latest measurement ingested (deduplication)
+])
+# Columns of the dimension that load_cleaned_data can attach to the measurement rows
+channel_attribute_columns = ['channel_id', 'channel_name', 'channel_length', 'longitude', 'latitude']
+
+# --- Schema of the cleaned dataset ---
+# Every batch is cast to this schema, so part files written by different runs/workers always match.
+cleaned_schema = pa.schema([
+    ('channel_key', pa.int32()),    # row of the channel dimension table
+    ('timestamp', pa.timestamp('ns', tz=local_timezone)),
+    ('flow', pa.float32()),         # float32 is exact for counts below 16 million
+    ('occupancy', pa.float32()),
+    ('speed', pa.float32()),
+    ('travel_time', pa.float32()),
+    ('color_code', pa.int8()),
+    ('traffic_state', pa.dictionary(pa.int8(), pa.string())),
+    ('hour', pa.int8()),
+    ('day_of_week', pa.int8()),     # ordinal, see day_order
+    ('is_weekend', pa.bool_()),
+])
+
+# --- Hive partitioning of the cleaned dataset (by local day of the measurement timestamp) ---
+partition_schema = pa.schema([('year', pa.int16()), ('month', pa.int8()), ('day', pa.int8())])
+cleaned_partitioning = ds.partitioning(partition_schema, flavor='hive')
+
+# --- Sort order inside each partition (clusters a channel's rows in few row groups) ---
+partition_sort_keys = [('channel_key', 'ascending'), ('timestamp', 'ascending')]
+
+# --- Channel index of a partitioned dataset: one row per (channel, day partition) ---
+# Stored as one file per month (month-YYYYMM.parquet), so a run only rewrites the months it adds
+# days to. The folder name starts with '_': pyarrow.dataset does not take its files for part files.
+channel_index_name = '_channel_index'
+channel_index_schema = pa.schema([
+    ('channel_key', pa.int32()),
+    ('day', pa.int32()),          # YYYYMMDD of the partition
+    ('file', pa.string()),        # part file of the day, relative to the dataset folder
+    ('row_start', pa.int64()),    # first row of the channel in the part file
+    ('row_count', pa.int32()),
+])
+
+
+def partition_dir(dataset_path, year, month, day):
+    """Folder of one day partition, e.g. <dataset>/year=2025/month=5/day=19."""
+    return os.path.join(dataset_path, f"year={year}", f"month={month}", f"day={day}")
+
+
+def partition_day_keys(table):
+    """Per-row int32 day key YYYYMMDD of a cleaned table (local date of the timestamp)."""
+    timestamps = table['timestamp']
+    return pc.add(pc.add(pc.multiply(pc.year(timestamps), 10000), pc.multiply(pc.month(timestamps), 100)),
+                  pc.day(timestamps)).cast(pa.int32())
+
+
+def channel_dimension_path(dataset_path):
+    """Channel dimension table of a cleaned dataset: channels.parquet in the same folder."""
+    return os.path.join(os.path.dirname(os.path.abspath(dataset_path)), 'channels.parquet')
+
+
+def channel_index_path(dataset_path):
+    """Channel index folder of a partitioned cleaned dataset (see channel_index_schema)."""
+    return os.path.join(dataset_path, channel_index_name)
+
+
+def channel_index_month_path(index_path, month_key):
+    """File of one month (YYYYMM) of a channel index folder, e.g. <index>/month-202505.parquet."""
+    return os.path.join(index_path, f"month-{month_key}.parquet")
+
+
+def read_channel_dimension(path):
+    """Reads the channel dimension table (row i = channel_key i), or None if it does not exist."""
+    if not os.path.isfile(path):
+        return None
+    return pq.read_table(path, schema=channel_schema)
+
+
+def resolve_channel_keys(dimension, channels):
+    """
+    channel_key of a list of channel_id (int) and/or channel_name (str); an id or name that is
+    not in the dimension is ignored. Returns a sorted list of keys.
+    """
+    channel_ids = [c for c in channels if not isinstance(c, str)]
+    channel_names = [c for c in channels if isinstance(c, str)]
+    mask = pc.or_(pc.is_in(dimension['channel_id'], pa.array(channel_ids, pa.int32())),
+                  pc.is_in(dimension['channel_name'], pa.array(channel_names, pa.string())))
+    return sorted(dimension['channel_key'].filter(mask).to_pylist())
+
+
+def channel_attribute(dimension, column, channel_keys):
+    """
+    Column of the dimension for every row of channel_keys (array indexing, no join).
+    channel_name is returned dictionary-encoded (Categorical in pandas).
+    """
+    channel_keys = channel_keys.combine_chunks() if isinstance(channel_keys, pa.ChunkedArray) else channel_keys
+    if column == 'channel_name':
+        # Two sensors may share a name: the dictionary holds each name once
+        names = dimension['channel_name'].combine_chunks()
+        unique_names = pc.unique(names)
+        codes = pc.index_in(names, value_set=unique_names).take(channel_keys)
+        return pa.DictionaryArray.from_arrays(codes, unique_names)
+    return dimension[column].take(channel_keys)
+
+
+def has_channel_key(schema):
+    """True if the measurement rows reference the channel dimension (current layout)."""
+    return 'channel_key' in schema.names
+
+
+def is_partitioned_dataset(path):
+    """True if path is a dataset folder with the year=/month=/day= layout."""
+    return os.path.isdir(path) and any(name.startswith('year=') for name in os.listdir(path))
+
+
+def has_cleaned_schema(path):
+    """True if the Parquet file/dataset at path was written with the current cleaned_schema."""
+    try:
+        return pq.read_schema(first_parquet_file(path)).remove_metadata().equals(cleaned_schema)
+    except (OSError, pa.ArrowException):
+        return False
+
+
+def is_ipc_file(path):
+    """
+    True if path is an Arrow IPC (Feather v2) copy of the cleaned data (.arrow / .feather): a single
+    file, or the folder of one file per day written by the processing script.
+    """
+    return os.path.exists(path) and path.endswith(('.arrow', '.feather'))
+
+
+def read_cleaned_ipc(path):
+    """
+    Memory-maps an uncompressed Arrow IPC file (or every file of an IPC folder, in name order): the
+    returned table points into the mapped files (no decoding, no copy), and their pages are only
+    read from disk when accessed.
+    """
+    if not os.path.isdir(path):
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    files = sorted(name for name in os.listdir(path) if name.endswith(('.arrow', '.feather')) and not name.startswith('.'))
+    tables = [pa.ipc.open_file(pa.memory_map(os.path.join(path, name), 'r')).read_all() for name in files]
+    return pa.concat_tables(tables) if tables else cleaned_schema.empty_table()
+
+
+def first_parquet_file(path):
+    """Returns path itself for a single file, or the first .parquet part file of a dataset folder."""
+    if not os.path.isdir(path):
+        return path
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(name for name in dirs if not name.startswith(('.', '_')))
+        for name in sorted(files):
+            if name.endswith('.parquet') and not name.startswith(('.', '_')):
+                return os.path.join(root, name)
+    raise FileNotFoundError(f"No .parquet part file in {path}")
+
+
+def cleaned_table_to_dataframe(table):
+    """
+    Converts a cleaned Arrow table to pandas, restoring the compact dtypes:
+    dictionary columns become Categoricals, float32/int8 stay as they are,
+    and day_of_week becomes an ordered Categorical of day names built on the stored codes.
+    """
+    # split_blocks/self_destruct let pyarrow hand each column over without consolidating copies
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    if 'day_of_week' in df.columns and pd.api.types.is_integer_dtype(df['day_of_week']):
+        df['day_of_week'] = pd.Categorical.from_codes(df['day_of_week'], categories=day_order, ordered=True)
+    return df
+
+
+def _day_key_expression():
+    """YYYYMMDD computed from the partition fields, so a time range prunes whole partitions."""
+    return (ds.field('year').cast(pa.int32()) * 10000
+            + ds.field('month').cast(pa.int32()) * 100
+            + ds.field('day').cast(pa.int32()))
+
+
+def local_timestamp(bound):
+    """pd.Timestamp in local time of a time bound (anything pd.Timestamp accepts, naive = local time)."""
+    bound = pd.Timestamp(bound)
+    return bound.tz_localize(local_timezone) if bound.tzinfo is None else bound.tz_convert(local_timezone)
+
+
+def build_cleaned_filter(start=None, end=None, channels=None, partitioned=True, dimension=None):
+    """
+    Builds a pyarrow.dataset filter for load_cleaned_data:
+      - start/end (anything pd.Timestamp accepts, naive = local time): start <= timestamp < end,
+        plus the matching condition on the day partitions,
+      - channels: list of channel_id (int) and/or channel_name (str), translated to channel_key
+        with the channel dimension table (without it, the legacy channel_id/channel_name columns).
+    Returns None if there is nothing to filter.
+    """
+    conditions = []
+    for bound, op in ((start, 'ge'), (end, 'lt')):
+        if bound is None:
+            continue
+        bound = local_timestamp(bound)
+        timestamp_scalar = pa.scalar(bound.to_pydatetime(), pa.timestamp('ns', tz=local_timezone))
+        day_key = bound.year * 10000 + bound.month * 100 + bound.day
+        if op == 'ge':
+            conditions.append(ds.field('timestamp') >= timestamp_scalar)
+            if partitioned:
+                conditions.append(_day_key_expression() >= day_key)
+        else:
+            conditions.append(ds.field('timestamp') < timestamp_scalar)
+            if partitioned:
+                conditions.append(_day_key_expression() <= day_key)
+    if channels is not None and dimension is not None:
+        conditions.append(ds.field('channel_key').isin(pa.array(resolve_channel_keys(dimension, channels), pa.int32())))
+    elif channels is not None:
+        channel_ids = [c for c in channels if not isinstance(c, str)]
+        channel_names = [c for c in channels if isinstance(c, str)]
+        channel_conditions = []
+        if channel_ids:
+            channel_conditions.append(ds.field('channel_id').isin(pa.array(channel_ids, pa.int32())))
+        if channel_names:
+            channel_conditions.append(ds.field('channel_name').cast(pa.string()).isin(channel_names))
+        if channel_conditions:
+            condition = channel_conditions[0]
+            for other in channel_conditions[1:]:
+                condition = condition | other
+            conditions.append(condition)
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def open_cleaned_dataset(path):
+    """Opens the cleaned dataset (partitioned folder, flat part-file folder, single file or IPC file)."""
+    if is_ipc_file(path):
+        return ds.dataset(path, format='ipc')
+    partitioning = cleaned_partitioning if is_partitioned_dataset(path) else None
+    return ds.dataset(path, format='parquet', partitioning=partitioning)
+
+
+def load_cleaned_data(path, columns=None, start=None, end=None, channels=None):
+    """
+    Reads the cleaned dataset with its compact dtypes.
+    Only the requested columns are decoded, and with start/end/channels only the partitions and
+    row groups that can contain matching rows are read (see build_cleaned_filter).
+    The channel attributes (channel_id, channel_name, channel_length, longitude, latitude) can be
+    requested like the other columns: they are taken from the channel dimension table by
+    channel_key. By default, every column plus channel_id, channel_name and channel_length.
+    The partition fields (year/month/day) are not returned.
+    An Arrow IPC file (see read_cleaned_ipc) is memory-mapped and filtered in memory instead.
+    """
+    if is_ipc_file(path):
+        table = read_cleaned_ipc(path)
+        schema = table.schema
+    else:
+        dataset = open_cleaned_dataset(path)
+        schema = dataset.schema
+    dimension = read_channel_dimension(channel_dimension_path(path)) if has_channel_key(schema) else None
+    if columns is None:
+        columns = [name for name in ['channel_key'] + cleaned_batch_schema.names
+                   if name in schema.names or (dimension is not None and name in channel_attribute_columns)]
+    attributes = [name for name in columns if dimension is not None and name in channel_attribute_columns]
+    read_columns = [name for name in columns if name not in attributes]
+    if attributes and 'channel_key' not in read_columns:
+        read_columns.append('channel_key')
+    if is_ipc_file(path):
+        filter_expression = build_cleaned_filter(start, end, channels, partitioned=False, dimension=dimension)
+        if filter_expression is not None:
+            table = table.filter(filter_expression)
+        table = table.select(read_columns)
+    else:
+        filter_expression = build_cleaned_filter(start, end, channels, partitioned=is_partitioned_dataset(path),
+                                                 dimension=dimension)
+        table = dataset.to_table(columns=read_columns, filter=filter_expression)
+    if attributes:
+        for name in attributes:
+            table = table.append_column(name, channel_attribute(dimension, name, table['channel_key']))
+        table = table.select(columns)
+    return cleaned_table_to_dataframe(table)
+
+
+def read_channel_series(dataset_path, channel_keys, start=None, end=None, columns=('timestamp',)):
+    """
+    Rows of the given channel_keys with start <= timestamp < end (as in build_cleaned_filter),
+    sorted by timestamp, read with the channel index: only the index rows of these channels and
+    days are read, then in each part file only the row groups holding the channel's rows, so the
+    cost does not depend on the size of the dataset.
+    Returns an Arrow table with the given columns, or None if the dataset has no channel index or
+    a part file it points to was rewritten meanwhile (then filter the dataset instead).
+    """
+    index_path = channel_index_path(dataset_path)
+    if not os.path.isdir(index_path):
+        return None
+    columns = list(columns)
+    start = local_timestamp(start) if start is not None else None
+    end = local_timestamp(end) if end is not None else None
+    condition = ds.field('channel_key').isin(pa.array(list(channel_keys), pa.int32()))
+    first_month, last_month = 0, 999999
+    if start is not None:
+        condition = condition & (ds.field('day') >= start.year * 10000 + start.month * 100 + start.day)
+        first_month = start.year * 100 + start.month
+    if end is not None:
+        condition = condition & (ds.field('day') <= end.year * 10000 + end.month * 100 + end.day)
+        last_month = end.year * 100 + end.month
+    # Only the month files of the time range are opened
+    index_files = [channel_index_month_path(index_path, month_key) for month_key in
+                   sorted(int(name[len('month-'):-len('.parquet')]) for name in os.listdir(index_path)
+                          if name.startswith('month-') and name.endswith('.parquet'))
+                   if first_month <= month_key <= last_month]
+    entries = ds.dataset(index_files, format='parquet', schema=channel_index_schema).to_table(
+        columns=['file', 'row_start', 'row_count'], filter=condition)
+    read_columns = list(dict.fromkeys(columns + ['timestamp']))
+    tables = []
+    parquet_path = None
+    try:
+        for file, row_start, row_count in sorted(zip(*entries.to_pydict().values())):
+            if file != parquet_path:
+                parquet_path = file
+                parquet_file = pq.ParquetFile(os.path.join(dataset_path, file))
+                metadata = parquet_file.metadata
+                group_ends = np.cumsum([metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+            # Row groups holding rows row_start .. row_start + row_count - 1
+            first = int(np.searchsorted(group_ends, row_start, side='right'))
+            last = int(np.searchsorted(group_ends, row_start + row_count - 1, side='right'))
+            table = parquet_file.read_row_groups(range(first, last + 1), columns=read_columns)
+            tables.append(table.slice(row_start - (group_ends[first - 1] if first else 0), row_count))
+    except FileNotFoundError:
+        return None
+    if not tables:
+        return cleaned_schema.empty_table().select(columns)
+    table = pa.concat_tables(tables)
+    if start is not None:
+        table = table.filter(pc.greater_equal(table['timestamp'], pa.scalar(start.to_pydatetime(), table['timestamp'].type)))
+    if end is not None:
+        table = table.filter(pc.less(table['timestamp'], pa.scalar(end.to_pydatetime(), table['timestamp'].type)))
+    return table.sort_by('timestamp').select(columns)
@@ -0,0 +1,281 @@
+# ============================
+# trafic_server.py
+# ============================
+# Local HTTP query API over the cleaned dataset: the data is loaded once, then every question
+# is a JSON request answered in milliseconds (no script to re-run, no plt.show() to close).
+#
+# The statistics come from the aggregate cube and the same functions as trafic_analysis.py and
+# trafic_spatial_analysis.py (trafic_aggregates.py); the time series are read from the cleaned
+# dataset through its channel index (only the rows of the channel are decoded). Results are cached per query, until the processing
+# script updates the aggregate cube (e.g. trafic_processing_master.py --watch): the data is then
+# reloaded on the next request.
+#
+# Usage:
+#   python trafic_server.py [--host 127.0.0.1] [--port 8765]
+#
+# Endpoints (GET, JSON):
+#   /hourly?measure=flow[&weekend=true|false]    mean per hour of the day (local time)
+#   /day_of_week?measure=flow                    mean per day of week, Monday first
+#   /top?kind=congested|fastest|slowest[&n=10]   top-N streets (average flow / speed)
+#   /series?channel=<id or name>[&measure=flow][&start=...][&end=...]   measurements of one channel
+#                                                (start/end without offset = local time, Europe/Paris)
+#   /channels                                    channel keys, ids and names
+#   /reload                                      forget the loaded data (after a processing run)
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import trafic_data_access as data_access
+from trafic_aggregates import cube_measures, cube_mean, day_of_week_mean, top_channels
+from trafic_schema import (build_cleaned_filter, channel_dimension_path, is_partitioned_dataset, open_cleaned_dataset,
+                          read_channel_dimension, read_channel_series, resolve_channel_keys)
+
+# --- Configuration ---
+default_host = '127.0.0.1'
+default_port = 8765
+cache_size = 1024  # Number of distinct queries kept in the result cache
+
+# top?kind=... -> (measure, ascending), as in trafic_spatial_analysis.py
+top_kinds = {
+    'congested': ('flow', False),
+    'fastest': ('speed', False),
+    'slowest': ('speed', True),
+}
+
+
+class QueryError(ValueError):
+    """Invalid query parameters (answered with HTTP 400)."""
+
+
+# ============================
+# Loaded data (shared by the request threads)
+# ============================
+_state_lock = threading.Lock()
+_state = {}
+
+
+def cube_version():
+    """
+    Modification time of the aggregate cube (folder of daily files: every processing run renames
+    at least one file into it), or None.
+    """
+    try:
+        return os.stat(data_access.aggregate_cube_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_cube():
+    """Aggregate cube, loaded on first use."""
+    with _state_lock:
+        if 'cube' not in _state:
+            _state['version'] = cube_version()
+            _state['cube'] = data_access.load_cube()
+        return _state['cube']
+
+
+def reload_if_updated():
+    """Forgets the loaded data if a processing run has updated the cube since it was loaded."""
+    with _state_lock:
+        updated = 'version' in _state and _state['version'] != cube_version()
+    if updated:
+        reload_data()
+
+
+def get_dataset():
+    """Cleaned dataset (pyarrow.dataset, file list discovered once) and its channel dimension table."""
+    with _state_lock:
+        if 'dataset' not in _state:
+            path = data_access.cleaned_data_path
+            _state['dataset'] = (open_cleaned_dataset(path), is_partitioned_dataset(path),
+                                 read_channel_dimension(channel_dimension_path(path)))
+        return _state['dataset']
+
+
+def reload_data():
+    """Forgets the loaded data and every cached result."""
+    with _state_lock:
+        _state.clear()
+    data_access.clear_cache()
+    for query in (hourly_flow, day_of_week_flow, top_streets, channel_series, channel_list):
+        query.cache_clear()
+
+
+# ============================
+# Queries (cached, arguments normalized by the handler)
+# ============================
+def series_to_json(series):
+    """{label: value} of a pandas Series, NaN -> null."""
+    return {str(key): (None if math.isnan(value) else float(value)) for key, value in series.items()}
+
+
+@lru_cache(maxsize=cache_size)
+def hourly_flow(measure, weekend):
+    cube = get_cube()
+    if weekend is not None:
+        cube = cube[cube['is_weekend'] == weekend]
+    return {'measure': measure, 'weekend': weekend, 'hourly': series_to_json(cube_mean(cube, 'hour', measure))}
+
+
+@lru_cache(maxsize=cache_size)
+def day_of_week_flow(measure):
+    return {'measure': measure, 'day_of_week': series_to_json(day_of_week_mean(get_cube(), measure))}
+
+
+@lru_cache(maxsize=cache_size)
+def top_streets(kind, n):
+    measure, ascending = top_kinds[kind]
+    top = top_channels(get_cube(), measure, n, ascending=ascending)
+    return {'kind': kind, 'measure': measure, 'top': [{'channel_name': name, measure: value}
+                                                      for name, value in series_to_json(top).items()]}
+
+
+@lru_cache(maxsize=cache_size)
+def channel_series(channel, measure, start, end):
+    dataset, partitioned, dimension = get_dataset()
+    table = None
+    if dimension is not None:
+        table = read_channel_series(data_access.cleaned_data_path, resolve_channel_keys(dimension, [channel]),
+                                    start, end, ['timestamp', measure])
+    if table is None:  # dataset without channel index: partition/row-group pruning
+        table = dataset.to_table(columns=['timestamp', measure],
+                                 filter=build_cleaned_filter(start, end, [channel], partitioned=partitioned,
+                                                             dimension=dimension))
+        table = table.sort_by('timestamp')
+    # Whole seconds (the snapshots are taken on the minute), ISO 8601 in UTC
+    seconds = table['timestamp'].cast(pa.timestamp('s', tz='UTC'), safe=False)
+    timestamps = pc.strftime(seconds, format='%Y-%m-%dT%H:%M:%SZ').to_pylist()
+    return {'channel': channel, 'measure': measure, 'start': start, 'end': end,
+            'timestamps': timestamps, 'values': table[measure].to_pylist()}
+
+
+@lru_cache(maxsize=1)
+def channel_list():
+    channels = data_access.load_channels()[['channel_key', 'channel_id', 'channel_name']]
+    return {'channels': [{'channel_key': int(key), 'channel_id': int(channel_id), 'channel_name': name}
+                         for key, channel_id, name in channels.itertuples(index=False)]}
+
+
+# ============================
+# HTTP handler
+# ============================
+def parse_measure(params, allowed=cube_measures):
+    measure = params.get('measure', 'flow')
+    if measure not in allowed:
+        raise QueryError(f"measure must be one of {list(allowed)}")
+    return measure
+
+
+def parse_bool(value):
+    if value is None:
+        return None
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    raise QueryError(f"invalid boolean: {value}")
+
+
+def parse_channel(value):
+    if not value:
+        raise QueryError("channel is required (channel_id or channel_name)")
+    return int(value) if value.lstrip('-').isdigit() else value
+
+
+def answer(path, params):
+    """Dispatches one query; returns the JSON-serializable result."""
+    if path == '/hourly':
+        return hourly_flow(parse_measure(params), parse_bool(params.get('weekend')))
+    if path == '/day_of_week':
+        return day_of_week_flow(parse_measure(params))
+    if path == '/top':
+        kind = params.get('kind', 'congested')
+        if kind not in top_kinds:
+            raise QueryError(f"kind must be one of {list(top_kinds)}")
+        try:
+            n = int(params.get('n', 10))
+        except ValueError:
+            raise QueryError("n must be an integer")
+        if n < 1:
+            raise QueryError("n must be at least 1")
+        return top_streets(kind, n)
+    if path == '/series':
+        measure = parse_measure(params, allowed=['flow', 'occupancy', 'speed', 'travel_time'])
+        return channel_series(parse_channel(params.get('channel')), measure, params.get('start'), params.get('end'))
+    if path == '/channels':
+        return channel_list()
+    if path == '/reload':
+        reload_data()
+        return {'reloaded': True}
+    if path == '/':
+        return {'endpoints': ['/hourly', '/day_of_week', '/top', '/series', '/channels', '/reload']}
+    return None
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        t0 = time.perf_counter()
+        try:
+            reload_if_updated()
+            result = answer(url.path.rstrip('/') or '/', params)
+            status = 200 if result is not None else 404
+            if result is None:
+                result = {'error': f"unknown endpoint {url.path}"}
+        except (QueryError, ValueError) as e:
+            status, result = 400, {'error': str(e)}
+        except Exception as e:
+            status, result = 500, {'error': f"{type(e).__name__}: {e}"}
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.log_message('"%s" %d %.1f ms', self.path, status, (time.perf_counter() - t0) * 1000)
+
+    def log_request(self, code='-', size='-'):
+        pass  # one line per request is logged by do_GET, with the query time
+
+
+# ============================
+# Main
+# ============================
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local JSON query API over the cleaned traffic dataset.")
+    parser.add_argument('--host', default=default_host, help=f"Address to listen on (default: {default_host}).")
+    parser.add_argument('--port', type=int, default=default_port, help=f"Port (default: {default_port}).")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print("🚀 Starting Traffic Query Server...")
+    data_access.require_file(data_access.cleaned_data_path, "Cleaned data file")
+    t0 = time.time()
+    cube = get_cube()
+    get_dataset()
+    print(f"✅ Loaded {len(cube)} cube rows in {time.time() - t0:.2f} seconds.")
+    server = ThreadingHTTPServer((args.host, args.port), QueryHandler)
+    print(f"🌐 Serving on http://{args.host}:{args.port}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Server stopped.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
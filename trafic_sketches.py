@@ -0,0 +1,469 @@
+# ============================
+# trafic_sketches.py
+# ============================
+# Streaming, mergeable statistics over Parquet files: one pass over the row groups with bounded
+# memory, instead of loading the whole table for describe(), nunique() or a per-channel groupby.
+#
+#   - Moments: count, mean and variance (Welford/Chan updates, numerically stable),
+#   - TDigest: approximate quantiles (merging t-digest with the k1 scale function): at most about
+#     compression centroids per group, none holding more than pi/compression of its group's values
+#     (much less in the tails), so a quantile's rank error stays below pi/compression + 1/n for a
+#     group of n values (the 1/n is pandas' interpolation between ranks), after any merges too,
+#   - HyperLogLog: approximate distinct counts (2^precision one-byte registers, standard error
+#     1.04 / sqrt(2^precision), i.e. about 0.8% with the default precision).
+#
+# Moments and TDigest are grouped: one sketch per group (e.g. per channel_key) kept in flat numpy
+# arrays and updated for all the groups of a batch at once. Every sketch has merge(), so the
+# partitions (day files) of the dataset are sketched separately, in parallel if asked, and then
+# combined: Moments and HyperLogLog give the same result whatever the split, TDigest stays
+# within the same error bound.
+
+import os
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# --- Default sketch parameters ---
+digest_compression = 200     # t-digest compression (at most about compression centroids per group)
+digest_buffer_size = 100_000  # values buffered before the t-digest centroids are recomputed
+hll_precision = 14           # HyperLogLog registers: 2^14 = 16 KB per column, ~0.8% error
+sketch_batch_rows = 1_000_000  # rows decoded at a time (whole row groups)
+
+# Quantiles reported by default (median, 85th and 95th percentiles)
+default_quantiles = (0.5, 0.85, 0.95)
+
+
+def _pad(values, size, fill):
+    """values extended with fill up to size (grouped sketches grow with the largest group seen)."""
+    if len(values) >= size:
+        return values
+    return np.concatenate([values, np.full(size - len(values), fill, dtype=values.dtype)])
+
+
+def _group_order(groups, values):
+    """
+    Order sorting by (group, value), like np.lexsort((values, groups)) but faster: argsort of the
+    values, then a stable sort of the groups (a radix sort when they fit in 16 bits).
+    """
+    order = np.argsort(values)
+    if len(groups) and groups.max() > 0:
+        group_type = 'int16' if groups.max() < 2 ** 15 else 'int64'
+        order = order[np.argsort(groups[order].astype(group_type), kind='stable')]
+    return order
+
+
+def _as_groups(values, groups):
+    """(float64 values, int64 groups) without the NaN values; group 0 for ungrouped values."""
+    values = np.asarray(values, dtype='float64')
+    groups = np.zeros(len(values), dtype='int64') if groups is None else np.asarray(groups, dtype='int64')
+    valid = ~np.isnan(values)
+    return values[valid], groups[valid]
+
+
+# ============================
+# Mean and variance
+# ============================
+class Moments:
+    """
+    Count, mean and sum of squared deviations (M2) per group. Each batch is reduced with a
+    two-pass mean/deviation per group, then combined with the running values by Chan's formula,
+    which is also how two sketches merge.
+    """
+
+    def __init__(self, groups=1):
+        self.count = np.zeros(groups)
+        self.mean = np.zeros(groups)
+        self.m2 = np.zeros(groups)
+
+    def update(self, values, groups=None):
+        values, groups = _as_groups(values, groups)
+        size = max(len(self.count), int(groups.max()) + 1 if len(groups) else 0)
+        count = np.bincount(groups, minlength=size).astype('float64')
+        mean = np.divide(np.bincount(groups, values, minlength=size), count, out=np.zeros(size), where=count > 0)
+        m2 = np.bincount(groups, (values - mean[groups]) ** 2, minlength=size)
+        self._combine(count, mean, m2)
+        return self
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other.m2)
+        return self
+
+    def _combine(self, count, mean, m2):
+        size = max(len(self.count), len(count))
+        self.count, self.mean, self.m2 = (_pad(values, size, 0.0) for values in (self.count, self.mean, self.m2))
+        count, mean, m2 = (_pad(values, size, 0.0) for values in (count, mean, m2))
+        total = self.count + count
+        delta = mean - self.mean
+        weight = np.divide(count, total, out=np.zeros(size), where=total > 0)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * weight
+        self.count = total
+
+    def variance(self, ddof=1):
+        """Variance per group (NaN with not enough values), ddof=1 as pandas."""
+        return np.divide(self.m2, self.count - ddof, out=np.full(len(self.count), np.nan),
+                         where=self.count > ddof)
+
+    def std(self, ddof=1):
+        return np.sqrt(self.variance(ddof))
+
+
+# ============================
+# Quantiles
+# ============================
+class TDigest:
+    """
+    Merging t-digest per group. The values are buffered, then the buffer and the centroids are
+    sorted by (group, mean) and every run of points lying entirely in the same unit of the k1 scale
+    k(q) = compression / (2 pi) * asin(2q - 1) becomes one centroid; a point across a unit boundary
+    stays alone. A unit is at most pi/compression wide, and smaller near q = 0 and q = 1, where the
+    quantiles need precision. Merging two digests is the same operation on their centroids, so a
+    merged centroid never spans more than one unit either. The exact minimum and maximum of each
+    group are kept too.
+    """
+
+    def __init__(self, compression=digest_compression, buffer_size=digest_buffer_size):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.groups = np.empty(0, dtype='int64')
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.minimum = np.empty(0)
+        self.maximum = np.empty(0)
+        self._buffer = []
+        self._buffered = 0
+
+    def update(self, values, groups=None):
+        values, groups = _as_groups(values, groups)
+        if not len(values):
+            return self
+        self._buffer.append((groups, values, np.ones(len(values))))
+        self._buffered += len(values)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+        return self
+
+    def merge(self, other):
+        other.flush()
+        size = max(len(self.minimum), len(other.minimum))
+        self.minimum = np.minimum(_pad(self.minimum, size, np.inf), _pad(other.minimum, size, np.inf))
+        self.maximum = np.maximum(_pad(self.maximum, size, -np.inf), _pad(other.maximum, size, -np.inf))
+        self._buffer.append((other.groups, other.means, other.weights))
+        self.flush()
+        return self
+
+    def flush(self):
+        """Compresses the buffered values into the centroids (and updates the minimum and maximum)."""
+        if not self._buffer:
+            return
+        groups = np.concatenate([self.groups] + [groups for groups, _, _ in self._buffer])
+        means = np.concatenate([self.means] + [means for _, means, _ in self._buffer])
+        weights = np.concatenate([self.weights] + [weights for _, _, weights in self._buffer])
+        self._buffer, self._buffered = [], 0
+        if not len(groups):
+            return
+
+        order = _group_order(groups, means)
+        groups, means, weights = groups[order], means[order], weights[order]
+        totals = np.bincount(groups, weights)
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        # The centroids lie within the previous minimum/maximum: the first and last sorted points update them
+        size = max(len(self.minimum), len(totals))
+        self.minimum, self.maximum = _pad(self.minimum, size, np.inf), _pad(self.maximum, size, -np.inf)
+        present = groups[starts]
+        self.minimum[present] = np.minimum(self.minimum[present], means[starts])
+        self.maximum[present] = np.maximum(self.maximum[present], means[np.r_[starts[1:], len(groups)] - 1])
+        # Quantile range [q_start, q_end] of each point within its group, and the k units of both ends
+        cumulative = np.cumsum(weights)
+        before = np.repeat(cumulative[starts] - weights[starts], np.diff(np.r_[starts, len(groups)]))
+        scale = self.compression / (2 * np.pi)
+        k_start = np.floor(scale * np.arcsin(np.clip(2 * (cumulative - before - weights) / totals[groups] - 1, -1, 1)))
+        k_end = np.ceil(scale * np.arcsin(np.clip(2 * (cumulative - before) / totals[groups] - 1, -1, 1))) - 1
+        # Points lying within one k unit are merged per (group, unit); a point (or an input centroid)
+        # straddling a unit boundary stays alone, so no centroid spans more than one unit
+        alone = k_start != k_end
+        new_centroid = np.r_[True, (groups[1:] != groups[:-1]) | (k_start[1:] != k_start[:-1])
+                             | alone[1:] | alone[:-1]]
+        ids = np.cumsum(new_centroid) - 1
+        self.weights = np.bincount(ids, weights)
+        self.means = np.bincount(ids, weights * means) / self.weights
+        self.groups = groups[new_centroid]
+
+    def count(self):
+        """Number of values per group."""
+        self.flush()
+        return np.bincount(self.groups, self.weights, minlength=len(self.minimum))
+
+    def quantile(self, quantiles=default_quantiles):
+        """
+        Estimated quantiles per group: array (groups, len(quantiles)), NaN for empty groups.
+        Interpolates linearly between the centroid means placed at their cumulative midpoint, and
+        the exact minimum and maximum at both ends. The target rank is q * (n - 1) as in pandas,
+        so a group whose centroids are still single values gets exactly the pandas quantile.
+        """
+        self.flush()
+        size = len(self.minimum)
+        quantiles = np.asarray(quantiles, dtype='float64')
+        result = np.full((size, len(quantiles)), np.nan)
+        if not len(self.groups):
+            return result
+        totals = np.bincount(self.groups, self.weights, minlength=size)
+        present = np.flatnonzero(totals > 0)
+        # All the groups on one axis: group g spans [offset_g, offset_g + total_g], then a gap of 1
+        offsets = np.cumsum(np.r_[0, totals[present] + 1])[:-1]
+        group_offset = np.zeros(size)
+        group_offset[present] = offsets
+        cumulative = np.cumsum(self.weights)
+        starts = np.flatnonzero(np.r_[True, self.groups[1:] != self.groups[:-1]])
+        before = np.repeat(cumulative[starts] - self.weights[starts], np.diff(np.r_[starts, len(self.groups)]))
+        positions = np.concatenate([group_offset[present], group_offset[self.groups] + cumulative - before
+                                    - self.weights / 2, group_offset[present] + totals[present]])
+        values = np.concatenate([self.minimum[present], self.means, self.maximum[present]])
+        order = np.argsort(positions, kind='stable')
+        targets = group_offset[present][:, None] + 0.5 + quantiles[None, :] * (totals[present][:, None] - 1)
+        result[present] = np.interp(targets, positions[order], values[order])
+        return result
+
+
+# ============================
+# Distinct counts
+# ============================
+def hash_column(column):
+    """64-bit hashes (numpy uint64) of the non-null values of an Arrow array or chunked array."""
+    chunks = column.chunks if isinstance(column, pa.ChunkedArray) else [column]
+    hashes = [np.empty(0, dtype='uint64')]
+    for chunk in chunks:
+        chunk = pc.drop_null(chunk)
+        if pa.types.is_dictionary(chunk.type):
+            # Each distinct string is hashed once, the rows take their index's hash
+            hashes.append(hash_column(chunk.dictionary)[chunk.indices.to_numpy(zero_copy_only=False)])
+            continue
+        if pa.types.is_temporal(chunk.type):
+            chunk = chunk.cast(pa.int64() if chunk.type.bit_width == 64 else pa.int32())
+        values = chunk.to_numpy(zero_copy_only=False)
+        if pa.types.is_floating(chunk.type):
+            values = values + 0.0  # -0.0 and 0.0 are the same value
+        elif pa.types.is_boolean(chunk.type):
+            values = values.astype('uint8')
+        hashes.append(pd.util.hash_array(values))
+    return np.concatenate(hashes)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter: the first `precision` bits of each hash select a register, which
+    keeps the longest run of leading zeros seen in the remaining bits. Merging is a register-wise max.
+    """
+
+    def __init__(self, precision=hll_precision):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype='uint8')
+
+    def update(self, hashes):
+        hashes = np.asarray(hashes, dtype='uint64')
+        bits = 64 - self.precision
+        index = (hashes >> np.uint64(bits)).astype('intp')
+        rest = hashes & np.uint64((1 << bits) - 1)
+        # Bit length of the rest through the float exponent, on its top 52 bits (exact in float64)
+        shift = max(bits - 52, 0)
+        top = rest >> np.uint64(shift)
+        bit_length = np.frexp(top.astype('float64'))[1] + np.where(top > 0, shift, 0)
+        np.maximum.at(self.registers, index, (bits - bit_length + 1).astype('uint8'))
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        """Estimated number of distinct values (linear counting while registers are still empty)."""
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype('int64')))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+# ============================
+# Sketches of a table
+# ============================
+def is_numeric_type(data_type):
+    return pa.types.is_integer(data_type) or pa.types.is_floating(data_type)
+
+
+class TableSketch:
+    """
+    Sketches of a table updated batch by batch: for every column (unless column_sketches is
+    False) the row and null counts and a HyperLogLog, and for the numeric columns also Moments
+    and a TDigest; for each of channel_measures, Moments and a TDigest per channel_key.
+    Two TableSketch merge.
+    """
+
+    def __init__(self, channel_measures=(), column_sketches=True, compression=digest_compression,
+                 precision=hll_precision):
+        self.channel_measures = list(channel_measures)
+        self.column_sketches = column_sketches
+        self.compression = compression
+        self.precision = precision
+        self.columns = {}
+        self.channels = {measure: (Moments(), TDigest(compression)) for measure in self.channel_measures}
+
+    def _column(self, name, data_type):
+        if name not in self.columns:
+            numeric = is_numeric_type(data_type)
+            self.columns[name] = {
+                'type': str(data_type), 'rows': 0, 'nulls': 0, 'distinct': HyperLogLog(self.precision),
+                'moments': Moments() if numeric else None, 'digest': TDigest(self.compression) if numeric else None,
+            }
+        return self.columns[name]
+
+    def update(self, table):
+        for name in (table.column_names if self.column_sketches else []):
+            column = table[name]
+            sketch = self._column(name, column.type)
+            sketch['rows'] += len(column)
+            sketch['nulls'] += column.null_count
+            sketch['distinct'].update(hash_column(column))
+            if sketch['moments'] is not None:
+                values = column.to_numpy()
+                sketch['moments'].update(values)
+                sketch['digest'].update(values)
+        if self.channel_measures:
+            keys = table['channel_key'].to_numpy()
+            for measure, (moments, digest) in self.channels.items():
+                values = table[measure].to_numpy()
+                moments.update(values, keys)
+                digest.update(values, keys)
+        return self
+
+    def merge(self, other):
+        for name, theirs in other.columns.items():
+            if name not in self.columns:
+                self.columns[name] = theirs
+                continue
+            mine = self.columns[name]
+            mine['rows'] += theirs['rows']
+            mine['nulls'] += theirs['nulls']
+            mine['distinct'].merge(theirs['distinct'])
+            if mine['moments'] is not None:
+                mine['moments'].merge(theirs['moments'])
+                mine['digest'].merge(theirs['digest'])
+        for measure, (moments, digest) in other.channels.items():
+            if measure in self.channels:
+                self.channels[measure][0].merge(moments)
+                self.channels[measure][1].merge(digest)
+            else:
+                self.channels[measure] = (moments, digest)
+        return self
+
+    def flush(self):
+        """Compresses every buffered t-digest (before pickling or reading the sketch)."""
+        digests = [sketch['digest'] for sketch in self.columns.values() if sketch['digest'] is not None]
+        for digest in digests + [digest for _, digest in self.channels.values()]:
+            digest.flush()
+        return self
+
+    def column_summary(self, quantiles=default_quantiles):
+        """
+        One row per column: type, rows, nulls, approximate distinct count, and for the numeric
+        columns mean, std, min, approximate quantiles and max.
+        """
+        self.flush()
+        rows = {}
+        for name, sketch in self.columns.items():
+            row = {'Type': sketch['type'], 'Rows': sketch['rows'], 'Nulls': sketch['nulls'],
+                   'Distinct (approx.)': sketch['distinct'].count()}
+            if sketch['moments'] is not None and sketch['moments'].count[0] > 0:
+                row.update({'Mean': sketch['moments'].mean[0], 'Std': sketch['moments'].std()[0],
+                            'Min': sketch['digest'].minimum[0]})
+                row.update(zip((f"{q:.0%}" for q in quantiles), sketch['digest'].quantile(quantiles)[0]))
+                row['Max'] = sketch['digest'].maximum[0]
+            rows[name] = row
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+    def channel_summary(self, measure, quantiles=default_quantiles):
+        """
+        One row per channel_key with at least one value of measure: count, mean, std, min,
+        approximate quantiles (columns p50, p85...) and max.
+        """
+        moments, digest = self.channels[measure]
+        digest.flush()
+        size = max(len(moments.count), len(digest.minimum))
+        summary = pd.DataFrame({'count': _pad(moments.count, size, 0.0).astype('int64'),
+                                'mean': _pad(moments.mean, size, np.nan), 'std': _pad(moments.std(), size, np.nan),
+                                'min': _pad(digest.minimum, size, np.nan)})
+        estimates = np.full((size, len(quantiles)), np.nan)
+        estimates[:len(digest.minimum)] = digest.quantile(quantiles)
+        for i, q in enumerate(quantiles):
+            summary[f"p{q * 100:g}"] = estimates[:, i]
+        summary['max'] = _pad(digest.maximum, size, np.nan)
+        summary.index.name = 'channel_key'
+        return summary[summary['count'] > 0]
+
+
+# ============================
+# One pass over Parquet files
+# ============================
+def sketch_file(path, columns=None, channel_measures=(), batch_rows=sketch_batch_rows, **options):
+    """Sketches one Parquet file (e.g. one day partition), streamed over its row groups."""
+    sketch = TableSketch(channel_measures, **options)
+    parquet_file = pq.ParquetFile(path)
+    pending, pending_rows = [], 0
+    # iter_batches stops at every row group: small row groups are gathered up to batch_rows
+    for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=columns):
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows >= batch_rows:
+            sketch.update(pa.Table.from_batches(pending))
+            pending, pending_rows = [], 0
+    if pending:
+        sketch.update(pa.Table.from_batches(pending))
+    return sketch.flush()
+
+
+def sketch_files(files, columns=None, channel_measures=(), workers=1, **options):
+    """
+    Sketches every file separately (in a process pool if workers > 1) and merges the sketches.
+    Memory stays bounded by one batch and the sketches, whatever the number of rows.
+    """
+    task = partial(sketch_file, columns=columns, channel_measures=channel_measures, **options)
+    merged = TableSketch(channel_measures, **options)
+    if workers > 1 and len(files) > 1:
+        with Pool(processes=min(workers, len(files))) as pool:
+            for sketch in pool.imap_unordered(task, files):
+                merged.merge(sketch)
+    else:
+        for file in files:
+            merged.merge(task(file))
+    return merged.flush()
+
+
+def dataset_files(dataset_path):
+    """
+    Part files of a cleaned dataset folder (or the file itself for a single Parquet file), without
+    the hidden '.'/'_' files that pyarrow.dataset skips too (e.g. staging files of a running ingestion).
+    """
+    if not os.path.isdir(dataset_path):
+        return [dataset_path]
+    files = []
+    for folder, dirs, names in os.walk(dataset_path):
+        dirs[:] = [name for name in dirs if not name.startswith(('.', '_'))]  # e.g. the channel index
+        files += [os.path.join(folder, name) for name in names
+                  if name.endswith('.parquet') and not name.startswith(('.', '_'))]
+    return sorted(files)
+
+
+def channel_quantiles(dataset_path, measure='speed', quantiles=default_quantiles, workers=1):
+    """
+    Per-channel statistics of one measure of the cleaned dataset (see TableSketch.channel_summary),
+    in one streamed pass over its partitions.
+    """
+    sketch = sketch_files(dataset_files(dataset_path), columns=['channel_key', measure],
+                          channel_measures=[measure], column_sketches=False, workers=workers)
+    return sketch.channel_summary(measure, quantiles)
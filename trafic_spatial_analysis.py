@@ -7,17 +7,11 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import sys
-import os
 import time
 
 print("🚀 Starting Spatial Traffic Analysis...")
 start_time = time.time()
 
-# --- Configuration ---
-# Define the path to the cleaned Parquet file
-# !! Ensure this path is correct and points to the output of trafic_processing_master.py !!
-cleaned_data_path = r"C:\Users\ASUS\Documents\Stage LS2N\nantes_traffic_archiver\dist\cleaned_traffic_data.parquet"
-
 # --- Check if pyarrow is installed (needed for read_parquet) ---
 try:
     import pyarrow
@@ -26,32 +20,24 @@ except ImportError:
     print("   Please install it using: pip install pyarrow")
     sys.exit(1)
 
-# 2. Load the cleaned dataset from Parquet
-print(f"⏳ Loading cleaned data from: {cleaned_data_path}")
-if not os.path.exists(cleaned_data_path):
-    print(f"❌ Error: Cleaned data file not found at {cleaned_data_path}")
-    print("   Please run the 'trafic_processing_master.py' script first.")
-    sys.exit(1)
+# Paths are configured in trafic_data_access.py (or with the TRAFIC_RESULTS_DIR environment variable)
+from trafic_data_access import cleaned_data_path, load_channels, load_cube, require_file
+from trafic_aggregates import channel_names, top_channels
+from trafic_sketches import channel_quantiles
+from trafic_figures import figure_top_congested, figure_top_fastest, figure_top_slowest
+
+# 2. Load the aggregate cube (channel x date x hour statistics kept by trafic_processing_master.py)
+# The per-street averages below are answered from the cube instead of scanning every cleaned row.
+print(f"⏳ Loading aggregate cube for: {cleaned_data_path}")
+require_file(cleaned_data_path, "Cleaned data file")
 
 try:
-    df = pd.read_parquet(cleaned_data_path, engine='pyarrow')
-    print(f"✅ Loaded {len(df)} rows for spatial analysis.")
+    cube = load_cube()
+    print(f"✅ Loaded {len(cube)} cube rows summarizing {int(cube['flow_count'].sum())} measurements for spatial analysis.")
 except Exception as e:
     print(f"❌ Error reading Parquet file: {e}")
     sys.exit(1)
 
-# --- Data Verification (Optional but Recommended) ---
-# Check if timestamp column was loaded correctly as datetime
-print("\n🔍 Verifying data types (first 5 rows info):")
-df.info(memory_usage='deep')
-# If 'timestamp' is not datetime64[ns], uncomment the next line:
-# print("⚠️ Timestamp column not loaded as datetime. Converting...")
-# df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-# If 'flow' or 'speed' are objects/strings, they might need conversion:
-# df['flow'] = pd.to_numeric(df['flow'], errors='coerce')
-# df['speed'] = pd.to_numeric(df['speed'], errors='coerce')
-# df = df.dropna(subset=['flow', 'speed']) # Drop rows where conversion failed
-
 # ============================
 # 3. Spatial Analysis
 # ============================
@@ -59,18 +45,11 @@ print("\n📊 Performing Spatial Analysis...")
 
 # 3.1 Top 10 Most Congested Streets (Highest Average Flow)
 # Ensure 'flow' is numeric before grouping
-if pd.api.types.is_numeric_dtype(df['flow']):
+if pd.api.types.is_numeric_dtype(cube['flow_sum']):
     print("   Calculating Top 10 Congested Streets by Flow...")
-    top_congested = df.groupby('channel_name')['flow'].mean().sort_values(ascending=False).head(10)
-
-    plt.figure(figsize=(12, 7)) # Slightly larger figure
-    top_congested.plot(kind='bar', color='skyblue')
-    plt.title('Top 10 Most Congested Streets (by Average Flow)')
-    plt.xlabel('Street Name')
-    plt.ylabel('Average Traffic Flow (vehicles/hour?)') # Add units if known
-    plt.xticks(rotation=45, ha='right')
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
-    plt.tight_layout() # Adjust layout
+    top_congested = top_channels(cube, 'flow', 10, ascending=False)
+
+    figure_top_congested(top_congested)
     plt.show()
 else:
     print("⚠️ Skipping Top Congested Streets plot: 'flow' column is not numeric.")
@@ -78,18 +57,11 @@ else:
 
 # 3.2 Top 10 Fastest Streets (Highest Average Speed)
 # Ensure 'speed' is numeric before grouping
-if pd.api.types.is_numeric_dtype(df['speed']):
+if pd.api.types.is_numeric_dtype(cube['speed_sum']):
     print("   Calculating Top 10 Fastest Streets by Speed...")
-    top_fastest = df.groupby('channel_name')['speed'].mean().sort_values(ascending=False).head(10)
-
-    plt.figure(figsize=(12, 7))
-    top_fastest.plot(kind='bar', color='mediumseagreen')
-    plt.title('Top 10 Fastest Streets (by Average Speed)')
-    plt.xlabel('Street Name')
-    plt.ylabel('Average Speed (km/h)')
-    plt.xticks(rotation=45, ha='right')
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
-    plt.tight_layout()
+    top_fastest = top_channels(cube, 'speed', 10, ascending=False)
+
+    figure_top_fastest(top_fastest)
     plt.show()
 else:
      print("⚠️ Skipping Top Fastest Streets plot: 'speed' column is not numeric.")
@@ -97,26 +69,33 @@ else:
 
 # 3.3 Top 10 Slowest Streets (Lowest Average Speed)
 # Ensure 'speed' is numeric before grouping
-if pd.api.types.is_numeric_dtype(df['speed']):
+if pd.api.types.is_numeric_dtype(cube['speed_sum']):
     print("   Calculating Top 10 Slowest Streets by Speed...")
     # Filter out potential zero speeds if they are not meaningful for "slowest"
     # df_speed_positive = df[df['speed'] > 0] # Optional: depends on if 0 speed is valid data
     # top_slowest = df_speed_positive.groupby('channel_name')['speed'].mean().sort_values(ascending=True).head(10)
-    top_slowest = df.groupby('channel_name')['speed'].mean().sort_values(ascending=True).head(10)
+    # (this variant needs the raw rows: trafic_data_access.load_cleaned(columns=['channel_name', 'speed']))
+    top_slowest = top_channels(cube, 'speed', 10, ascending=True)
 
-
-    plt.figure(figsize=(12, 7))
-    top_slowest.plot(kind='bar', color='lightcoral')
-    plt.title('Top 10 Slowest Streets (Potential Congestion Areas by Speed)')
-    plt.xlabel('Street Name')
-    plt.ylabel('Average Speed (km/h)')
-    plt.xticks(rotation=45, ha='right')
-    plt.grid(axis='y', linestyle='--', alpha=0.7)
-    plt.tight_layout()
+    figure_top_slowest(top_slowest)
     plt.show()
 else:
     print("⚠️ Skipping Top Slowest Streets plot: 'speed' column is not numeric.")
 
+
+# 3.4 Speed Percentiles per Street (median, p85, p95)
+# Means hide the congestion episodes: the percentiles are estimated with mergeable sketches
+# (trafic_sketches.py) in one streamed pass over the dataset partitions, with bounded memory.
+print("   Calculating speed percentiles per street (t-digest sketches, one pass)...")
+try:
+    speed_percentiles = channel_quantiles(cleaned_data_path, 'speed')
+    speed_percentiles.insert(0, 'channel_name', channel_names(load_channels(), speed_percentiles.index))
+    slowest_median = speed_percentiles.sort_values('p50').head(10)
+    print("\n🐢 Top 10 Slowest Streets by Median Speed (km/h, approximate percentiles):")
+    print(slowest_median[['channel_name', 'count', 'mean', 'p50', 'p85', 'p95']].to_string(float_format='{:.1f}'.format))
+except Exception as e:
+    print(f"⚠️ Skipping speed percentiles: {e}")
+
 # ============================
 # 4. End of Script
 # ============================
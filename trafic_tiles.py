@@ -0,0 +1,163 @@
+# ============================
+# trafic_tiles.py
+# ============================
+# Pre-rendered XYZ tile pyramid of the flow density, for the interactive map.
+#
+# Instead of embedding data points in the HTML file, the density (trafic_density.py) is rendered
+# once into 256x256 PNG tiles (<folder>/<z>/<x>/<y>.png, Web Mercator, same scheme as
+# OpenStreetMap). The Folium map only references them through a tile layer, and the browser
+# loads the tiles visible at the current zoom: the HTML stays a few KB whatever the history size.
+# Tiles over which the density stays below the first visible contour level are skipped before
+# being sampled and are not written (the map shows nothing where a tile is missing).
+
+import os
+import shutil
+import multiprocessing
+import numpy as np
+import matplotlib
+from PIL import Image  # matplotlib dependency; writes the PNGs without matplotlib's overhead
+
+from trafic_density import iso_proportion_levels
+
+tile_size = 256
+
+
+def lonlat_to_tile(lon, lat, zoom):
+    """Fractional XYZ tile coordinates of a point at the given zoom level."""
+    n = 2 ** zoom
+    x = (np.asarray(lon) + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2.0 * n
+    return x, y
+
+
+def tile_pixel_lonlat(tile_x, tile_y, zoom):
+    """Longitude/latitude of the centres of the pixels of one tile, as (tile_size, tile_size) arrays."""
+    n = 2 ** zoom
+    pixels = (np.arange(tile_size) + 0.5) / tile_size
+    lon = (tile_x + pixels) / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (tile_y + pixels) / n))))
+    return np.meshgrid(lon, lat)
+
+
+def sample_grid(x_grid, y_grid, values, x, y):
+    """Bilinear interpolation of a regular grid values[iy, ix] at the points (x, y); 0 outside."""
+    fx = (x - x_grid[0]) / (x_grid[1] - x_grid[0])
+    fy = (y - y_grid[0]) / (y_grid[1] - y_grid[0])
+    inside = (fx >= 0) & (fx <= len(x_grid) - 1) & (fy >= 0) & (fy <= len(y_grid) - 1)
+    ix = np.clip(fx.astype(int), 0, len(x_grid) - 2)
+    iy = np.clip(fy.astype(int), 0, len(y_grid) - 2)
+    tx, ty = np.clip(fx - ix, 0, 1), np.clip(fy - iy, 0, 1)
+    result = (values[iy, ix] * (1 - tx) * (1 - ty) + values[iy, ix + 1] * tx * (1 - ty)
+              + values[iy + 1, ix] * (1 - tx) * ty + values[iy + 1, ix + 1] * tx * ty)
+    return np.where(inside, result, 0.0)
+
+
+def band_palette(levels, cmap, opacity):
+    """
+    RGBA colour (uint8) of each contour band of the static heatmap (same levels and colormap);
+    the lowest band (almost no traffic) is transparent so the base map shows.
+    """
+    bands = np.arange(len(levels))
+    rgba = cmap(bands / max(len(levels) - 1, 1))
+    rgba[:, 3] = np.where(bands >= 1, opacity, 0.0)
+    return (rgba * 255).astype(np.uint8)
+
+
+def colorize(values, levels, palette):
+    """
+    Paletted image of density values (one palette entry per contour band, at most 256 levels),
+    or None if every pixel is transparent. A paletted PNG is a quarter of the RGBA pixels to
+    compress, and shows the same colours.
+    """
+    band = np.clip(np.searchsorted(levels, values, side='right') - 1, 0, len(levels) - 1).astype(np.uint8)
+    if not palette[band, 3].any():
+        return None
+    image = Image.fromarray(band)
+    image.putpalette(palette.tobytes(), rawmode='RGBA')
+    return image
+
+
+def visible_cells(density, level):
+    """Summed-area table of the grid nodes >= level: counts[iy, ix] = nodes in density[:iy, :ix]."""
+    counts = np.zeros((density.shape[0] + 1, density.shape[1] + 1), dtype='int64')
+    counts[1:, 1:] = np.cumsum(np.cumsum(density >= level, axis=0), axis=1)
+    return counts
+
+
+def tile_has_visible_cells(x_grid, y_grid, counts, tile_x, tile_y, zoom):
+    """
+    Whether a node >= level lies among the grid nodes around the tile: pixels interpolate their
+    four surrounding nodes (sample_grid), so a tile without any is entirely transparent.
+    """
+    n = 2 ** zoom
+    lon = np.array([tile_x, tile_x + 1]) / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.array([tile_y + 1, tile_y]) / n))))
+    fx = (lon - x_grid[0]) / (x_grid[1] - x_grid[0])
+    fy = (lat - y_grid[0]) / (y_grid[1] - y_grid[0])
+    x_first, x_last = max(int(np.floor(fx[0])), 0), min(int(np.ceil(fx[1])), len(x_grid) - 1)
+    y_first, y_last = max(int(np.floor(fy[0])), 0), min(int(np.ceil(fy[1])), len(y_grid) - 1)
+    if x_first > x_last or y_first > y_last:
+        return False
+    return (counts[y_last + 1, x_last + 1] - counts[y_first, x_last + 1]
+            - counts[y_last + 1, x_first] + counts[y_first, x_first]) > 0
+
+
+# Grid and colours of the pyramid being rendered (set before the workers are forked, so they
+# inherit it instead of receiving a copy of the grid with every task)
+_render_state = {}
+
+
+def render_tile_column(zoom, tile_x, tile_y_range):
+    """Renders the tiles (zoom, tile_x, y) of a range of y; returns how many were not transparent."""
+    state = _render_state
+    count = 0
+    for tile_y in tile_y_range:
+        if not tile_has_visible_cells(state['x_grid'], state['y_grid'], state['visible'], tile_x, tile_y, zoom):
+            continue
+        lon, lat = tile_pixel_lonlat(tile_x, tile_y, zoom)
+        values = sample_grid(state['x_grid'], state['y_grid'], state['density'], lon, lat)
+        image = colorize(values, state['levels'], state['palette'])
+        if image is None:
+            continue
+        tile_path = os.path.join(state['folder'], str(zoom), str(tile_x), f"{tile_y}.png")
+        os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+        image.save(tile_path)
+        count += 1
+    return count
+
+
+def render_tile_pyramid(x_grid, y_grid, density, folder, zoom_levels, levels=50, cmap="Reds", opacity=0.7,
+                        workers=1):
+    """
+    Renders a density grid (from trafic_density.density_grid, lon/lat axes) into XYZ tiles for
+    every zoom level, covering the grid extent; transparent tiles are skipped. The folder is
+    recreated. With workers > 1, the columns of tiles are rendered in a process pool (where
+    processes can be forked). Returns the number of tiles written per zoom level.
+    """
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+    contour_levels = iso_proportion_levels(density, levels)
+    # colorize() leaves the values below the second level transparent
+    visible = visible_cells(density, contour_levels[min(1, len(contour_levels) - 1)])
+    _render_state.update(x_grid=x_grid, y_grid=y_grid, density=density, levels=contour_levels, visible=visible,
+                         palette=band_palette(contour_levels, matplotlib.colormaps[cmap], opacity), folder=folder)
+    columns = []
+    for zoom in zoom_levels:
+        # Tiles covering the grid (y grows southwards in the XYZ scheme)
+        x_min, y_max = lonlat_to_tile(x_grid[0], y_grid[0], zoom)
+        x_max, y_min = lonlat_to_tile(x_grid[-1], y_grid[-1], zoom)
+        columns += [(zoom, tile_x, range(int(y_min), int(y_max) + 1)) for tile_x in range(int(x_min), int(x_max) + 1)]
+    # Forked workers inherit _render_state; spawned ones would not (and would re-run the calling script)
+    workers = min(workers, len(columns)) if 'fork' in multiprocessing.get_all_start_methods() else 1
+    try:
+        if workers > 1:
+            with multiprocessing.get_context('fork').Pool(processes=workers) as pool:
+                counts = pool.starmap(render_tile_column, columns)
+        else:
+            counts = [render_tile_column(*column) for column in columns]
+    finally:
+        _render_state.clear()
+    written = {zoom: 0 for zoom in zoom_levels}
+    for (zoom, _, _), count in zip(columns, counts):
+        written[zoom] += count
+    return written
@@ -1,22 +1,41 @@
 # ============================
 # view_parquet_metrics.py
 # ============================
+# By default the metrics come from the Parquet footers only (row counts, per-column null counts,
+# min/max and sizes from the row-group statistics): no data page is decoded, so it is instant
+# whatever the size of the dataset.
+#
+# Usage:
+#   python view_parquet_metrics.py            # footer metadata only
+#   python view_parquet_metrics.py --exact    # + exact distinct counts and quantiles, streamed per row group
+#   python view_parquet_metrics.py --approx   # + approximate distinct counts, mean/std and percentiles
+#                                             #   (mergeable sketches, bounded memory, see trafic_sketches.py)
+#   python view_parquet_metrics.py --full     # loads each file with pandas (head/tail, info, describe)
 
+import argparse
 import pandas as pd
 import os
 import numpy as np
 import time
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
-# --- Configuration: Set the paths to your Parquet files ---
-coordinate_mapping_path = r"C:\Users\ASUS\Documents\Stage LS2N\nantes_traffic_archiver\dist\channel_coordinates.parquet"
-cleaned_data_path = r"C:\Users\ASUS\Documents\Stage LS2N\nantes_traffic_archiver\dist\cleaned_traffic_data.parquet"
+from trafic_sketches import dataset_files, sketch_files
+
+# --- Configuration: paths to the Parquet files (see trafic_data_access.py / TRAFIC_RESULTS_DIR) ---
+from trafic_data_access import coordinate_mapping_path, channels_path, cleaned_data_path
 
 # List of files to analyze
 files_to_analyze = [
     ("Coordinate Mapping Data", coordinate_mapping_path),
+    ("Channel Dimension", channels_path),
     ("Cleaned Traffic Data", cleaned_data_path)
 ]
 
+# Rows decoded at a time by --exact (whole row groups are streamed; bounds its memory)
+exact_batch_rows = 1_000_000
+
 # --- Helper Function ---
 def format_bytes(size_bytes):
     """Converts bytes to a human-readable format (KB, MB, GB)."""
@@ -28,9 +47,132 @@ def format_bytes(size_bytes):
     s = round(size_bytes / p, 2)
     return f"{s} {size_name[i]}"
 
+def statistic_value(value, field):
+    """Row-group statistic as a display value (timestamps in the column's time zone, no -0.0)."""
+    if isinstance(value, pd.Timestamp) and pa.types.is_timestamp(field.type) and field.type.tz:
+        return value.tz_convert(field.type.tz)
+    if isinstance(value, float):
+        return value + 0.0
+    return value
+
+# --- Footer Metadata (no data page decoded) ---
+def footer_metrics(files):
+    """
+    Metrics read from the Parquet footers only: total rows and row groups, and per column the
+    null count and min/max merged from the row-group statistics, and the compressed/uncompressed
+    size. A metric is None when a row group has no statistics for it.
+    Returns (rows, row_groups, DataFrame indexed by column).
+    """
+    rows = row_groups = 0
+    columns = {}
+    for file in files:
+        metadata = pq.read_metadata(file)
+        schema = metadata.schema.to_arrow_schema()
+        rows += metadata.num_rows
+        row_groups += metadata.num_row_groups
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            for j in range(row_group.num_columns):
+                chunk = row_group.column(j)
+                name = chunk.path_in_schema
+                field = schema.field(name)
+                metrics = columns.setdefault(name, {'Type': str(field.type), 'Nulls': 0, 'Min': None, 'Max': None,
+                                                    'Compressed': 0, 'Uncompressed': 0, '_min_max': True})
+                metrics['Compressed'] += chunk.total_compressed_size
+                metrics['Uncompressed'] += chunk.total_uncompressed_size
+                stats = chunk.statistics
+                if stats is None or not stats.has_null_count:
+                    metrics['Nulls'] = None
+                elif metrics['Nulls'] is not None:
+                    metrics['Nulls'] += stats.null_count
+                if stats is not None and stats.has_min_max:
+                    low, high = statistic_value(stats.min, field), statistic_value(stats.max, field)
+                    metrics['Min'] = low if metrics['Min'] is None else min(metrics['Min'], low)
+                    metrics['Max'] = high if metrics['Max'] is None else max(metrics['Max'], high)
+                elif stats is None or stats.null_count != chunk.num_values:
+                    metrics['_min_max'] = False  # values without min/max: the merged range is unknown
+    for metrics in columns.values():
+        if not metrics.pop('_min_max'):
+            metrics['Min'] = metrics['Max'] = None
+    return rows, row_groups, pd.DataFrame.from_dict(columns, orient='index')
+
+def exact_metrics(files, quantiles=(0.25, 0.5, 0.75)):
+    """
+    Exact distinct counts, and quantiles of the numeric columns (linear interpolation, as
+    pandas), streamed over the row groups (exact_batch_rows rows at a time): each column only
+    keeps the count of each of its distinct values (pc.value_counts, merged after every batch),
+    not the values themselves. Returns a DataFrame indexed by column.
+    """
+    value_counts = {}
+
+    def count_values(batches):
+        table = pa.Table.from_batches(batches).combine_chunks()
+        for name in table.column_names:
+            counts = pc.value_counts(pc.drop_null(table[name]))
+            values = counts.field('values')
+            if pa.types.is_dictionary(values.type):
+                values = values.cast(values.type.value_type)
+            counts = pa.table({'values': values, 'counts': counts.field('counts')})
+            if name in value_counts:
+                counts = pa.concat_tables([value_counts[name], counts])
+            # Also merges the dictionary values that were split between chunks
+            value_counts[name] = (counts.group_by('values').aggregate([('counts', 'sum')])
+                                  .rename_columns(['values', 'counts']))
+
+    for file in files:
+        # iter_batches stops at every row group: small row groups are gathered up to exact_batch_rows
+        pending, pending_rows = [], 0
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=exact_batch_rows):
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= exact_batch_rows:
+                count_values(pending)
+                pending, pending_rows = [], 0
+        if pending:
+            count_values(pending)
+    results = {}
+    for name, counts in value_counts.items():
+        metrics = {'Distinct': counts.num_rows}
+        value_type = counts['values'].type
+        if (pa.types.is_integer(value_type) or pa.types.is_floating(value_type)) and counts.num_rows:
+            counts = counts.sort_by('values')
+            values = counts['values'].to_numpy()
+            ranks = np.cumsum(counts['counts'].to_numpy())  # rank (0-based) of the last copy of each value, + 1
+            for q in quantiles:
+                position = q * (ranks[-1] - 1)
+                low, high = (values[np.searchsorted(ranks, rank, side='right')]
+                             for rank in (np.floor(position), np.ceil(position)))
+                metrics[f"{q:.0%}"] = float(low) + (float(high) - float(low)) * (position - np.floor(position))
+        results[name] = metrics
+    return pd.DataFrame.from_dict(results, orient='index')
+
+def print_footer_metrics(files, exact=False, approx=False):
+    """Prints the footer metrics of the files, and the exact or approximate ones if asked for."""
+    rows, row_groups, metrics = footer_metrics(files)
+    print(f"\n📊 Shape (Rows, Columns): ({rows}, {len(metrics)}) | {len(files)} file(s), {row_groups} row group(s)")
+    if metrics.empty:
+        return
+    metrics.insert(2, 'Null %', metrics['Nulls'].astype(float) / rows * 100 if rows else np.nan)
+    print("\nℹ️ Columns (from the row-group statistics, no data read):")
+    print(metrics.to_string(formatters={'Null %': '{:.2f}%'.format, 'Compressed': format_bytes,
+                                        'Uncompressed': format_bytes}))
+    print(f"   Total: {format_bytes(int(metrics['Compressed'].sum()))} compressed, "
+          f"{format_bytes(int(metrics['Uncompressed'].sum()))} uncompressed.")
+    if exact:
+        print("\n🔑 Exact Distinct Counts and Quantiles (streamed over the row groups):")
+        print(exact_metrics(files).to_string(float_format='{:,.2f}'.format, na_rep=''))
+    if approx:
+        print("\n🔑 Approximate Statistics (HyperLogLog distinct counts, t-digest percentiles, one streamed pass):")
+        summary = sketch_files(files).column_summary().drop(columns=['Type'])
+        print(summary.to_string(float_format='{:,.2f}'.format, na_rep=''))
+
 # --- Main Analysis Function ---
-def analyze_parquet(file_description, file_path):
-    """Loads a Parquet file and prints relevant metrics."""
+def analyze_parquet(file_description, file_path, exact=False, approx=False, full=False):
+    """
+    Prints the metrics of a Parquet file or dataset folder: from the footers (see footer_metrics),
+    plus the exact distinct counts/quantiles if exact, their sketched estimates if approx, or by
+    loading it with pandas if full.
+    """
     print(f"\n{'='*15} Analyzing: {file_description} {'='*15}")
     print(f"File Path: {file_path}")
     start_time = time.time()
@@ -41,12 +183,22 @@ def analyze_parquet(file_description, file_path):
         print("-" * 50)
         return
 
+    files = dataset_files(file_path)
     try:
-        file_size = os.path.getsize(file_path)
+        file_size = sum(os.path.getsize(file) for file in files)
         print(f"📊 File Size: {format_bytes(file_size)} ({file_size} bytes)")
     except Exception as e:
         print(f"⚠️ Warning: Could not get file size - {e}")
 
+    if not full:
+        try:
+            print_footer_metrics(files, exact, approx)
+        except Exception as e:
+            print(f"❌ ERROR: Could not read Parquet metadata: {e}")
+        print(f"\n⏱️ Total time for analyzing {file_description}: {time.time() - start_time:.2f} seconds")
+        print("-" * 50)
+        return
+
     # 2. Load Data with Pandas
     try:
         print("⏳ Loading data...")
@@ -112,7 +264,7 @@ def analyze_parquet(file_description, file_path):
 
     # 9. Unique Value Counts for Key Columns (Example)
     print("\n🔑 Unique Value Counts (Examples):")
-    key_cols = ['channel_name', 'traffic_state', 'day_of_week', 'hour']
+    key_cols = ['channel_key', 'channel_name', 'traffic_state', 'day_of_week', 'hour']
     for col in key_cols:
         if col in df.columns:
             nunique = df[col].nunique()
@@ -128,8 +280,20 @@ def analyze_parquet(file_description, file_path):
     print("-" * 50)
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Prints the metrics of the Parquet outputs (from the footers by default).")
+    parser.add_argument('--exact', action='store_true',
+                        help="Also compute exact distinct counts and quantiles, streamed one row group at a time.")
+    parser.add_argument('--approx', action='store_true',
+                        help="Also estimate distinct counts, mean/std and percentiles with mergeable sketches (bounded memory).")
+    parser.add_argument('--full', action='store_true',
+                        help="Load each file with pandas (head/tail, info, describe): slow and memory-hungry on large datasets.")
+    return parser.parse_args()
+
+
 # --- Run the Analysis ---
 if __name__ == "__main__":
+    args = parse_args()
     print("Starting Parquet File Analysis...")
     # Ensure pyarrow is available for Pandas
     try:
@@ -142,6 +306,6 @@ if __name__ == "__main__":
 
 
     for description, path in files_to_analyze:
-        analyze_parquet(description, path)
+        analyze_parquet(description, path, exact=args.exact, approx=args.approx, full=args.full)
 
     print("\nAnalysis finished.")
\ No newline at end of file